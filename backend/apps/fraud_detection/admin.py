@@ -1,27 +1,31 @@
 from django.contrib import admin
+from django.db.models import Prefetch
 from apps.transactions.models import Transactions as Transaction
-from apps.notifications.models import Notification as Alert
-
-
-from apps.fraud_detection.models import Alert  
+from apps.fraud_detection.models import Alert
+from backend.large_tables import BoundedRelatedFieldListFilter, LargeTableAdminMixin
 
 @admin.register(Alert)
-class AlertAdmin(admin.ModelAdmin):
+class AlertAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['id', 'transaction', 'rule', 'created_at', 'status']
-    list_filter = ['status', 'created_at', 'rule']
+    list_filter = ['status', 'created_at', ('rule', BoundedRelatedFieldListFilter)]
+    list_select_related = ['transaction', 'rule']
     readonly_fields = ['created_at']
+    raw_id_fields = ['transaction']
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'value', 'created_at', 'fraud_flag']
+class TransactionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['id', 'user', 'value', 'created_at', 'fraud_flag', 'triggered_rules']
     list_filter = ['fraud_flag', 'created_at']
-    search_fields = ['user__username']
+    list_select_related = ['user']
+    # Exact match uses the username index; a substring search would scan every user
+    search_fields = ['=user__username']
     readonly_fields = ['created_at']
-    date_hierarchy = 'created_at'
+    raw_id_fields = ['user']
+
+    def get_queryset(self, request):
+        alerts = Alert.objects.select_related('rule').only('transaction_id', 'rule__name')
+        return super().get_queryset(request).prefetch_related(Prefetch('alert_set', queryset=alerts))
 
     def triggered_rules(self, obj):
-        alerts = Alert.objects.filter(transaction=obj)
-        return ", ".join([alert.rule.name for alert in alerts])
+        return ", ".join([alert.rule.name for alert in obj.alert_set.all()])
     triggered_rules.short_description = 'Triggered Rules'
-
-
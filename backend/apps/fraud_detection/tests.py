@@ -1,5 +1,119 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.exceptions import BadRequest
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock
+from apps.rules.models import Rule
+from apps.transactions.models import Transactions
+from backend.large_tables import EstimatedCountPaginator
+from .models import Alert
+from .views import TransactionListView
 
 class FraudDetectionTest(TestCase):
     def test_rule_engine_basic(self):
         self.assertEqual(1, 1)
+
+class LargeTableAdminTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('ops', password='x')
+        self.rules = [
+            Rule.objects.create(name=f"Rule {index}", type="threshold", condition={}, active=True)
+            for index in range(3)
+        ]
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def add_transactions(self, count):
+        for _ in range(count):
+            transaction = Transactions.objects.create(user=self.user, value=100)
+            for rule in self.rules:
+                Alert.objects.create(transaction=transaction, rule=rule)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/transactions/transactions/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Тест: число запросов списка транзакций не зависит от числа строк"""
+        self.add_transactions(2)
+        few = self.changelist_queries()
+        self.add_transactions(8)
+        self.assertEqual(self.changelist_queries(), few)
+
+        response = self.client.get('/admin/rules/alert/', {'rule__id__exact': self.rules[0].id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_paginator_uses_estimate_for_large_tables(self):
+        """Тест: для большой таблицы используется оценка планировщика"""
+        self.add_transactions(1)
+        with mock.patch('backend.large_tables.estimated_row_count', return_value=5_000_000):
+            paginator = EstimatedCountPaginator(Transactions.objects.order_by('-created_at'), 50)
+            self.assertEqual(paginator.count, 5_000_000)
+        self.assertEqual(EstimatedCountPaginator(Transactions.objects.order_by('-created_at'), 50).count, 1)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_filtered_count_is_bounded(self):
+        """Тест: количество для отфильтрованного списка ограничено лимитом"""
+        self.add_transactions(2)
+        paginator = EstimatedCountPaginator(Alert.objects.filter(status='new').order_by('-id'), 50)
+        self.assertEqual(paginator.count, 4)
+        paginator = EstimatedCountPaginator(Alert.objects.filter(rule=self.rules[0]).order_by('-id'), 50)
+        self.assertEqual(paginator.count, 2)
+
+class TransactionBrowserTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('analyst', password='x')
+        now = timezone.now()
+        # Pairs of transactions share a timestamp: the id breaks the tie
+        for index in range(45):
+            Transactions.objects.create(
+                user=self.user,
+                value=index,
+                created_at=now - timedelta(minutes=index // 2),
+                fraud_flag=index % 3 == 0
+            )
+
+    def page(self, **params):
+        request = RequestFactory().get('/fraud/transactions/', params)
+        request.user = self.user
+        view = TransactionListView()
+        view.setup(request)
+        view.object_list = view.get_queryset()
+        return view.get_context_data()
+
+    def test_keyset_pages_cover_every_row_once(self):
+        """Тест: страницы по курсору проходят все транзакции по порядку без повторов"""
+        seen, cursor, queries = [], None, []
+        while True:
+            with CaptureQueriesContext(connection) as captured:
+                context = self.page(**({'cursor': cursor} if cursor else {}))
+            queries.append(len(captured))
+            seen += [transaction.id for transaction in context['transactions']]
+            cursor = context['next_cursor']
+            if not context['has_next']:
+                break
+
+        expected = list(Transactions.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(queries), 3)
+        # Список и сводка: два запроса на любой странице
+        self.assertEqual(set(queries), {2})
+
+    def test_summary_and_fraud_filter(self):
+        """Тест сводки по условной агрегации и фильтра fraud"""
+        context = self.page()
+        self.assertEqual((context['total_count'], context['fraud_count'], context['normal_count']), (45, 15, 30))
+
+        context = self.page(fraud='1')
+        self.assertTrue(all(transaction.fraud_flag for transaction in context['transactions']))
+        self.assertEqual((context['total_count'], context['fraud_count']), (15, 15))
+
+    def test_invalid_cursor(self):
+        """Тест: некорректный курсор отклоняется"""
+        with self.assertRaises(BadRequest):
+            self.page(cursor='not-a-cursor')
@@ -3,9 +3,13 @@ from django.shortcuts import render
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Count
+from django.core.exceptions import BadRequest
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_datetime
 
+import base64
 import csv
+import json
 
 from apps.rules.models import Rule
 from apps.transactions.models import Transactions as Transaction
@@ -52,26 +56,79 @@ class RuleDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user.groups.filter(name='Admin').exists()
 
 
+def transaction_summary(queryset):
+    """Всего / мошеннических / обычных транзакций одним запросом с условной агрегацией"""
+    counts = queryset.aggregate(total=Count('id'), fraud=Count('id', filter=Q(fraud_flag=True)))
+    total, fraud = counts['total'], counts['fraud']
+    return {
+        'total_count': total,
+        'fraud_count': fraud,
+        'normal_count': total - fraud,
+        'fraud_percentage': (fraud / total * 100) if total > 0 else 0,
+    }
+
+
+def encode_cursor(transaction):
+    """Курсор следующей страницы: (created_at, id) последней показанной транзакции"""
+    raw = json.dumps([transaction.created_at.isoformat(), transaction.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, transaction_id = json.loads(raw)
+        created_at = parse_datetime(created_at)
+        if created_at is None or not isinstance(transaction_id, int):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise BadRequest('Invalid cursor')
+    return created_at, transaction_id
+
+
 class TransactionListView(LoginRequiredMixin, ListView):
+    """
+    Список транзакций с keyset-пагинацией по (created_at, id): страница
+    начинается после курсора (?cursor=), а не со смещения, поэтому глубокие
+    страницы читаются по индексу так же быстро, как первая
+    """
     model = Transaction
     template_name = 'transactions/transaction_list.html'
     context_object_name = 'transactions'
-    paginate_by = 20
+    page_size = 20
 
-    def get_queryset(self):
+    def get_base_queryset(self):
         queryset = Transaction.objects.all()
         fraud_filter = self.request.GET.get('fraud')
 
         if fraud_filter in ['0', '1']:
-            queryset = queryset.filter(is_fraud=bool(int(fraud_filter)))
+            queryset = queryset.filter(fraud_flag=bool(int(fraud_filter)))
+
+        return queryset
+
+    def get_queryset(self):
+        queryset = self.get_base_queryset().select_related('user')
+        cursor = self.request.GET.get('cursor')
 
-        return queryset.order_by('-timestamp')
+        if cursor:
+            created_at, transaction_id = decode_cursor(cursor)
+            # created_at <= X ограничивает диапазон индекса, id разбирает совпадения
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(id__lt=transaction_id),
+                created_at__lte=created_at,
+            )
+
+        return queryset.order_by('-created_at', '-id')[:self.page_size + 1]
 
     def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['total_count'] = self.get_queryset().count()
-        context['fraud_count'] = self.get_queryset().filter(is_fraud=True).count()
-        context['normal_count'] = self.get_queryset().filter(is_fraud=False).count()
+        transactions = list(self.object_list)
+        has_next = len(transactions) > self.page_size
+        transactions = transactions[:self.page_size]
+
+        context = super().get_context_data(object_list=transactions, **kwargs)
+        context['has_next'] = has_next
+        context['next_cursor'] = encode_cursor(transactions[-1]) if has_next else None
+        context.update(transaction_summary(self.get_base_queryset()))
         return context
 
 
@@ -103,22 +160,13 @@ def statistics_view(request):
     if not request.user.is_authenticated:
         return HttpResponse('Unauthorized', status=401)
 
-    fraud_count = Transaction.objects.filter(is_fraud=True).count()
-    normal_count = Transaction.objects.filter(is_fraud=False).count()
-    total_count = Transaction.objects.count()
-
     # Статистика по сработавшим правилам
     rule_stats = Alert.objects.values('rule__name').annotate(
         count=Count('id')
     ).order_by('-count')
 
-    context = {
-        'fraud_count': fraud_count,
-        'normal_count': normal_count,
-        'total_count': total_count,
-        'fraud_percentage': (fraud_count / total_count * 100) if total_count > 0 else 0,
-        'rule_stats': rule_stats,
-    }
+    context = transaction_summary(Transaction.objects.all())
+    context['rule_stats'] = rule_stats
 
     return render(request, 'statistics/statistics.html', context)
 class AnalystRequiredMixin(UserPassesTestMixin):
@@ -140,15 +188,13 @@ class StatisticsAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        fraud_count = Transaction.objects.filter(is_fraud=True).count()
-        normal_count = Transaction.objects.filter(is_fraud=False).count()
-        total_count = Transaction.objects.count()
+        summary = transaction_summary(Transaction.objects.all())
 
         data = {
-            'fraud': fraud_count,
-            'normal': normal_count,
-            'total': total_count,
-            'fraud_percentage': (fraud_count / total_count * 100) if total_count > 0 else 0
+            'fraud': summary['fraud_count'],
+            'normal': summary['normal_count'],
+            'total': summary['total_count'],
+            'fraud_percentage': summary['fraud_percentage']
         }
 
         serializer = StatisticsSerializer(data)
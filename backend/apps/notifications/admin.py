@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import Notification
 
-# Register your models here.
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['recipient', 'channel', 'rule', 'alert_count', 'status', 'attempts', 'created_at']
+    list_filter = ['status', 'channel']
+    search_fields = ['recipient']
+    readonly_fields = ['created_at']
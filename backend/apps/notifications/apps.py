@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class NotificationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.notifications'
+
+    def ready(self):
+        """Feed created alerts into the notification dispatcher"""
+        from django.db.models.signals import post_save
+        from apps.rules.models import Alert
+        from .dispatcher import notify_alert
+        post_save.connect(notify_alert, sender=Alert, dispatch_uid='notifications.notify_alert')
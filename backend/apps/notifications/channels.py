@@ -0,0 +1,84 @@
+"""
+Notification delivery channels.
+
+A channel sends one digest to one recipient and raises on failure; retries
+and rate limiting are handled by the dispatcher. `log` and `memory` are local
+stand-ins for development and tests.
+"""
+import json
+import logging
+import urllib.request
+
+from django.core.mail import send_mail
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class BaseChannel:
+    name = None
+
+    def send(self, route, digest):
+        raise NotImplementedError
+
+
+class WebhookChannel(BaseChannel):
+    """POST the digest as JSON to route['url']"""
+    name = 'webhook'
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+
+    def send(self, route, digest):
+        body = json.dumps(digest, cls=DjangoJSONEncoder).encode('utf-8')
+        request = urllib.request.Request(
+            route['url'], data=body, method='POST',
+            headers={'Content-Type': 'application/json'},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"Webhook returned HTTP {response.status}")
+
+
+class EmailChannel(BaseChannel):
+    """Send the digest as a plain-text email to route['email']"""
+    name = 'email'
+
+    def send(self, route, digest):
+        subject = f"[fraud] {digest['alert_count']} alerts for rule {digest['rule_name']}"
+        lines = [
+            f"Rule: {digest['rule_name']} (id {digest['rule_id']})",
+            f"Window: {digest['window_start']} - {digest['window_end']}",
+            f"Alerts: {digest['alert_count']}",
+            f"By severity: {digest['severities']}",
+            '',
+            'Sample transactions:',
+        ]
+        lines.extend(f"  {alert['transaction_id']} ({alert['severity']})" for alert in digest['sample'])
+        send_mail(subject, '\n'.join(lines), None, [route['email']])
+
+
+class LogChannel(BaseChannel):
+    """Local stand-in: writes the digest to the application log"""
+    name = 'log'
+
+    def send(self, route, digest):
+        logger.info(f"Notification for {route['recipient']}: {digest['alert_count']} alerts "
+                    f"for rule {digest['rule_name']} in {digest['window_start']} - {digest['window_end']}")
+
+
+class MemoryChannel(BaseChannel):
+    """Local stand-in: keeps delivered digests in memory"""
+    name = 'memory'
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, route, digest):
+        self.sent.append((route['recipient'], digest))
+
+
+CHANNELS = {
+    channel.name: channel
+    for channel in (WebhookChannel, EmailChannel, LogChannel, MemoryChannel)
+}
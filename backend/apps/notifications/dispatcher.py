@@ -0,0 +1,281 @@
+"""
+Alert notification pipeline.
+
+Created alerts are handed to the dispatcher without blocking the evaluate
+path (a bounded queue; overflow is counted and dropped). A collector thread
+coalesces them per recipient/rule/time window into digests, and a bounded
+worker pool delivers digests through the configured channels with retries
+and per-channel rate limits. A misfiring rule therefore produces one digest
+per recipient per window instead of one send per alert.
+
+Alerts are submitted once their transaction commits, so a rolled-back alert
+is never notified. Queued alerts and open digests are delivered when the
+process exits (stop() is registered with atexit).
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from apps.rules.models import Alert
+from .channels import CHANNELS
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {value: rank for rank, (value, _) in enumerate(Alert.SEVERITY_CHOICES)}
+
+DIGEST_SAMPLE_SIZE = 10
+
+# Max events the collector drains in one go before checking windows
+COLLECT_BATCH = 1000
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Digest:
+    """Alerts for one recipient and rule within one window"""
+
+    def __init__(self, route, event, opened_at):
+        self.route = route
+        self.rule_id = event['rule_id']
+        self.rule_name = event['rule_name']
+        self.opened_at = opened_at
+        self.window_start = event['created_at']
+        self.window_end = event['created_at']
+        self.alert_count = 0
+        self.severities = {}
+        self.sample = []
+
+    def add(self, event):
+        self.alert_count += 1
+        self.window_end = max(self.window_end, event['created_at'])
+        self.severities[event['severity']] = self.severities.get(event['severity'], 0) + 1
+        if len(self.sample) < DIGEST_SAMPLE_SIZE:
+            self.sample.append({
+                'alert_id': event['id'],
+                'transaction_id': event['transaction_id'],
+                'severity': event['severity'],
+            })
+
+    def as_payload(self):
+        return {
+            'recipient': self.route['recipient'],
+            'rule_id': self.rule_id,
+            'rule_name': self.rule_name,
+            'alert_count': self.alert_count,
+            'severities': self.severities,
+            'window_start': self.window_start.isoformat(),
+            'window_end': self.window_end.isoformat(),
+            'sample': self.sample,
+        }
+
+
+class NotificationDispatcher:
+    def __init__(self, routes, window_seconds=60, queue_size=10000, workers=4,
+                 max_retries=3, retry_backoff=1.0, rate_limits=None, channels=None):
+        self.routes = routes
+        self.window_seconds = window_seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.channels = channels or {name: channel() for name, channel in CHANNELS.items()}
+        self.buckets = {name: TokenBucket(rate) for name, rate in (rate_limits or {}).items()}
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._digests = {}
+        self._workers = workers
+        self._executor = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    # Producer side (evaluate path)
+
+    def submit(self, alert):
+        """Enqueue a created alert; never blocks"""
+        event = {
+            'id': alert.id,
+            'rule_id': alert.rule_id,
+            'rule_name': alert.rule.name,
+            'transaction_id': alert.transaction_id,
+            'severity': alert.severity,
+            'created_at': alert.created_at,
+        }
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self._ensure_started()
+        return True
+
+    # Collector side
+
+    def collect(self, event, now=None):
+        """Add an alert event to the digests of every route that wants it"""
+        now = time.monotonic() if now is None else now
+        rank = SEVERITY_RANK.get(event['severity'], 0)
+        for route in self.routes:
+            if rank < SEVERITY_RANK.get(route.get('min_severity', 'low'), 0):
+                continue
+            rule_ids = route.get('rule_ids')
+            if rule_ids and event['rule_id'] not in rule_ids:
+                continue
+            key = (route['recipient'], event['rule_id'])
+            digest = self._digests.get(key)
+            if digest is None:
+                digest = self._digests[key] = Digest(route, event, now)
+            digest.add(event)
+
+    def due_digests(self, now=None, force=False):
+        """Remove and return digests whose window has closed"""
+        now = time.monotonic() if now is None else now
+        due = [key for key, digest in self._digests.items()
+               if force or now - digest.opened_at >= self.window_seconds]
+        return [self._digests.pop(key) for key in due]
+
+    def deliver(self, digest):
+        """Send a digest with retries; records the outcome as a Notification"""
+        route = digest.route
+        channel = self.channels[route['channel']]
+        bucket = self.buckets.get(route['channel'])
+        payload = digest.as_payload()
+        error = ''
+
+        for attempt in range(1, self.max_retries + 2):
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                channel.send(route, payload)
+                self._record(digest, payload, 'delivered', attempt)
+                return True
+            except Exception as e:
+                error = str(e)
+                logger.warning(f"Notification to {route['recipient']} failed (attempt {attempt}): {e}")
+                if attempt <= self.max_retries:
+                    time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+        self._record(digest, payload, 'failed', self.max_retries + 1, error)
+        return False
+
+    def _record(self, digest, payload, status, attempts, error=''):
+        try:
+            Notification.objects.create(
+                recipient=digest.route['recipient'],
+                channel=digest.route['channel'],
+                rule_id=digest.rule_id,
+                alert_count=digest.alert_count,
+                payload=payload,
+                status=status,
+                attempts=attempts,
+                error=error,
+                window_start=digest.window_start,
+                window_end=digest.window_end,
+            )
+        except Exception as e:
+            logger.error(f"Failed to record notification for {digest.route['recipient']}: {e}")
+
+    # Background machinery
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='notify')
+                self._thread = threading.Thread(target=self._run, name='notification-collector', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self, timeout=5):
+        """Stop the collector and deliver queued alerts and open digests in the calling thread"""
+        if self._thread is None or self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        # The executor refuses new work at interpreter exit; let it finish what it has
+        self._executor.shutdown(wait=True)
+        try:
+            while True:
+                self.collect(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        for digest in self.due_digests(force=True):
+            self.deliver(digest)
+
+    def _deliver_in_worker(self, digest):
+        close_old_connections()
+        try:
+            self.deliver(digest)
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        tick = min(1.0, self.window_seconds)
+        while not self._stopping.is_set():
+            try:
+                self.collect(self._queue.get(timeout=tick))
+                # Drain what is already queued before checking windows
+                for _ in range(COLLECT_BATCH):
+                    self.collect(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logger.error(f"Notification collector error: {e}")
+
+            for digest in self.due_digests():
+                self._executor.submit(self._deliver_in_worker, digest)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher(
+                    routes=settings.NOTIFICATION_ROUTES,
+                    window_seconds=settings.NOTIFICATION_WINDOW_SECONDS,
+                    queue_size=settings.NOTIFICATION_QUEUE_SIZE,
+                    workers=settings.NOTIFICATION_WORKERS,
+                    max_retries=settings.NOTIFICATION_MAX_RETRIES,
+                    retry_backoff=settings.NOTIFICATION_RETRY_BACKOFF_SECONDS,
+                    rate_limits=settings.NOTIFICATION_RATE_LIMITS,
+                )
+    return _dispatcher
+
+
+def notify_alert(sender, instance, created, **kwargs):
+    """post_save receiver for rules.Alert; the alert is submitted once its transaction commits"""
+    if created and settings.NOTIFICATION_ROUTES:
+        transaction.on_commit(lambda: get_dispatcher().submit(instance), using=kwargs.get('using'))
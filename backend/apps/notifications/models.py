@@ -1,5 +1,29 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 
 # Create your models here.
 class Notification(models.Model):
-    ...
+    """Delivered (or failed) alert digest for one recipient/rule/time window"""
+    STATUS_CHOICES = [
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+    ]
+    
+    recipient = models.CharField(max_length=100)
+    channel = models.CharField(max_length=20)
+    rule = models.ForeignKey('rules.Rule', on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications')
+    alert_count = models.PositiveIntegerField(default=0)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'notifications'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Notification to {self.recipient} via {self.channel} ({self.alert_count} alerts)"
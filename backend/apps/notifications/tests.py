@@ -1,3 +1,104 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.rules.models import Alert, Rule
+from .channels import MemoryChannel
+from .dispatcher import NotificationDispatcher
+from .models import Notification
+
+
+class FlakyChannel(MemoryChannel):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send(self, route, digest):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('temporary failure')
+        super().send(route, digest)
+
+
+class NotificationDispatcherTestCase(TestCase):
+    def setUp(self):
+        self.rule = Rule.objects.create(
+            name="Noisy Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1},
+            active=True
+        )
+        self.channel = MemoryChannel()
+        self.dispatcher = NotificationDispatcher(
+            routes=[
+                {'recipient': 'ops', 'channel': 'memory'},
+                {'recipient': 'oncall', 'channel': 'memory', 'min_severity': 'high'},
+            ],
+            window_seconds=60,
+            retry_backoff=0,
+            channels={'memory': self.channel},
+        )
+
+    def _event(self, index, severity='low'):
+        return {
+            'id': index,
+            'rule_id': self.rule.id,
+            'rule_name': self.rule.name,
+            'transaction_id': f'tx_{index}',
+            'severity': severity,
+            'created_at': timezone.now(),
+        }
+
+    def test_alert_storm_is_coalesced(self):
+        """Тест: шторм алертов одного правила сворачивается в один дайджест"""
+        for index in range(500):
+            self.dispatcher.collect(self._event(index), now=0)
+
+        self.assertEqual(self.dispatcher.due_digests(now=30), [])
+        digests = self.dispatcher.due_digests(now=60)
+
+        self.assertEqual(len(digests), 1)
+        self.assertEqual(digests[0].route['recipient'], 'ops')
+        self.assertEqual(digests[0].alert_count, 500)
+        self.assertEqual(len(digests[0].sample), 10)
+
+    def test_min_severity_routing(self):
+        """Тест фильтрации получателей по severity"""
+        self.dispatcher.collect(self._event(1, 'critical'), now=0)
+        recipients = sorted(digest.route['recipient'] for digest in self.dispatcher.due_digests(force=True))
+        self.assertEqual(recipients, ['oncall', 'ops'])
+
+    def test_delivery_retries(self):
+        """Тест повторной доставки и записи результата"""
+        self.dispatcher.channels['memory'] = FlakyChannel(failures=2)
+        self.dispatcher.collect(self._event(1), now=0)
+        digest = self.dispatcher.due_digests(force=True)[0]
+
+        self.assertTrue(self.dispatcher.deliver(digest))
+        notification = Notification.objects.get()
+        self.assertEqual(notification.status, 'delivered')
+        self.assertEqual(notification.attempts, 3)
+        self.assertEqual(notification.alert_count, 1)
+
+    def test_alert_submitted_on_commit(self):
+        """Тест: алерт передаётся в диспетчер только после коммита транзакции"""
+        with override_settings(NOTIFICATION_ROUTES=[{'recipient': 'ops', 'channel': 'memory'}]), \
+                mock.patch('apps.notifications.dispatcher.get_dispatcher', return_value=self.dispatcher), \
+                mock.patch.object(self.dispatcher, 'submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                alert = Alert.objects.create(rule=self.rule, transaction_id="tx_commit", reason="test", severity="low")
+                submit.assert_not_called()
+        submit.assert_called_once_with(alert)
+
+    def test_stop_delivers_pending_digests(self):
+        """Тест: при остановке доставляются алерты из очереди и открытые дайджесты"""
+        alert = Alert.objects.create(rule=self.rule, transaction_id="tx_stop", reason="test", severity="critical")
+        with mock.patch('apps.notifications.dispatcher.atexit.register') as register:
+            self.assertTrue(self.dispatcher.submit(alert))
+        register.assert_called_once_with(self.dispatcher.stop)
+
+        self.dispatcher.stop()
+
+        self.assertEqual(sorted(recipient for recipient, _ in self.channel.sent), ['oncall', 'ops'])
+        self.assertEqual(Notification.objects.filter(status='delivered').count(), 2)
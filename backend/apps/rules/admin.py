@@ -1,21 +1,38 @@
 from django.contrib import admin
-from .models import Rule, Alert, RuleMetrics
+from backend.large_tables import BoundedRelatedFieldListFilter, LargeTableAdminMixin
+from .models import Rule, Alert, RuleMetrics, RuleMetricsBucket, TransactionPayload
 
 @admin.register(Rule)
 class RuleAdmin(admin.ModelAdmin):
-    list_display = ['name', 'type', 'threshold', 'active', 'created_at']
-    list_filter = ['type', 'active', 'created_at']
+    list_display = ['name', 'type', 'threshold', 'active', 'shadow', 'suppression_window', 'created_at']
+    list_filter = ['type', 'active', 'shadow', 'created_at']
     search_fields = ['name']
     readonly_fields = ['created_at', 'updated_at']
 
 @admin.register(Alert)
-class AlertAdmin(admin.ModelAdmin):
-    list_display = ['transaction_id', 'rule', 'severity', 'created_at']
-    list_filter = ['severity', 'created_at', 'rule']
+class AlertAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['transaction_id', 'rule', 'severity', 'hit_count', 'last_seen', 'created_at']
+    list_filter = ['severity', 'created_at', ('rule', BoundedRelatedFieldListFilter)]
+    list_select_related = ['rule']
     search_fields = ['transaction_id', 'reason']
-    readonly_fields = ['created_at']
+    readonly_fields = ['created_at', 'hit_count', 'first_seen', 'last_seen']
+    raw_id_fields = ['payload']
 
 @admin.register(RuleMetrics)
 class RuleMetricsAdmin(admin.ModelAdmin):
-    list_display = ['rule', 'evaluations_count', 'triggers_count', 'avg_processing_time', 'last_evaluated']
-    readonly_fields = ['evaluations_count', 'triggers_count', 'avg_processing_time', 'last_evaluated']
\ No newline at end of file
+    list_display = ['rule', 'evaluations_count', 'triggers_count', 'errors_count', 'avg_processing_time', 'last_evaluated']
+    readonly_fields = ['evaluations_count', 'triggers_count', 'errors_count', 'avg_processing_time', 'last_evaluated']
+
+@admin.register(RuleMetricsBucket)
+class RuleMetricsBucketAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['rule', 'resolution', 'bucket_start', 'evaluations', 'triggers', 'errors']
+    list_filter = ['resolution', ('rule', BoundedRelatedFieldListFilter)]
+    list_select_related = ['rule']
+    readonly_fields = [field.name for field in RuleMetricsBucket._meta.fields]
+
+@admin.register(TransactionPayload)
+class TransactionPayloadAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['transaction_id', 'raw_size', 'created_at']
+    search_fields = ['transaction_id']
+    readonly_fields = ['transaction_id', 'raw_size', 'created_at']
+    exclude = ['data']
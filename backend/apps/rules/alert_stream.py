@@ -0,0 +1,170 @@
+"""
+Fan-out of newly created alerts to streaming consoles.
+
+Alerts are created by every worker of the main app and of the separate api
+service, so the stream cannot rely on in-process publishing. Each process
+that serves streams runs one poller thread that reads new rows from the
+alerts table every ALERT_STREAM_POLL_SECONDS into a bounded replay buffer.
+Subscribers (SSE streams and long-poll requests) read from the buffer with
+a resume cursor, so database load is one query per process per interval,
+not per console.
+
+The cursor is the alert id, so it is valid against any worker. Ids are
+assigned before commit: the poller only picks up alerts created at least
+ALERT_STREAM_SETTLE_SECONDS ago, so an alert committed slightly after a
+newer one is still delivered in id order. Rows committed later than that
+are skipped.
+
+Waiting is async. Under WSGI Django still runs the stream view on a worker
+thread for up to ALERT_STREAM_MAX_SECONDS; serve /rules/alerts/stream/ from
+the ASGI application (backend.asgi) so open streams cost no threads.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Alert
+
+logger = logging.getLogger(__name__)
+
+ASYNC_WAIT_STEP = 0.2
+
+
+def alert_event(alert):
+    """Serialize an alert for the stream (same keys as get_alerts, without the payload)"""
+    return {
+        'id': alert.id,
+        'transaction_id': alert.transaction_id,
+        'rule_id': alert.rule_id,
+        'rule_name': alert.rule.name,
+        'rule_type': alert.rule.type,
+        'reason': alert.reason,
+        'severity': alert.severity,
+        'created_at': alert.created_at.isoformat(),
+    }
+
+
+class AlertBroker:
+    def __init__(self, buffer_size=1000, poll_seconds=0.5, settle_seconds=1.0):
+        self.buffer_size = buffer_size
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self._events = deque()
+        # Alerts up to this id are older than the buffer: a cursor below it missed events
+        self._evicted = 0
+        self._head = None
+        self._condition = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def head(self):
+        """Id of the latest buffered alert (0 before the first poll)"""
+        return self._head or 0
+
+    def prime(self):
+        """Fill the buffer if this process has not polled yet; queries the database (sync only)"""
+        if self._head is None:
+            self.poll()
+
+    def ensure_started(self):
+        """Start this process's poller thread; poll_seconds <= 0 leaves polling to the caller"""
+        pid = os.getpid()
+        if self._pid == pid or self.poll_seconds <= 0:
+            return
+        with self._condition:
+            if self._pid != pid:
+                threading.Thread(target=self._run, name='alert-stream-poller', daemon=True).start()
+                self._pid = pid
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Alert stream poll failed: {e}")
+            finally:
+                close_old_connections()
+            time.sleep(self.poll_seconds)
+
+    def poll(self, now=None):
+        """Move settled alerts newer than head into the buffer; returns how many were buffered"""
+        with self._poll_lock:
+            return self._poll(now)
+
+    def _poll(self, now):
+        settled = (now or timezone.now()) - timedelta(seconds=self.settle_seconds)
+        alerts = Alert.objects.select_related('rule').filter(created_at__lte=settled)
+        if self._head is not None:
+            alerts = alerts.filter(id__gt=self._head)
+        # Only the latest buffer_size alerts fit; older new ones count as evicted
+        latest = list(alerts.order_by('-id')[:self.buffer_size + 1])
+        skipped = latest.pop().id if len(latest) > self.buffer_size else None
+        alerts = latest[::-1]
+
+        with self._condition:
+            for alert in alerts:
+                self._events.append((alert.id, alert_event(alert)))
+            if skipped is not None:
+                self._evicted = max(self._evicted, skipped)
+            while len(self._events) > self.buffer_size:
+                self._evicted = max(self._evicted, self._events.popleft()[0])
+            if alerts or self._head is None:
+                self._head = alerts[-1].id if alerts else self._head or 0
+                self._condition.notify_all()
+        return len(alerts)
+
+    def read(self, cursor, severities=None, rule_ids=None, limit=100):
+        """
+        Events after alert id `cursor` matching the filters.
+        Returns (events, next_cursor, gap); gap is True when alerts after the
+        cursor were already evicted from the buffer.
+        """
+        with self._condition:
+            buffered = list(self._events)
+            evicted = self._evicted
+
+        if cursor >= self.head:
+            return [], cursor, False
+
+        gap = cursor < evicted
+        events = []
+        next_cursor = cursor
+        start = bisect.bisect_right([alert_id for alert_id, _ in buffered], cursor)
+        for alert_id, event in buffered[start:]:
+            next_cursor = alert_id
+            if severities and event['severity'] not in severities:
+                continue
+            if rule_ids and event['rule_id'] not in rule_ids:
+                continue
+            events.append({'seq': alert_id, 'alert': event})
+            if len(events) >= limit:
+                break
+        return events, next_cursor, gap
+
+    async def wait(self, cursor, timeout):
+        """Wait until an alert newer than `cursor` is buffered or timeout expires, without holding a thread"""
+        self.ensure_started()
+        deadline = time.monotonic() + timeout
+        while self.head <= cursor:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(ASYNC_WAIT_STEP, remaining))
+        return True
+
+
+alert_broker = AlertBroker(
+    buffer_size=settings.ALERT_STREAM_BUFFER_SIZE,
+    poll_seconds=settings.ALERT_STREAM_POLL_SECONDS,
+    settle_seconds=settings.ALERT_STREAM_SETTLE_SECONDS,
+)
@@ -11,7 +11,12 @@ class RulesConfig(AppConfig):
     def ready(self):
         """Initialize rule engine when app is ready"""
         try:
+            from django.db.models.signals import post_delete, post_save
             from .rules_engine import RuleEngine
+            from .models import Rule
+            from .rule_sync import record_rule_deleted, record_rule_saved
+            post_save.connect(record_rule_saved, sender=Rule, dispatch_uid='rules.rule_sync.saved')
+            post_delete.connect(record_rule_deleted, sender=Rule, dispatch_uid='rules.rule_sync.deleted')
             logger.info("Rule Engine app initialized")
         except Exception as e:
             logger.error(f"Failed to initialize Rule Engine: {e}")
@@ -0,0 +1,398 @@
+"""
+Alert retention: archival of old alerts to compressed day segments.
+
+Alerts older than ALERT_RETENTION_DAYS are moved out of the `alerts` table
+into segment files under ALERT_ARCHIVE_DIR, one directory per UTC day:
+
+    2024-05-01/seg-000000001200-000000051199.alz        zlib blocks of NDJSON records
+    2024-05-01/seg-000000001200-000000051199.idx.json   block offsets + transaction_id -> blocks
+
+Each block is compressed on its own, so a lookup by transaction_id only
+inflates the blocks that contain it. Rows are deleted from the table after
+their segment is on disk; a crash in between leaves duplicates, which
+readers drop by alert id. `compact()` merges the segments of one day into a
+single segment, streaming block by block.
+
+Compacted days are also recorded in a transaction index, so a lookup
+without a date range does not parse every day's segment index:
+
+    txindex/07.json     transaction_id -> days, for ids hashing to shard 07
+    txindex/days.json   day -> segments covered by the shards
+
+Days whose segments differ from days.json (archived after their last
+compaction) are searched segment by segment. Compaction is run by one
+process at a time (`manage.py compact_alerts`).
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Alert, TransactionPayload
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 1
+SEGMENT_SUFFIX = '.alz'
+INDEX_SUFFIX = '.idx.json'
+TRANSACTION_INDEX_DIR = 'txindex'
+
+
+def alert_record(alert):
+    return {
+        'id': alert.id,
+        'rule_id': alert.rule_id,
+        'rule_name': alert.rule.name,
+        'transaction_id': alert.transaction_id,
+        'reason': alert.reason,
+        'severity': alert.severity,
+        'hit_count': alert.hit_count,
+        'first_seen': alert.first_seen.astimezone(dt_timezone.utc).isoformat() if alert.first_seen else None,
+        'last_seen': alert.last_seen.astimezone(dt_timezone.utc).isoformat() if alert.last_seen else None,
+        'transaction_data': alert.transaction_data,
+        'created_at': alert.created_at.astimezone(dt_timezone.utc).isoformat(),
+    }
+
+
+def _day_of(record):
+    return record['created_at'][:10]
+
+
+def _atomic_write(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _unique_ids(records):
+    """Drop repeated alert ids from id-ordered records"""
+    last_id = None
+    for record in records:
+        if record['id'] != last_id:
+            last_id = record['id']
+            yield record
+
+
+class AlertArchive:
+    def __init__(self, directory, block_size=500, level=6, cached_indexes=64, index_shards=256):
+        self.directory = directory
+        self.block_size = block_size
+        self.level = level
+        self.index_shards = index_shards
+        # LRU of parsed segment indexes
+        self.cached_indexes = cached_indexes
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Writing
+
+    def write_segment(self, records):
+        """Write records of one UTC day as a segment; returns the segment path"""
+        return self._write_sorted(sorted(records, key=lambda record: record['id']))
+
+    def _write_sorted(self, records):
+        """Write id-ordered records of one UTC day block by block; returns the segment path"""
+        records = iter(records)
+        first = next(records)
+        day = _day_of(first)
+        day_dir = os.path.join(self.directory, day)
+        os.makedirs(day_dir, exist_ok=True)
+
+        blocks = []
+        transactions = {}
+        count = offset = 0
+        fd, tmp_path = tempfile.mkstemp(dir=day_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                records = itertools.chain([first], records)
+                while True:
+                    block = list(itertools.islice(records, self.block_size))
+                    if not block:
+                        break
+                    lines = ''.join(json.dumps(record, cls=DjangoJSONEncoder) + '\n' for record in block)
+                    compressed = zlib.compress(lines.encode('utf-8'), self.level)
+                    number = len(blocks)
+                    blocks.append([offset, len(compressed), len(block)])
+                    f.write(compressed)
+                    offset += len(compressed)
+                    count += len(block)
+                    last_id = block[-1]['id']
+                    for record in block:
+                        numbers = transactions.setdefault(record['transaction_id'], [])
+                        if not numbers or numbers[-1] != number:
+                            numbers.append(number)
+                f.flush()
+                os.fsync(f.fileno())
+            base = self._base_path(day, first['id'], last_id)
+            # Segment first, then its index: an index never points at a missing segment
+            os.replace(tmp_path, base + SEGMENT_SUFFIX)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        index = {
+            'format': INDEX_FORMAT,
+            'date': day,
+            'count': count,
+            'first_id': first['id'],
+            'last_id': last_id,
+            'bytes': offset,
+            'blocks': blocks,
+            'transactions': transactions,
+        }
+        _atomic_write(base + INDEX_SUFFIX, json.dumps(index).encode('utf-8'))
+        return base + SEGMENT_SUFFIX
+
+    def archive(self, cutoff, batch_size=50000):
+        """Move alerts created before `cutoff` into segments, batch by batch"""
+        stats = {'archived': 0, 'segments': 0, 'days': set()}
+        while True:
+            alerts = list(
+                Alert.objects.select_related('rule', 'payload')
+                .filter(created_at__lt=cutoff)
+                .order_by('created_at', 'id')[:batch_size]
+            )
+            if not alerts:
+                break
+
+            by_day = {}
+            for alert in alerts:
+                record = alert_record(alert)
+                by_day.setdefault(_day_of(record), []).append(record)
+            for day, records in by_day.items():
+                self.write_segment(records)
+                stats['segments'] += 1
+                stats['days'].add(day)
+
+            Alert.objects.filter(id__in=[alert.id for alert in alerts]).delete()
+            # Payloads whose alerts are all archived now live only in the segments
+            payload_ids = {alert.payload_id for alert in alerts if alert.payload_id is not None}
+            TransactionPayload.objects.filter(id__in=payload_ids, alerts__isnull=True).delete()
+            stats['archived'] += len(alerts)
+            logger.info(f"Archived {stats['archived']} alerts older than {cutoff.isoformat()}")
+
+        stats['days'] = sorted(stats['days'])
+        return stats
+
+    def compact(self, day):
+        """
+        Merge all segments of a day into one and record the day in the
+        transaction index; returns the number of segments merged
+        """
+        indexes = self.segments(day, day)
+        if len(indexes) < 2:
+            self.index_transactions(day)
+            return 0
+        # Segments are id-ordered: merge them holding one block per segment
+        merged = heapq.merge(
+            *(self._read_blocks(index, range(len(index['blocks']))) for index in indexes),
+            key=lambda record: record['id'],
+        )
+        merged_path = self._write_sorted(_unique_ids(merged))[:-len(SEGMENT_SUFFIX)]
+        for index in indexes:
+            if index['_base'] != merged_path:
+                with self._lock:
+                    self._indexes.pop(index['_base'] + INDEX_SUFFIX, None)
+                for suffix in (INDEX_SUFFIX, SEGMENT_SUFFIX):
+                    try:
+                        os.remove(index['_base'] + suffix)
+                    except FileNotFoundError:
+                        pass
+        self.index_transactions(day)
+        logger.info(f"Compacted {len(indexes)} alert segments for {day}")
+        return len(indexes)
+
+    def index_transactions(self, day):
+        """Add a day's transactions to the transaction index unless it already covers its segments"""
+        indexed = self._indexed_days()
+        names = self._segment_names(day)
+        if not names or indexed.get(day) == names:
+            return
+
+        os.makedirs(os.path.join(self.directory, TRANSACTION_INDEX_DIR), exist_ok=True)
+        by_shard = {}
+        for index in self.segments(day, day):
+            for transaction_id in index['transactions']:
+                by_shard.setdefault(self._shard_of(transaction_id), []).append(transaction_id)
+        for shard, transaction_ids in by_shard.items():
+            path = self._shard_path(shard)
+            days = self._read_json(path, {})
+            for transaction_id in transaction_ids:
+                transaction_days = days.setdefault(transaction_id, [])
+                if day not in transaction_days:
+                    transaction_days.append(day)
+            _atomic_write(path, json.dumps(days, separators=(',', ':')).encode('utf-8'))
+
+        # Shards first, then the day: a day listed here is fully indexed
+        indexed[day] = names
+        _atomic_write(self._shard_path('days'), json.dumps(indexed, sort_keys=True).encode('utf-8'))
+
+    # Reading
+
+    def _base_path(self, day, first_id, last_id):
+        return os.path.join(self.directory, day, f"seg-{first_id:012d}-{last_id:012d}")
+
+    def _shard_of(self, transaction_id):
+        return f"{zlib.crc32(transaction_id.encode('utf-8')) % self.index_shards:02x}"
+
+    def _shard_path(self, name):
+        return os.path.join(self.directory, TRANSACTION_INDEX_DIR, f"{name}.json")
+
+    def _read_json(self, path, default):
+        try:
+            with open(path, 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return default
+
+    def _indexed_days(self):
+        return self._read_json(self._shard_path('days'), {})
+
+    def _segment_names(self, day):
+        try:
+            return sorted(name for name in os.listdir(os.path.join(self.directory, day)) if name.endswith(INDEX_SUFFIX))
+        except FileNotFoundError:
+            return []
+
+    def days(self):
+        try:
+            return sorted(name for name in os.listdir(self.directory) if len(name) == 10 and name[4] == '-')
+        except FileNotFoundError:
+            return []
+
+    def segments(self, start_day=None, end_day=None):
+        """Segment indexes for days in [start_day, end_day] (ISO dates, inclusive)"""
+        result = []
+        for day in self.days():
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            for name in self._segment_names(day):
+                index = self._load_index(os.path.join(self.directory, day, name))
+                if index is not None:
+                    result.append(index)
+        return result
+
+    def _load_index(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached is not None and cached[0] == mtime:
+                self._indexes.move_to_end(path)
+                return cached[1]
+        try:
+            with open(path, 'rb') as f:
+                index = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable alert archive index {path}: {e}")
+            return None
+        if index.get('format') != INDEX_FORMAT:
+            return None
+        index['_base'] = path[:-len(INDEX_SUFFIX)]
+        with self._lock:
+            self._indexes[path] = (mtime, index)
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.cached_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _read_blocks(self, index, numbers):
+        try:
+            with open(index['_base'] + SEGMENT_SUFFIX, 'rb') as f:
+                for number in numbers:
+                    offset, length, _ = index['blocks'][number]
+                    f.seek(offset)
+                    for line in zlib.decompress(f.read(length)).decode('utf-8').splitlines():
+                        yield json.loads(line)
+        except FileNotFoundError:
+            # Segment replaced by a concurrent compaction
+            return
+
+    def lookup(self, transaction_id, start_day=None, end_day=None):
+        """Archived alerts of one transaction, newest first"""
+        if start_day or end_day:
+            indexes = self.segments(start_day, end_day)
+        else:
+            indexes = []
+            for day in self._lookup_days(transaction_id):
+                indexes += self.segments(day, day)
+
+        records = {}
+        for index in indexes:
+            numbers = index['transactions'].get(transaction_id)
+            if not numbers:
+                continue
+            for record in self._read_blocks(index, numbers):
+                if record['transaction_id'] == transaction_id:
+                    records[record['id']] = record
+        return sorted(records.values(), key=lambda record: (record['created_at'], record['id']), reverse=True)
+
+    def _lookup_days(self, transaction_id):
+        """Days that may hold a transaction: indexed days listing it plus days not indexed yet"""
+        indexed = self._indexed_days()
+        days = set(self._read_json(self._shard_path(self._shard_of(transaction_id)), {}).get(transaction_id, []))
+        for day in self.days():
+            if indexed.get(day) != self._segment_names(day):
+                days.add(day)
+        return sorted(days)
+
+    def read_day(self, day, limit=None):
+        """Archived alerts of one UTC day, newest first"""
+        records = {}
+        for index in self.segments(day, day):
+            for record in self._read_blocks(index, range(len(index['blocks']))):
+                records[record['id']] = record
+        result = sorted(records.values(), key=lambda record: (record['created_at'], record['id']), reverse=True)
+        return result[:limit] if limit is not None else result
+
+    def stats(self):
+        indexes = self.segments()
+        return {
+            'days': len({index['date'] for index in indexes}),
+            'segments': len(indexes),
+            'alerts': sum(index['count'] for index in indexes),
+            'bytes': sum(index['bytes'] for index in indexes),
+            'oldest_day': indexes[0]['date'] if indexes else None,
+            'newest_day': indexes[-1]['date'] if indexes else None,
+        }
+
+
+def retention_cutoff(days):
+    return timezone.now() - timedelta(days=days)
+
+
+_archive = None
+
+
+def get_alert_archive():
+    global _archive
+    if _archive is None:
+        _archive = AlertArchive(
+            settings.ALERT_ARCHIVE_DIR,
+            block_size=settings.ALERT_ARCHIVE_BLOCK_SIZE,
+            cached_indexes=settings.ALERT_ARCHIVE_CACHED_INDEXES,
+            index_shards=settings.ALERT_ARCHIVE_INDEX_SHARDS,
+        )
+    return _archive
@@ -0,0 +1,226 @@
+"""
+Vectorized backtesting of candidate rules against labelled history.
+
+Streams the transactions table in chunks (values_list + iterator), turns each
+chunk into NumPy columns and evaluates every candidate rule over the whole
+chunk at once. Candidates can be stored rules in any state (including
+inactive drafts) or unsaved rule definitions.
+
+Historical transactions only carry amount, timestamp, user and the fraud
+label; conditions on fields that are not stored (is_new_user, user_country,
+...) evaluate to False, the same as the live engine does for a missing
+field, and are listed in the report as unsupported.
+"""
+import logging
+import time
+from datetime import date
+
+import numpy as np
+
+from apps.transactions.models import Transactions
+from .models import Rule, RuleType
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Rule/condition field name -> chunk column
+FIELD_COLUMNS = {
+    'amount': 'amount',
+    'value': 'amount',
+    'user_id': 'user_id',
+}
+
+COMPARISONS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+}
+
+
+class Chunk:
+    """Column arrays for a slice of the transactions table"""
+
+    def __init__(self, rows):
+        size = len(rows)
+        values, created, user_ids, labels = zip(*rows) if rows else ((), (), (), ())
+        self.size = size
+        self.amount = np.fromiter((float(value) for value in values), dtype=np.float64, count=size)
+        epoch = np.fromiter((int(moment.timestamp()) for moment in created), dtype=np.int64, count=size)
+        self.hour = (epoch // 3600) % 24
+        self.day = epoch // 86400
+        self.user_id = np.fromiter(user_ids, dtype=np.int64, count=size)
+        self.label = np.fromiter(labels, dtype=bool, count=size)
+
+    def column(self, name):
+        return getattr(self, name)
+
+
+def iter_chunks(start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    queryset = Transactions.objects.order_by()
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+
+    rows = []
+    for row in queryset.values_list('value', 'created_at', 'user_id', 'fraud_flag').iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield Chunk(rows)
+            rows = []
+    if rows:
+        yield Chunk(rows)
+
+
+class VectorizedRule:
+    """Evaluates one rule definition over a Chunk; mirrors RuleEngine semantics"""
+
+    def __init__(self, name, rule_type, condition, threshold=None, rule_id=None):
+        self.rule_id = rule_id
+        self.name = name
+        self.type = rule_type
+        self.condition = condition or {}
+        self.threshold = threshold
+        self.unsupported = set()
+
+    @classmethod
+    def from_rule(cls, rule):
+        return cls(rule.name, rule.type, rule.condition, rule.threshold, rule_id=rule.id)
+
+    @classmethod
+    def from_definition(cls, definition):
+        return cls(definition.get('name', 'draft'), definition['type'],
+                   definition.get('condition'), definition.get('threshold'))
+
+    def evaluate(self, chunk):
+        if self.type == RuleType.THRESHOLD:
+            return self._threshold(chunk)
+        if self.type == RuleType.COMPOSITE:
+            return self._composite(chunk)
+        if self.type == RuleType.ML_BASED:
+            return self._ml(chunk)
+        self.unsupported.add(f"rule type {self.type}")
+        return np.zeros(chunk.size, dtype=bool)
+
+    def _false(self, chunk, reason):
+        self.unsupported.add(reason)
+        return np.zeros(chunk.size, dtype=bool)
+
+    def _threshold(self, chunk):
+        field = self.condition.get('field')
+        compare = COMPARISONS.get(self.condition.get('operator'))
+        column = FIELD_COLUMNS.get(field)
+        if column is None:
+            return self._false(chunk, f"field {field}")
+        if compare is None:
+            return self._false(chunk, f"operator {self.condition.get('operator')}")
+        try:
+            value = float(self.condition.get('value'))
+        except (TypeError, ValueError):
+            return self._false(chunk, f"value {self.condition.get('value')!r}")
+        return compare(chunk.column(column), value)
+
+    def _composite(self, chunk):
+        logic = self.condition.get('logic', 'AND').upper()
+        masks = [self._condition(condition, chunk) for condition in self.condition.get('conditions', [])]
+        if logic == 'AND':
+            return np.logical_and.reduce(masks) if masks else np.ones(chunk.size, dtype=bool)
+        if logic == 'OR':
+            return np.logical_or.reduce(masks) if masks else np.zeros(chunk.size, dtype=bool)
+        return self._false(chunk, f"logic {logic}")
+
+    def _condition(self, condition, chunk):
+        condition_type = condition.get('type')
+        if condition_type == 'amount_threshold':
+            operator = condition.get('operator', '>')
+            if operator not in ('>', '>='):
+                return np.zeros(chunk.size, dtype=bool)
+            return COMPARISONS[operator](chunk.amount, float(condition.get('threshold', 0)))
+        if condition_type == 'nighttime':
+            return chunk.hour < 6
+        return self._false(chunk, f"condition {condition_type}")
+
+    def _ml(self, chunk):
+        # Vectorized MLService.predict_fraud_probability (new user / international aren't stored)
+        probability = np.full(chunk.size, 0.01)
+        probability += 0.3 * (chunk.amount > 1000)
+        probability += 0.4 * (chunk.amount > 5000)
+        probability += 0.2 * (chunk.hour < 6)
+        np.minimum(probability, 0.95, out=probability)
+        return probability > (self.threshold or 0.5)
+
+
+class RuleReport:
+    def __init__(self, rule):
+        self.rule = rule
+        self.tp = self.fp = self.fn = self.tn = 0
+        self.alerts_per_day = {}
+        self.seconds = 0.0
+
+    def add(self, chunk, mask):
+        label = chunk.label
+        self.tp += int(np.count_nonzero(mask & label))
+        self.fp += int(np.count_nonzero(mask & ~label))
+        self.fn += int(np.count_nonzero(~mask & label))
+        self.tn += int(np.count_nonzero(~mask & ~label))
+
+        days, counts = np.unique(chunk.day[mask], return_counts=True)
+        for day, count in zip(days.tolist(), counts.tolist()):
+            self.alerts_per_day[day] = self.alerts_per_day.get(day, 0) + count
+
+    def as_dict(self):
+        evaluated = self.tp + self.fp + self.fn + self.tn
+        alerts = self.tp + self.fp
+        return {
+            'rule_id': self.rule.rule_id,
+            'rule_name': self.rule.name,
+            'rule_type': self.rule.type,
+            'evaluated': evaluated,
+            'alerts': alerts,
+            'hit_rate': round(alerts / evaluated, 6) if evaluated else 0,
+            'precision': round(self.tp / alerts, 6) if alerts else None,
+            'recall': round(self.tp / (self.tp + self.fn), 6) if self.tp + self.fn else None,
+            'confusion_matrix': {'tp': self.tp, 'fp': self.fp, 'fn': self.fn, 'tn': self.tn},
+            'alerts_per_day': {
+                date.fromordinal(date(1970, 1, 1).toordinal() + day).isoformat(): count
+                for day, count in sorted(self.alerts_per_day.items())
+            },
+            'unsupported': sorted(self.rule.unsupported),
+            'evaluation_ms': round(self.seconds * 1000, 2),
+        }
+
+
+def candidates_from(rule_ids=(), definitions=()):
+    """Candidate rules: stored rules by ID (any state) plus unsaved definitions"""
+    candidates = [VectorizedRule.from_rule(rule) for rule in Rule.objects.filter(id__in=list(rule_ids))]
+    candidates.extend(VectorizedRule.from_definition(definition) for definition in definitions)
+    return candidates
+
+
+def run_backtest(candidates, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    reports = [RuleReport(candidate) for candidate in candidates]
+    started = time.perf_counter()
+    rows = chunks = 0
+
+    for chunk in iter_chunks(start, end, chunk_size):
+        rows += chunk.size
+        chunks += 1
+        for report in reports:
+            eval_started = time.perf_counter()
+            report.add(chunk, report.rule.evaluate(chunk))
+            report.seconds += time.perf_counter() - eval_started
+
+    total = time.perf_counter() - started
+    evaluation = sum(report.seconds for report in reports)
+    logger.info(f"Backtested {len(reports)} rules over {rows} transactions in {total:.2f}s")
+    return {
+        'transactions': rows,
+        'chunks': chunks,
+        'total_seconds': round(total, 3),
+        'load_seconds': round(total - evaluation, 3),
+        'evaluation_seconds': round(evaluation, 3),
+        'rules': [report.as_dict() for report in reports],
+    }
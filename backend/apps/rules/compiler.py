@@ -0,0 +1,127 @@
+"""
+Rule set compiler.
+
+Composite rules reference a flat list of conditions, and rule packs repeat the
+same ones (nighttime, is_international, amount_threshold at common cutoffs...).
+The compiler deduplicates identical condition nodes across the whole rule set
+so every distinct condition is evaluated at most once per transaction; results
+are memoized in two bitsets (evaluated / true) indexed by condition id.
+
+text_match conditions are compiled per field into one Aho-Corasick automaton
+(text_match.TextMatcher) whose outputs are masks of condition ids: the first
+text_match lookup on a field scans it once and settles every text_match
+condition on that field.
+"""
+import json
+import logging
+import time
+
+from .resilience import RuleTimeout
+from .text_match import TextMatcher, text_of, text_patterns
+
+logger = logging.getLogger(__name__)
+
+
+def condition_key(condition):
+    """Canonical key of a condition node: equal dicts map to the same key"""
+    return json.dumps(condition, sort_keys=True, default=str)
+
+
+class CompiledRuleSet:
+    """Shared condition table plus, per composite rule, its logic and condition ids"""
+
+    def __init__(self, rules):
+        self.conditions = []
+        self.plans = {}
+        # condition id -> field, and field -> matcher, for text_match conditions
+        self.text_fields = {}
+        self.matchers = {}
+        index = {}
+
+        for rule in rules:
+            if rule.type != 'composite' or not isinstance(rule.condition, dict):
+                continue
+
+            logic = rule.condition.get('logic', 'AND').upper()
+            condition_ids = []
+            for condition in rule.condition.get('conditions', []):
+                key = condition_key(condition)
+                if key not in index:
+                    index[key] = len(self.conditions)
+                    self.conditions.append(condition)
+                    if condition.get('type') == 'text_match':
+                        self._add_text_condition(index[key], condition)
+                condition_ids.append(index[key])
+
+            self.plans[rule.id] = (logic, tuple(condition_ids))
+
+        for matcher in self.matchers.values():
+            matcher.build()
+
+        referenced = sum(len(ids) for _, ids in self.plans.values())
+        logger.info(f"Compiled {len(self.plans)} composite rules: "
+                    f"{referenced} condition references, {len(self.conditions)} distinct")
+        if self.matchers:
+            patterns = sum(matcher.pattern_count for matcher in self.matchers.values())
+            logger.info(f"Compiled {len(self.text_fields)} text_match conditions into "
+                        f"{len(self.matchers)} automata, {patterns} patterns")
+
+    def _add_text_condition(self, condition_id, condition):
+        field = condition.get('field')
+        matcher = self.matchers.get(field)
+        if matcher is None:
+            matcher = self.matchers[field] = TextMatcher()
+        for pattern in text_patterns(condition):
+            matcher.add(pattern, 1 << condition_id)
+        self.text_fields[condition_id] = field
+
+    def plan_for(self, rule):
+        return self.plans.get(rule.id)
+
+    def new_results(self, transaction_data, evaluator):
+        return ConditionResults(self, transaction_data, evaluator)
+
+
+class ConditionResults:
+    """
+    Per-transaction memo of condition results. `deadline` (perf_counter time)
+    bounds the rule being evaluated: a condition not settled by then raises
+    RuleTimeout instead of running
+    """
+
+    __slots__ = ('compiled', 'transaction_data', 'evaluator', 'evaluated', 'values', 'deadline')
+
+    def __init__(self, compiled, transaction_data, evaluator):
+        self.compiled = compiled
+        self.transaction_data = transaction_data
+        self.evaluator = evaluator
+        self.evaluated = 0
+        self.values = 0
+        self.deadline = None
+
+    def get(self, condition_id):
+        bit = 1 << condition_id
+        if self.evaluated & bit:
+            return bool(self.values & bit)
+
+        field = self.compiled.text_fields.get(condition_id)
+        if field is not None:
+            self._scan(field)
+            return bool(self.values & bit)
+
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise RuleTimeout()
+        result = bool(self.evaluator(self.compiled.conditions[condition_id], self.transaction_data))
+        self.evaluated |= bit
+        if result:
+            self.values |= bit
+        return result
+
+    def _scan(self, field):
+        """Settle every text_match condition on `field` with one scan of its value"""
+        text = text_of(self.transaction_data.get(field))
+        hits = self.compiled.matchers[field].scan(text) if text else 0
+        for condition_id, condition_field in self.compiled.text_fields.items():
+            if condition_field == field:
+                self.evaluated |= 1 << condition_id
+        self.values |= hits
@@ -0,0 +1,408 @@
+"""
+End-to-end load generation for the evaluate endpoint (`manage.py loadtest`).
+
+An open-loop asyncio client sends synthetic transactions at a fixed rate:
+arrival i is due at start + i / rate whether or not earlier requests have
+finished, so a stalled server cannot slow the client down and hide its own
+queueing (coordinated omission). Every response is recorded twice: latency
+from the moment the request was due (corrected: what a caller at that rate
+sees, including waiting for a free connection) and from the moment it was
+written to a connection (service time).
+
+WebhookSink is a local HTTP endpoint standing in for external services
+(notification webhooks), with configurable latency and failure rate.
+"""
+import asyncio
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+SUB_BUCKET_BITS = 7
+PERCENTILES = (50, 90, 99, 99.9)
+
+COUNTRIES = ('RU', 'KZ', 'BY', 'DE', 'TR', 'US', 'CN', 'AE')
+TRANSACTION_TYPES = ('purchase', 'transfer', 'withdrawal')
+MERCHANTS = ('Grocery Market', 'Coffee House', 'City Pharmacy', 'Fuel Station', 'Online Books', 'Taxi Service')
+SUSPICIOUS_MERCHANTS = ('Crypto Exchange 24', 'Royal Online Casino', 'Gift Card Outlet')
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of integer microseconds (HdrHistogram-style): exact
+    below 128 us, then 64 sub-buckets per power of two (< 1.6% error)
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _key(value):
+        exponent = max(value.bit_length() - SUB_BUCKET_BITS, 0)
+        return exponent << SUB_BUCKET_BITS | value >> exponent
+
+    @staticmethod
+    def _upper(key):
+        exponent, mantissa = key >> SUB_BUCKET_BITS, key & ((1 << SUB_BUCKET_BITS) - 1)
+        return ((mantissa + 1) << exponent) - 1 if exponent else mantissa
+
+    def record(self, seconds):
+        value = max(int(seconds * 1_000_000), 0)
+        key = self._key(value)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Value (us) at or below which `percent` of the recorded values fall"""
+        if not self.total:
+            return 0
+        target = max(math.ceil(percent / 100 * self.total), 1)
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= target:
+                return min(self._upper(key), self.max)
+        return self.max
+
+    def summary(self):
+        """Percentiles and max in milliseconds"""
+        data = {f'p{percent:g}': round(self.percentile(percent) / 1000, 3) for percent in PERCENTILES}
+        data['max'] = round(self.max / 1000, 3)
+        data['count'] = self.total
+        return data
+
+    def buckets(self):
+        """[upper bound ms, count] for every non-empty bucket"""
+        return [[round(self._upper(key) / 1000, 3), self.counts[key]] for key in sorted(self.counts)]
+
+
+class TrafficMix:
+    """Synthetic transactions: log-normal amounts, a share of them shaped to look suspicious"""
+
+    def __init__(self, suspicious_ratio=0.05, users=10000, amount_median=60.0, amount_sigma=1.0,
+                 international_ratio=0.1, new_user_ratio=0.05, seed=None):
+        self.suspicious_ratio = suspicious_ratio
+        self.users = users
+        self.amount_median = amount_median
+        self.amount_sigma = amount_sigma
+        self.international_ratio = international_ratio
+        self.new_user_ratio = new_user_ratio
+        self.random = random.Random(seed)
+        self.run_id = f"{self.random.getrandbits(32):08x}"
+        self.suspicious_sent = 0
+
+    def transaction(self, sequence):
+        rng = self.random
+        suspicious = rng.random() < self.suspicious_ratio
+        amount = rng.lognormvariate(math.log(self.amount_median), self.amount_sigma)
+        timestamp = datetime.now(timezone.utc)
+        international = rng.random() < self.international_ratio
+        new_user = rng.random() < self.new_user_ratio
+        merchant = rng.choice(MERCHANTS)
+
+        if suspicious:
+            self.suspicious_sent += 1
+            amount *= rng.uniform(20, 100)
+            timestamp = timestamp.replace(hour=rng.randrange(0, 6))
+            international = international or rng.random() < 0.7
+            new_user = new_user or rng.random() < 0.5
+            merchant = rng.choice(SUSPICIOUS_MERCHANTS)
+        elif timestamp.hour < 6:
+            timestamp -= timedelta(hours=8)
+
+        return {
+            'transaction_id': f"lt-{self.run_id}-{sequence}",
+            'amount': round(amount, 2),
+            'user_id': f"user_{rng.randrange(self.users)}",
+            'timestamp': timestamp.isoformat(),
+            'transaction_type': rng.choice(TRANSACTION_TYPES),
+            'user_country': COUNTRIES[0] if not international else rng.choice(COUNTRIES[1:]),
+            'is_international': international,
+            'is_new_user': new_user,
+            'merchant_name': merchant,
+        }
+
+
+class HttpError(Exception):
+    pass
+
+
+async def read_http_message(reader):
+    """Start line, lower-cased headers and body of one HTTP/1.1 message"""
+    start_line = await reader.readline()
+    if not start_line:
+        raise ConnectionError('connection closed')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+        return start_line, headers, bytes(body)
+    if 'content-length' in headers:
+        return start_line, headers, await reader.readexactly(int(headers['content-length']))
+    if start_line.startswith(b'HTTP/'):
+        # Response without a length: delimited by the connection closing
+        headers['connection'] = 'close'
+        return start_line, headers, await reader.read()
+    return start_line, headers, b''
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one host; at most `size` requests in flight"""
+
+    def __init__(self, host, port, size):
+        self.host = host
+        self.port = port
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(None)
+
+    async def acquire(self):
+        connection = await self._idle.get()
+        if connection is None:
+            try:
+                connection = await asyncio.open_connection(self.host, self.port)
+            except BaseException:
+                self._idle.put_nowait(None)
+                raise
+        return connection
+
+    def release(self, connection, reusable=True):
+        if not reusable:
+            connection[1].close()
+            connection = None
+        self._idle.put_nowait(connection)
+
+    async def request(self, connection, method, path, body=b'', headers=None):
+        reader, writer = connection
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        start_line, response_headers, response_body = await read_http_message(reader)
+        try:
+            status = int(start_line.split()[1])
+        except (IndexError, ValueError):
+            raise HttpError(f"Malformed status line: {start_line[:80]!r}")
+        return status, response_body, response_headers.get('connection', '').lower() != 'close'
+
+    async def close(self):
+        while not self._idle.empty():
+            connection = self._idle.get_nowait()
+            if connection is not None:
+                connection[1].close()
+
+
+class LoadRun:
+    """
+    Open-loop run: `rate` arrivals per second for `duration` seconds, each
+    arrival sending `batch_size` concurrent evaluate requests
+    """
+
+    def __init__(self, url, mix, rate=100.0, duration=10.0, batch_size=1, connections=64,
+                 timeout=5.0, warmup=0.0, verdict_only=True):
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise ValueError('Only http:// targets are supported')
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = (parts.path or '/') + ('?verdict_only=1' if verdict_only else '')
+        self.mix = mix
+        self.rate = rate
+        self.duration = duration
+        self.batch_size = batch_size
+        self.connections = connections
+        self.timeout = timeout
+        self.warmup = warmup
+
+        self.corrected = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.scheduled = 0
+        self.completed = 0
+        self.ok = 0
+        self.flagged = 0
+        self.errors = {}
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        pool = ConnectionPool(self.host, self.port, self.connections)
+        tasks = set()
+        arrivals = int((self.warmup + self.duration) * self.rate)
+        start = loop.time() + 0.01
+        measure_from = start + self.warmup
+        wall_start = time.perf_counter()
+
+        for arrival in range(arrivals):
+            due = start + arrival / self.rate
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            for _ in range(self.batch_size):
+                task = loop.create_task(self._send(pool, self.scheduled, due, due >= measure_from))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                self.scheduled += 1
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - wall_start
+        await pool.close()
+        return self.report(elapsed)
+
+    async def _send(self, pool, sequence, due, measured):
+        loop = asyncio.get_running_loop()
+        body = json.dumps(self.mix.transaction(sequence)).encode('utf-8')
+        outcome = None
+        sent = None
+        try:
+            async with asyncio.timeout(self.timeout):
+                connection = await pool.acquire()
+                reusable = False
+                try:
+                    sent = loop.time()
+                    status, response, reusable = await pool.request(
+                        connection, 'POST', self.path, body, {'Content-Type': 'application/json'}
+                    )
+                finally:
+                    pool.release(connection, reusable)
+        except TimeoutError:
+            outcome = 'timeout'
+        except (OSError, asyncio.IncompleteReadError, HttpError, ValueError):
+            outcome = 'connection'
+
+        done = loop.time()
+        if not measured:
+            return
+        self.completed += 1
+        if outcome is None:
+            outcome = 'ok' if status < 400 else f'http_{status}'
+            self.corrected.record(done - due)
+            self.service.record(done - sent)
+        if outcome == 'ok':
+            self.ok += 1
+            self.flagged += self._is_suspicious(response)
+        else:
+            self.errors[outcome] = self.errors.get(outcome, 0) + 1
+
+    @staticmethod
+    def _is_suspicious(response):
+        try:
+            data = json.loads(response)['data']
+        except (ValueError, KeyError, TypeError):
+            return False
+        if 'is_suspicious' in data:
+            return bool(data['is_suspicious'])
+        return bool(data.get('evaluation_result', {}).get('is_suspicious'))
+
+    def report(self, elapsed):
+        measured_seconds = max(elapsed - self.warmup, 1e-9)
+        return {
+            'target': self.url,
+            'rate_per_second': self.rate,
+            'batch_size': self.batch_size,
+            'connections': self.connections,
+            'duration_seconds': self.duration,
+            'elapsed_seconds': round(elapsed, 3),
+            'requests': {
+                'scheduled': self.scheduled,
+                'completed': self.completed,
+                'ok': self.ok,
+                'errors': self.errors,
+                'error_rate': round(sum(self.errors.values()) / self.completed, 4) if self.completed else 0,
+            },
+            'throughput_per_second': round(self.ok / measured_seconds, 1),
+            'suspicious': {
+                'sent_ratio': round(self.mix.suspicious_sent / self.scheduled, 4) if self.scheduled else 0,
+                'flagged_ratio': round(self.flagged / self.ok, 4) if self.ok else 0,
+            },
+            'latency_ms': {
+                'corrected': self.corrected.summary(),
+                'service': self.service.summary(),
+            },
+        }
+
+
+class WebhookSink:
+    """Local HTTP endpoint accepting POSTs: a stand-in for external webhook receivers"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self.bytes = 0
+        self._server = None
+        self._handlers = set()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        """Stop accepting and end open keep-alive connections before returning"""
+        if self._server is not None:
+            self._server.close()
+            handlers = list(self._handlers)
+            for handler in handlers:
+                handler.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            while True:
+                try:
+                    _, _, body = await read_http_message(reader)
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    break
+                self.requests += 1
+                self.bytes += len(body)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                failed = self.random.random() < self.failure_rate
+                self.failures += failed
+                payload = b'{"status": "error"}' if failed else b'{"status": "success", "data": {}}'
+                status = '500 Internal Server Error' if failed else '200 OK'
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+        except asyncio.CancelledError:
+            # Cancelled by stop(): the connection just ends
+            pass
+        finally:
+            self._handlers.discard(handler)
+            writer.close()
+
+    def stats(self):
+        return {'requests': self.requests, 'failures': self.failures, 'bytes': self.bytes}
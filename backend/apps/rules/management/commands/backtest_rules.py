@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from apps.rules.backtest import DEFAULT_CHUNK_SIZE, candidates_from, run_backtest
+
+
+class Command(BaseCommand):
+    help = 'Backtest stored or draft rules against labelled transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rule-id', type=int, action='append', default=[],
+                            help='Stored rule to test (any state); repeatable')
+        parser.add_argument('--definitions', help='JSON file with a list of draft rule definitions')
+        parser.add_argument('--start', help='ISO datetime, inclusive')
+        parser.add_argument('--end', help='ISO datetime, exclusive')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        definitions = []
+        if options['definitions']:
+            with open(options['definitions'], encoding='utf-8') as f:
+                definitions = json.load(f)
+
+        candidates = candidates_from(options['rule_id'], definitions)
+        if not candidates:
+            raise CommandError('Nothing to test: pass --rule-id and/or --definitions')
+
+        report = run_backtest(
+            candidates,
+            start=self._datetime(options['start']),
+            end=self._datetime(options['end']),
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _datetime(self, value):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'Invalid datetime: {value}')
+        return parsed
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.rules.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write the active rule set to a snapshot file for fast worker startup'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=str(settings.RULE_SNAPSHOT_PATH),
+            help='Snapshot file path (default: settings.RULE_SNAPSHOT_PATH)',
+        )
+
+    def handle(self, *args, **options):
+        snapshot = write_snapshot(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(snapshot['rules'])} rules (version {snapshot['version']}) to {options['output']}"
+        ))
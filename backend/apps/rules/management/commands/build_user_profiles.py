@@ -0,0 +1,40 @@
+import math
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rules.profiles import UserProfileStore
+from apps.transactions.models import Transactions
+
+
+class Command(BaseCommand):
+    help = 'Build the user profile checkpoint by replaying transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=settings.USER_PROFILE_PATH,
+            help='Checkpoint path (default: settings.USER_PROFILE_PATH)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        store = UserProfileStore(settings.USER_PROFILE_CAPACITY)
+        rows = (
+            Transactions.objects.order_by('created_at', 'id')
+            .values_list('user_id', 'value', 'created_at')
+            .iterator(chunk_size=options['chunk_size'])
+        )
+        count = 0
+        for user_id, value, created_at in rows:
+            amount = float(value)
+            if not math.isfinite(amount):
+                continue
+            store.observe(str(user_id), amount, hour=created_at.hour)
+            count += 1
+
+        if not store.checkpoint(options['output']):
+            raise CommandError(f"{options['output']} is being checkpointed by another process")
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {count} transactions into {len(store)} user profiles at {options['output']}"
+        ))
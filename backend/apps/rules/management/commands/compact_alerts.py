@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.rules.archive import get_alert_archive, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Move alerts older than the retention period into archive segments and merge segments per day'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.ALERT_RETENTION_DAYS,
+            help='Archive alerts older than this many days (default: settings.ALERT_RETENTION_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ALERT_ARCHIVE_SEGMENT_SIZE,
+            help='Alerts moved per batch; at most one segment per day per batch',
+        )
+        parser.add_argument(
+            '--compact-only',
+            action='store_true',
+            help='Only merge existing segments, do not move alerts',
+        )
+
+    def handle(self, *args, **options):
+        archive = get_alert_archive()
+
+        if not options['compact_only']:
+            cutoff = retention_cutoff(options['days'])
+            stats = archive.archive(cutoff, batch_size=options['batch_size'])
+            self.stdout.write(
+                f"Archived {stats['archived']} alerts older than {cutoff:%Y-%m-%d %H:%M} "
+                f"into {stats['segments']} segments"
+            )
+
+        merged = 0
+        for day in archive.days():
+            merged += archive.compact(day)
+
+        summary = archive.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {merged} segments; archive holds {summary['alerts']} alerts in "
+            f"{summary['segments']} segments ({summary['bytes']} bytes)"
+        ))
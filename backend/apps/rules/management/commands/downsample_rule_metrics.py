@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.rules.metrics_history import downsample
+
+
+class Command(BaseCommand):
+    help = 'Roll per-minute rule metrics into hourly and daily buckets and delete buckets past retention'
+
+    def handle(self, *args, **options):
+        stats = downsample()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {stats['hour_written']} hour and {stats['day_written']} day buckets; deleted "
+            f"{stats['minute_deleted']} minute, {stats['hour_deleted']} hour and {stats['day_deleted']} day buckets"
+        ))
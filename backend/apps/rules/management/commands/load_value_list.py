@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rules.value_lists import InvalidListName, get_value_lists
+
+
+class Command(BaseCommand):
+    help = 'Publish a new version of a named value list from a file with one value per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='List name (letters, digits, - and _)')
+        parser.add_argument('path', help="Values file, one per line ('-' for stdin)")
+        parser.add_argument('--append', action='store_true', help='Add to the current version instead of replacing it')
+        parser.add_argument('--no-bloom', action='store_true', help='Do not build a Bloom filter')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            if path == '-':
+                info = get_value_lists().upload(options['name'], sys.stdin, options['append'], not options['no_bloom'])
+            else:
+                with open(path, encoding='utf-8') as values:
+                    info = get_value_lists().upload(options['name'], values, options['append'], not options['no_bloom'])
+        except (InvalidListName, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {info['name']} v{info['version']}: {info['count']} values, {info['bytes']} bytes"
+        ))
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.rules.loadtest import LoadRun, TrafficMix, WebhookSink
+
+SERVER_SETTINGS = 'backend.api_settings'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Open-loop load test of /rules/evaluate/ through a locally started server '
+            '(gunicorn, uvicorn or runserver) with a local webhook sink')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['gunicorn', 'uvicorn', 'runserver'], default='gunicorn')
+        parser.add_argument('--url', help='Test an already running server instead (full evaluate URL)')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker')
+        parser.add_argument('--startup-timeout', type=float, default=30.0)
+
+        parser.add_argument('--rate', type=float, default=100.0, help='Arrivals per second (open loop)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Measured seconds')
+        parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of traffic before measuring')
+        parser.add_argument('--batch-size', type=int, default=1, help='Concurrent requests per arrival')
+        parser.add_argument('--connections', type=int, default=64, help='Max requests in flight')
+        parser.add_argument('--timeout', type=float, default=5.0)
+        parser.add_argument('--full-response', action='store_true', help='Request the full response, not verdict_only')
+
+        parser.add_argument('--suspicious-ratio', type=float, default=0.05)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--amount-median', type=float, default=60.0)
+        parser.add_argument('--amount-sigma', type=float, default=1.0)
+        parser.add_argument('--international-ratio', type=float, default=0.1)
+        parser.add_argument('--seed', type=int)
+
+        parser.add_argument('--sink-latency-ms', type=float, default=0.0)
+        parser.add_argument('--sink-failure-rate', type=float, default=0.0)
+        parser.add_argument('--histogram', action='store_true', help='Include corrected histogram buckets')
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0 or options['duration'] <= 0 or options['batch_size'] <= 0:
+            raise CommandError('--rate, --duration and --batch-size must be positive')
+        if not 0 <= options['suspicious_ratio'] <= 1:
+            raise CommandError('--suspicious-ratio must be between 0 and 1')
+
+        report = asyncio.run(self._run(options))
+        self.stdout.write(json.dumps(report, indent=2))
+
+    async def _run(self, options):
+        sink = await WebhookSink(
+            latency=options['sink_latency_ms'] / 1000,
+            failure_rate=options['sink_failure_rate'],
+            seed=options['seed'],
+        ).start()
+        server = None
+        try:
+            url = options['url']
+            if url is None:
+                server, url = await asyncio.to_thread(self._start_server, options, sink.url)
+
+            run = LoadRun(
+                url,
+                TrafficMix(
+                    suspicious_ratio=options['suspicious_ratio'],
+                    users=options['users'],
+                    amount_median=options['amount_median'],
+                    amount_sigma=options['amount_sigma'],
+                    international_ratio=options['international_ratio'],
+                    seed=options['seed'],
+                ),
+                rate=options['rate'],
+                duration=options['duration'],
+                batch_size=options['batch_size'],
+                connections=options['connections'],
+                timeout=options['timeout'],
+                warmup=options['warmup'],
+                verdict_only=not options['full_response'],
+            )
+            self.stderr.write(f"Sending {options['rate'] * options['batch_size']:g} req/s to {url} "
+                              f"for {options['warmup']:g}s warmup + {options['duration']:g}s")
+            report = await run.run()
+            report['server'] = 'external' if server is None else options['server']
+            report['webhook_sink'] = sink.stats()
+            if options['histogram']:
+                report['latency_ms']['corrected_histogram'] = run.corrected.buckets()
+            return report
+        finally:
+            if server is not None:
+                await asyncio.to_thread(self._stop_server, server)
+            await sink.stop()
+
+    def _server_command(self, options, port):
+        workers = str(options['workers'])
+        if options['server'] == 'gunicorn':
+            return [sys.executable, '-m', 'gunicorn', 'backend.api_wsgi:application', '--preload',
+                    '--bind', f'127.0.0.1:{port}', '--workers', workers, '--threads', str(options['threads'])]
+        if options['server'] == 'uvicorn':
+            return [sys.executable, '-m', 'uvicorn', 'backend.api_asgi:application',
+                    '--host', '127.0.0.1', '--port', str(port), '--workers', workers, '--no-access-log']
+        return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+
+    def _start_server(self, options, sink_url):
+        port = free_port()
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=SERVER_SETTINGS, NOTIFICATION_WEBHOOK_URL=sink_url)
+        log = tempfile.NamedTemporaryFile(prefix='loadtest-server-', suffix='.log', delete=False)
+        process = subprocess.Popen(
+            self._server_command(options, port), cwd=settings.BASE_DIR, env=env,
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+        base = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + options['startup_timeout']
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(f'{base}/rules/health/', timeout=1) as response:
+                    if response.status == 200:
+                        self.stderr.write(f"{options['server']} is up on port {port} (log: {log.name})")
+                        return process, f'{base}/rules/evaluate/'
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+
+        self._stop_server(process)
+        log.close()
+        with open(log.name, encoding='utf-8', errors='replace') as f:
+            tail = f.read()[-2000:]
+        raise CommandError(f"{options['server']} did not become ready on port {port}:\n{tail}")
+
+    def _stop_server(self, process):
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
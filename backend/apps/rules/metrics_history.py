@@ -0,0 +1,251 @@
+"""
+Time-bucketed rule metrics (RuleMetricsBucket).
+
+The engine records every rule evaluation into an in-memory table keyed by
+(rule, minute). A background PeriodicFlusher adds it to the minute buckets
+every RULE_METRICS_FLUSH_SECONDS with one `UPDATE ... SET x = x + n` per
+touched bucket (an INSERT for new ones); increments rather than overwrites
+keep flushes from several workers additive.
+
+Every write clears the bucket's `rolled_up` flag. `downsample()` recomputes
+the hour bucket of every complete hour holding a cleared minute, and the day
+bucket of every complete day holding a cleared hour, from all of their source
+rows, so minutes flushed after their hour was rolled up are not lost. It then
+deletes buckets past each tier's retention. Range
+queries read a single tier, the finest one that still holds the range in at
+most MAX_POINTS buckets per rule, so their cost depends on the range, not on
+how long the service has run. Hour and day buckets cover completed periods
+only; the current hour is visible at minute resolution.
+"""
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import Rule, RuleMetricsBucket
+from .periodic import PeriodicFlusher
+
+logger = logging.getLogger(__name__)
+
+LATENCY_FIELDS = (
+    ('le_1ms', 0.001),
+    ('le_5ms', 0.005),
+    ('le_10ms', 0.010),
+    ('le_25ms', 0.025),
+    ('le_50ms', 0.050),
+    ('le_100ms', 0.100),
+    ('le_250ms', 0.250),
+    ('gt_250ms', math.inf),
+)
+COUNTER_FIELDS = ('evaluations', 'triggers', 'errors', 'total_time') + tuple(name for name, _ in LATENCY_FIELDS)
+LATENCY_OFFSET = 4
+
+TIERS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+ROLLUPS = (('minute', 'hour', TruncHour), ('hour', 'day', TruncDay))
+
+# A period is rolled up once it ended this long ago; later writes to it are rolled up again
+ROLLUP_GRACE = timedelta(minutes=5)
+ROLLUP_BATCH = 1000
+MAX_POINTS = 1500
+
+
+def retention(resolution):
+    return {
+        'minute': timedelta(hours=settings.RULE_METRICS_MINUTE_RETENTION_HOURS),
+        'hour': timedelta(days=settings.RULE_METRICS_HOUR_RETENTION_DAYS),
+        'day': timedelta(days=settings.RULE_METRICS_DAY_RETENTION_DAYS),
+    }[resolution]
+
+
+def bucket_floor(moment, resolution):
+    moment = moment.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if resolution in ('hour', 'day'):
+        moment = moment.replace(minute=0)
+    if resolution == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def latency_index(seconds):
+    for index, (_, bound) in enumerate(LATENCY_FIELDS):
+        if seconds <= bound:
+            return index
+    return len(LATENCY_FIELDS) - 1
+
+
+class MetricsHistory:
+    def __init__(self, flush_seconds=10):
+        self.flush_seconds = flush_seconds
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flusher = PeriodicFlusher(self.flush, flush_seconds, 'rule-metrics-flush')
+
+    def record(self, rule_id, triggered, seconds, error=False):
+        key = (rule_id, int(time.time()) // 60)
+        with self._lock:
+            values = self._pending.get(key)
+            if values is None:
+                values = self._pending[key] = [0] * len(COUNTER_FIELDS)
+            values[0] += 1
+            values[1] += bool(triggered)
+            values[2] += bool(error)
+            values[3] += seconds
+            values[LATENCY_OFFSET + latency_index(seconds)] += 1
+        self._flusher.ensure_started()
+
+    def flush(self):
+        """Add pending counts to the minute buckets; returns buckets written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            # Rules deleted since their evaluation would fail the foreign key
+            rule_ids = set(Rule.objects.filter(id__in={rule_id for rule_id, _ in pending}).values_list('id', flat=True))
+            written = 0
+            with transaction.atomic():
+                for (rule_id, minute), values in pending.items():
+                    if rule_id in rule_ids:
+                        self._add(rule_id, datetime.fromtimestamp(minute * 60, tz=dt_timezone.utc), values)
+                        written += 1
+        except Exception as e:
+            logger.error(f"Failed to write rule metrics history ({len(pending)} buckets dropped): {e}")
+            return 0
+        return written
+
+    def _add(self, rule_id, bucket_start, values):
+        bucket = RuleMetricsBucket.objects.filter(rule_id=rule_id, resolution='minute', bucket_start=bucket_start)
+        increments = {field: F(field) + value for field, value in zip(COUNTER_FIELDS, values) if value}
+        increments['rolled_up'] = False
+        if bucket.update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                RuleMetricsBucket.objects.create(
+                    rule_id=rule_id, resolution='minute', bucket_start=bucket_start,
+                    **dict(zip(COUNTER_FIELDS, values))
+                )
+        except IntegrityError:
+            # Another worker created the bucket in between
+            bucket.update(**increments)
+
+
+def downsample(now=None):
+    """Roll minutes into hours and hours into days, then apply retention. Returns per-tier stats"""
+    now = now or timezone.now()
+    stats = {}
+    for source, target, trunc in ROLLUPS:
+        stats[f'{target}_written'] = _rollup(source, target, trunc, bucket_floor(now - ROLLUP_GRACE, target))
+
+    for resolution in TIERS:
+        deleted, _ = RuleMetricsBucket.objects.filter(
+            resolution=resolution, bucket_start__lt=now - retention(resolution)
+        ).delete()
+        stats[f'{resolution}_deleted'] = deleted
+    return stats
+
+
+def _rollup(source, target, trunc, end):
+    """Recompute the target buckets before `end` that hold source rows written since the last rollup"""
+    dirty = RuleMetricsBucket.objects.filter(resolution=source, rolled_up=False, bucket_start__lt=end) \
+        .annotate(period=trunc('bucket_start', tzinfo=dt_timezone.utc))
+    ids, touched = [], set()
+    for bucket_id, rule_id, period in dirty.values_list('id', 'rule_id', 'period').iterator():
+        ids.append(bucket_id)
+        touched.add((rule_id, period))
+    if not touched:
+        return 0
+
+    # Marked before summing: a flush landing after this clears the flag again and is picked up next run
+    for offset in range(0, len(ids), ROLLUP_BATCH):
+        RuleMetricsBucket.objects.filter(id__in=ids[offset:offset + ROLLUP_BATCH]).update(rolled_up=True)
+
+    grouped = RuleMetricsBucket.objects.filter(
+        resolution=source,
+        rule_id__in={rule_id for rule_id, _ in touched},
+        bucket_start__gte=min(period for _, period in touched),
+        bucket_start__lt=end,
+    ).annotate(period=trunc('bucket_start', tzinfo=dt_timezone.utc)).values('rule_id', 'period') \
+        .annotate(**{f'sum_{field}': Sum(field) for field in COUNTER_FIELDS}).order_by()
+    buckets = [
+        RuleMetricsBucket(
+            rule_id=row['rule_id'], resolution=target, bucket_start=row['period'],
+            **{field: row[f'sum_{field}'] for field in COUNTER_FIELDS}
+        )
+        for row in grouped
+        if (row['rule_id'], row['period']) in touched
+    ]
+    RuleMetricsBucket.objects.bulk_create(
+        buckets,
+        batch_size=ROLLUP_BATCH,
+        update_conflicts=True,
+        unique_fields=['rule', 'resolution', 'bucket_start'],
+        update_fields=list(COUNTER_FIELDS) + ['rolled_up'],
+    )
+    return len(buckets)
+
+
+def choose_resolution(start, end, now=None):
+    """Finest tier that still holds [start, end) and needs at most MAX_POINTS buckets"""
+    now = now or timezone.now()
+    for resolution, size in TIERS.items():
+        if (end - start) / size <= MAX_POINTS and start >= now - retention(resolution):
+            return resolution
+    return 'day'
+
+
+def bucket_dict(row):
+    evaluations = row['evaluations']
+    latency = {name: row[name] for name, _ in LATENCY_FIELDS}
+    p95_ms = None
+    seen = 0
+    for name, bound in LATENCY_FIELDS:
+        seen += latency[name]
+        if evaluations and seen >= 0.95 * evaluations:
+            p95_ms = bound * 1000 if bound != math.inf else None
+            break
+    return {
+        'start': row['bucket_start'].isoformat(),
+        'evaluations': evaluations,
+        'triggers': row['triggers'],
+        'errors': row['errors'],
+        'trigger_ratio': round(row['triggers'] / evaluations, 4) if evaluations else 0,
+        'avg_ms': round(row['total_time'] / evaluations * 1000, 3) if evaluations else 0,
+        # Upper bound of the latency range holding the 95th percentile (None: above 250 ms)
+        'p95_ms': p95_ms,
+        'latency': latency,
+    }
+
+
+def query(start, end, resolution=None, rule_ids=None):
+    """Per-rule series of buckets in [start, end); ValueError for ranges a tier cannot serve"""
+    if end <= start:
+        raise ValueError('to must be after from')
+    resolution = resolution or choose_resolution(start, end)
+    if resolution not in TIERS:
+        raise ValueError(f'resolution must be one of {", ".join(TIERS)}')
+    if (end - start) / TIERS[resolution] > MAX_POINTS:
+        raise ValueError(f'More than {MAX_POINTS} {resolution} buckets per rule; use a coarser resolution')
+
+    rows = RuleMetricsBucket.objects.filter(
+        resolution=resolution, bucket_start__gte=bucket_floor(start, resolution), bucket_start__lt=end
+    ).order_by('rule_id', 'bucket_start')
+    if rule_ids:
+        rows = rows.filter(rule_id__in=rule_ids)
+
+    series = {}
+    for row in rows.values('rule_id', 'bucket_start', *COUNTER_FIELDS):
+        series.setdefault(row['rule_id'], []).append(bucket_dict(row))
+    return resolution, [{'rule_id': rule_id, 'buckets': buckets} for rule_id, buckets in series.items()]
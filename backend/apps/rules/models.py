@@ -1,6 +1,8 @@
 from django.db import models
 import json
+import zlib
 from django.core.serializers.json import DjangoJSONEncoder
+from .serialization import dumps, loads
 
 class RuleType(models.TextChoices):
     THRESHOLD = 'threshold', 'Threshold Rule'
@@ -13,6 +15,19 @@ class Rule(models.Model):
     condition = models.JSONField(help_text="JSON condition for the rule")
     threshold = models.FloatField(null=True, blank=True, help_text="Threshold value for threshold rules")
     active = models.BooleanField(default=True)
+    shadow = models.BooleanField(default=False, help_text="Evaluated on sampled live traffic without creating alerts")
+    tags = models.JSONField(
+        default=list, blank=True,
+        help_text='Labels such as "cheap" or "critical"; degraded evaluation runs only rules tagged with RULE_DEGRADED_TAGS'
+    )
+    suppression_window = models.PositiveIntegerField(
+        default=0,
+        help_text="Seconds; repeat hits for the same rule and key within this window are folded into one alert (0 disables)"
+    )
+    suppression_keys = models.JSONField(
+        default=list, blank=True,
+        help_text='Transaction fields forming the suppression key, e.g. ["user_id", "merchant_id"]'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -23,6 +38,40 @@ class Rule(models.Model):
     def __str__(self):
         return f"{self.name} ({self.type})"
 
+class TransactionPayload(models.Model):
+    """
+    Transaction data stored once per transaction_id, zlib-compressed JSON.
+    Alerts of the same transaction reference one payload row.
+    """
+    transaction_id = models.CharField(max_length=100, unique=True)
+    data = models.BinaryField()
+    raw_size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'transaction_payloads'
+    
+    @classmethod
+    def compress(cls, transaction_data):
+        raw = dumps(transaction_data)
+        return zlib.compress(raw, 6), len(raw)
+    
+    @classmethod
+    def store(cls, transaction_id, transaction_data):
+        """Payload row for a transaction, created on first use"""
+        data, raw_size = cls.compress(transaction_data)
+        payload, _ = cls.objects.get_or_create(
+            transaction_id=transaction_id,
+            defaults={'data': data, 'raw_size': raw_size}
+        )
+        return payload
+    
+    def decode(self):
+        return loads(zlib.decompress(bytes(self.data)))
+    
+    def __str__(self):
+        return f"Payload for {self.transaction_id}"
+
 class Alert(models.Model):
     SEVERITY_CHOICES = [
         ('low', 'Low'),
@@ -35,7 +84,13 @@ class Alert(models.Model):
     transaction_id = models.CharField(max_length=100, db_index=True)
     reason = models.TextField()
     severity = models.CharField(max_length=20, choices=SEVERITY_CHOICES, default='medium')
-    transaction_data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    payload = models.ForeignKey(TransactionPayload, null=True, blank=True, on_delete=models.SET_NULL, related_name='alerts')
+    # Inline copy of the transaction; only alerts written before payloads were deduplicated have it
+    legacy_transaction_data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, db_column='transaction_data')
+    # Hits folded into this alert by suppression (1 for unsuppressed rules)
+    hit_count = models.PositiveIntegerField(default=1)
+    first_seen = models.DateTimeField(null=True, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -43,15 +98,52 @@ class Alert(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['transaction_id', 'created_at']),
+            # Admin and API lists filtered by rule, newest first
+            models.Index(fields=['rule', '-created_at']),
         ]
     
+    @property
+    def transaction_data(self):
+        """Transaction payload from the shared store, or the legacy inline copy"""
+        if self.payload_id is None:
+            return self.legacy_transaction_data
+        cached = getattr(self, '_transaction_data', None)
+        if cached is None:
+            cached = self._transaction_data = self.payload.decode()
+        return cached
+    
+    @transaction_data.setter
+    def transaction_data(self, value):
+        self.legacy_transaction_data = value
+    
     def __str__(self):
         return f"Alert {self.id} for {self.transaction_id}"
 
+class RuleChange(models.Model):
+    """Append-only log of rule changes; the newest id is the rule-set version"""
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+    ]
+    
+    rule_id = models.BigIntegerField(db_index=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'rule_changes'
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"Rule {self.rule_id} {self.action}"
+
 class RuleMetrics(models.Model):
     rule = models.ForeignKey(Rule, on_delete=models.CASCADE, related_name='metrics')
     evaluations_count = models.PositiveIntegerField(default=0)
     triggers_count = models.PositiveIntegerField(default=0)
+    # Evaluations that raised or timed out; they are not in avg_processing_time
+    errors_count = models.PositiveIntegerField(default=0)
     avg_processing_time = models.FloatField(default=0.0)
     last_evaluated = models.DateTimeField(auto_now=True)
     
@@ -60,4 +152,47 @@ class RuleMetrics(models.Model):
         verbose_name_plural = 'Rule Metrics'
     
     def __str__(self):
-        return f"Metrics for {self.rule.name}"
\ No newline at end of file
+        return f"Metrics for {self.rule.name}"
+
+class RuleMetricsBucket(models.Model):
+    """
+    Per-rule counters for one time bucket (minute, hour or day).
+    Latency is kept as counts per fixed range (le_1ms ... gt_250ms), so
+    buckets add up exactly when rolled into coarser tiers.
+    """
+    RESOLUTION_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    
+    rule = models.ForeignKey(Rule, on_delete=models.CASCADE, related_name='metric_buckets')
+    resolution = models.CharField(max_length=6, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    evaluations = models.PositiveIntegerField(default=0)
+    triggers = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    total_time = models.FloatField(default=0.0, help_text="Seconds")
+    le_1ms = models.PositiveIntegerField(default=0)
+    le_5ms = models.PositiveIntegerField(default=0)
+    le_10ms = models.PositiveIntegerField(default=0)
+    le_25ms = models.PositiveIntegerField(default=0)
+    le_50ms = models.PositiveIntegerField(default=0)
+    le_100ms = models.PositiveIntegerField(default=0)
+    le_250ms = models.PositiveIntegerField(default=0)
+    gt_250ms = models.PositiveIntegerField(default=0)
+    # Cleared on every write; downsampling recomputes the coarser buckets of cleared rows
+    rolled_up = models.BooleanField(default=False)
+    
+    class Meta:
+        db_table = 'rule_metrics_buckets'
+        constraints = [
+            models.UniqueConstraint(fields=['rule', 'resolution', 'bucket_start'], name='unique_rule_metrics_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket_start']),
+            models.Index(fields=['resolution', 'rolled_up', 'bucket_start']),
+        ]
+    
+    def __str__(self):
+        return f"Rule {self.rule_id} {self.resolution} {self.bucket_start:%Y-%m-%d %H:%M}"
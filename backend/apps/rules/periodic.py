@@ -0,0 +1,52 @@
+"""
+Background flushing of per-process write buffers.
+
+AlertSuppressor and MetricsHistory keep counts in memory and write them in
+batches. A PeriodicFlusher calls their flush() from a daemon thread every
+interval, so counts reach the database while a worker is idle too, not only
+when the next request arrives. The thread is started on first buffered write
+in each process (a buffer created before a fork gets a thread per child) and
+only holds a weak reference, so it ends once its buffer is discarded.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher:
+    def __init__(self, flush, interval, name):
+        self.interval = interval
+        self.name = name
+        self._flush = weakref.WeakMethod(flush)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Cheap to call on every buffered write; interval <= 0 leaves flushing to the caller"""
+        pid = os.getpid()
+        if self._pid == pid or self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid != pid:
+                threading.Thread(target=self._run, name=self.name, daemon=True).start()
+                self._pid = pid
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            flush = self._flush()
+            if flush is None:
+                return
+            try:
+                flush()
+            except Exception as e:
+                logger.error(f"Background flush {self.name} failed: {e}")
+            finally:
+                del flush
+                close_old_connections()
@@ -0,0 +1,364 @@
+"""
+Per-user behavioural profiles for anomaly conditions.
+
+Running statistics per user, updated in O(1) after every evaluation:
+amount count/mean/M2 (Welford), a 24-bucket hour histogram and a home
+country (majority vote). Users are interned to a dense slot number and every
+statistic is a column in one flat buffer, so a profile costs ~50 bytes plus
+its index entry instead of a dict of Python objects.
+
+The buffer checkpoints to a file with the same layout. On restart the file
+is mapped copy-on-write, so only the user index is rebuilt; column pages are
+read lazily. Each worker process keeps its own store and sees the traffic
+routed to it. Its periodic checkpoints merge what it observed since the
+previous one into the file (under flock), so the file accumulates the traffic
+of all workers instead of holding whichever worker wrote last.
+"""
+import fcntl
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Version 2 stores user keys and countries as JSON arrays: keys come from clients and may
+# contain any separator. Version 1 (newline-joined) checkpoints are still read.
+MAGIC = b'FRDPROF2'
+MAGIC_V1 = b'FRDPROF1'
+HEADER = struct.Struct('<8sQQQQ')  # magic, capacity, users, keys bytes, countries bytes
+
+HOURS = 24
+HOUR_MAX = 255
+NO_COUNTRY = 0xFFFF
+# Initial capacity of the per-checkpoint store of new observations; it grows as needed
+DELTA_CAPACITY = 1024
+
+# (name, typecode, width): one column of `capacity` items each
+COLUMNS = (
+    ('count', 'I', 1),
+    ('mean', 'd', 1),
+    ('m2', 'd', 1),
+    ('hours', 'B', HOURS),
+    ('country', 'H', 1),
+    ('votes', 'H', 1),
+)
+ITEM_SIZES = {'I': 4, 'd': 8, 'B': 1, 'H': 2}
+
+
+def _layout(capacity):
+    """Column offsets inside the buffer; columns start 8-byte aligned"""
+    offsets = {}
+    offset = 0
+    for name, typecode, width in COLUMNS:
+        offsets[name] = offset
+        size = capacity * width * ITEM_SIZES[typecode]
+        offset += (size + 7) // 8 * 8
+    return offsets, offset
+
+
+class UserProfileStore:
+    def __init__(self, capacity=100_000, buffer=None, users=(), countries=()):
+        self.capacity = capacity
+        self._offsets, size = _layout(capacity)
+        self._buffer = buffer if buffer is not None else mmap.mmap(-1, max(size, 1))
+        self._bind()
+        self._users = {user: slot for slot, user in enumerate(users)}
+        self._countries = list(countries)
+        self._country_ids = {code: index for index, code in enumerate(self._countries)}
+        self._lock = threading.Lock()
+        self._checkpoint_path = None
+        self._checkpoint_interval = None
+        self._next_checkpoint = None
+        self._checkpointing = False
+        # Observations not yet merged into the checkpoint (only with enable_checkpoints)
+        self._delta = None
+
+    def _bind(self):
+        view = memoryview(self._buffer)
+        for name, typecode, width in COLUMNS:
+            start = self._offsets[name]
+            end = start + self.capacity * width * ITEM_SIZES[typecode]
+            setattr(self, f'_{name}', view[start:end].cast(typecode))
+
+    def __len__(self):
+        return len(self._users)
+
+    # Updates
+
+    def _slot(self, user_id):
+        slot = self._users.get(user_id)
+        if slot is None:
+            slot = len(self._users)
+            if slot >= self.capacity:
+                self._grow()
+            self._users[user_id] = slot
+            self._country[slot] = NO_COUNTRY
+        return slot
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        offsets, size = _layout(capacity)
+        buffer = mmap.mmap(-1, size)
+        for name, typecode, width in COLUMNS:
+            data = getattr(self, f'_{name}').tobytes()
+            buffer[offsets[name]:offsets[name] + len(data)] = data
+        self.capacity, self._offsets, self._buffer = capacity, offsets, buffer
+        self._bind()
+        logger.info(f"User profile store grown to {capacity} users")
+
+    def _country_id(self, country):
+        country_id = self._country_ids.get(country)
+        if country_id is None and len(self._countries) < NO_COUNTRY:
+            country_id = self._country_ids[country] = len(self._countries)
+            self._countries.append(country)
+        return country_id
+
+    def observe(self, user_id, amount, hour=None, country=None):
+        """Add one transaction to the user's profile; non-finite amounts are ignored"""
+        if not math.isfinite(amount):
+            # A single NaN would poison the mean and M2 for good
+            return
+        with self._lock:
+            slot = self._slot(user_id)
+
+            count = self._count[slot] + 1
+            delta = amount - self._mean[slot]
+            self._count[slot] = count
+            self._mean[slot] += delta / count
+            self._m2[slot] += delta * (amount - self._mean[slot])
+
+            if hour is not None:
+                base = slot * HOURS
+                if self._hours[base + hour] == HOUR_MAX:
+                    # Halve the histogram: keeps proportions and favours recent behaviour
+                    for index in range(base, base + HOURS):
+                        self._hours[index] >>= 1
+                self._hours[base + hour] += 1
+
+            if country:
+                country_id = self._country_id(country)
+                if country_id is not None:
+                    # Boyer-Moore majority vote
+                    if self._country[slot] == country_id:
+                        self._votes[slot] = min(self._votes[slot] + 1, 0xFFFF)
+                    elif self._votes[slot] == 0:
+                        self._country[slot] = country_id
+                        self._votes[slot] = 1
+                    else:
+                        self._votes[slot] -= 1
+
+            if self._delta is not None:
+                self._delta.observe(user_id, amount, hour, country)
+
+    def merge(self, other):
+        """Add the statistics of another store (e.g. a worker's recent observations) to this one"""
+        with other._lock:
+            users = list(other._users.items())
+        with self._lock:
+            for user_id, source in users:
+                if not (math.isfinite(other._mean[source]) and math.isfinite(other._m2[source])):
+                    continue
+                slot = self._slot(user_id)
+
+                # Chan et al.: combine two Welford states
+                count_a, count_b = self._count[slot], other._count[source]
+                count = count_a + count_b
+                if count_b:
+                    delta = other._mean[source] - self._mean[slot]
+                    self._m2[slot] += other._m2[source] + delta * delta * count_a * count_b / count
+                    self._mean[slot] += delta * count_b / count
+                    self._count[slot] = count
+
+                base, other_base = slot * HOURS, source * HOURS
+                hours = [self._hours[base + hour] + other._hours[other_base + hour] for hour in range(HOURS)]
+                while max(hours) > HOUR_MAX:
+                    hours = [value >> 1 for value in hours]
+                self._hours[base:base + HOURS] = bytes(hours)
+
+                if other._country[source] != NO_COUNTRY:
+                    country_id = self._country_id(other._countries[other._country[source]])
+                    votes = other._votes[source]
+                    if country_id is None:
+                        continue
+                    # Majority vote states merge like two runs of the vote
+                    if self._country[slot] == country_id:
+                        self._votes[slot] = min(self._votes[slot] + votes, 0xFFFF)
+                    elif self._votes[slot] >= votes:
+                        self._votes[slot] -= votes
+                    else:
+                        self._country[slot] = country_id
+                        self._votes[slot] = votes - self._votes[slot]
+
+    # Reads
+
+    def stats(self, user_id):
+        slot = self._users.get(user_id)
+        if slot is None:
+            return None
+        count = self._count[slot]
+        return {
+            'count': count,
+            'mean': self._mean[slot],
+            'std': math.sqrt(self._m2[slot] / (count - 1)) if count > 1 else 0.0,
+            'home_country': self.home_country(user_id),
+            'hours': list(self._hours[slot * HOURS:(slot + 1) * HOURS]),
+        }
+
+    def zscore(self, user_id, amount, min_count=5):
+        """Standard score of amount against the user's history; None without enough history"""
+        slot = self._users.get(user_id)
+        if slot is None:
+            return None
+        count = self._count[slot]
+        if count < max(min_count, 2):
+            return None
+        std = math.sqrt(self._m2[slot] / (count - 1))
+        if std == 0:
+            return None
+        return (amount - self._mean[slot]) / std
+
+    def hour_share(self, user_id, hour, min_count=5):
+        """Share of the user's transactions in this hour; None without enough history"""
+        slot = self._users.get(user_id)
+        if slot is None or self._count[slot] < min_count:
+            return None
+        hours = self._hours[slot * HOURS:(slot + 1) * HOURS]
+        total = sum(hours)
+        return hours[hour] / total if total else None
+
+    def home_country(self, user_id):
+        slot = self._users.get(user_id)
+        if slot is None:
+            return None
+        country_id = self._country[slot]
+        return None if country_id == NO_COUNTRY else self._countries[country_id]
+
+    # Checkpoints
+
+    def checkpoint(self, path):
+        """Replace the checkpoint at `path` with this store; returns False if another process holds the lock"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(f"{path}.lock", 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            count = self._write(path)
+        logger.info(f"Checkpointed {count} user profiles to {path}")
+        return True
+
+    def merge_into(self, path):
+        """Merge observations made since the last merge into the checkpoint at `path`; returns users merged"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(f"{path}.lock", 'a') as lock_file:
+            # Blocking: every worker's merge has to land, and each one is short
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                delta, self._delta = self._delta, UserProfileStore(DELTA_CAPACITY)
+            if not len(delta):
+                return 0
+            try:
+                merged = UserProfileStore.load(path, capacity=self.capacity)
+                merged.merge(delta)
+                merged._write(path)
+            except BaseException:
+                # Keep the observations for the next attempt
+                self._delta.merge(delta)
+                raise
+        logger.info(f"Merged {len(delta)} user profiles into {path}")
+        return len(delta)
+
+    def _write(self, path):
+        """Atomically write the store to `path`; the caller holds the checkpoint lock"""
+        directory = os.path.dirname(os.path.abspath(path))
+        with self._lock:
+            users = list(self._users)
+            keys = json.dumps(users, ensure_ascii=False).encode('utf-8')
+            countries = json.dumps(self._countries, ensure_ascii=False).encode('utf-8')
+            columns = bytes(self._buffer[:_layout(self.capacity)[1]])
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.profiles-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, self.capacity, len(users), len(keys), len(countries)))
+                f.write(columns)
+                f.write(keys)
+                f.write(countries)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return len(users)
+
+    def enable_checkpoints(self, path, interval):
+        """Track new observations and merge them into `path` every `interval` seconds (see maybe_checkpoint)"""
+        self._checkpoint_path = path
+        self._checkpoint_interval = interval
+        self._next_checkpoint = time.monotonic() + interval
+        with self._lock:
+            if self._delta is None:
+                self._delta = UserProfileStore(DELTA_CAPACITY)
+
+    def maybe_checkpoint(self):
+        """Start a background checkpoint when one is due; cheap to call on every request"""
+        if self._next_checkpoint is None or time.monotonic() < self._next_checkpoint or self._checkpointing:
+            return
+        self._checkpointing = True
+        self._next_checkpoint = time.monotonic() + self._checkpoint_interval
+        threading.Thread(target=self._checkpoint_in_background, name='profile-checkpoint', daemon=True).start()
+
+    def _checkpoint_in_background(self):
+        try:
+            self.merge_into(self._checkpoint_path)
+        except OSError as e:
+            logger.error(f"User profile checkpoint failed: {e}")
+        finally:
+            self._checkpointing = False
+
+    @classmethod
+    def load(cls, path, capacity=100_000):
+        """Store from a checkpoint (copy-on-write mapping), or an empty one if there is none"""
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(HEADER.size)
+                magic, stored_capacity, users, keys_size, countries_size = HEADER.unpack(header)
+                if magic not in (MAGIC, MAGIC_V1):
+                    raise ValueError('not a profile checkpoint')
+                _, size = _layout(stored_capacity)
+                f.seek(HEADER.size + size)
+                keys = f.read(keys_size).decode('utf-8')
+                countries = f.read(countries_size).decode('utf-8')
+                if magic == MAGIC:
+                    keys, countries = json.loads(keys), json.loads(countries)
+                else:
+                    keys = keys.split('\n') if users else []
+                    countries = countries.split('\n') if countries_size else []
+                if len(keys) != users or len(set(keys)) != users:
+                    raise ValueError('user index does not match the header')
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except FileNotFoundError:
+            return cls(capacity)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable user profile checkpoint {path}: {e}")
+            return cls(capacity)
+
+        # Old column views stay valid for readers racing with a grow; they are not released
+        buffer = memoryview(mapped)[HEADER.size:HEADER.size + size]
+        store = cls(
+            stored_capacity,
+            buffer=buffer,
+            users=keys,
+            countries=countries,
+        )
+        logger.info(f"Loaded {len(store)} user profiles from {path}")
+        return store
+
@@ -0,0 +1,308 @@
+"""
+Opt-in profiling of evaluate requests.
+
+A profiled request records wall time per phase (parse, validate, rule_eval,
+ml_scoring, metrics_write, alert_write, serialize) and per rule, and is
+sampled by a background thread that walks the request thread's stack every
+few milliseconds. Samples are written as folded stacks (one
+`frame;frame;frame count` line per distinct stack), the input format of
+flamegraph.pl / speedscope / inferno; files from many requests can simply be
+concatenated.
+
+Profiling is triggered per request by the X-Rule-Profile header (must match
+RULE_PROFILE_TOKEN), by the RULE_PROFILE_SAMPLE_RATE fraction, or by the
+admin toggle (a small file under RULE_PROFILE_DIR shared by all workers).
+Unprofiled requests pay for one header lookup and a cached toggle check.
+"""
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_RULE_PROFILE'
+TOGGLE_FILE = 'enabled.json'
+MAX_STACK_DEPTH = 128
+
+# Toggle file is re-read at most this often per process
+TOGGLE_CHECK_SECONDS = 1.0
+
+
+class _Phase:
+    __slots__ = ('profile', 'name', 'started', 'previous')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.previous = self.profile.current
+        self.profile.current = self.name
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        phases = self.profile.phases
+        phases[self.name] = phases.get(self.name, 0.0) + elapsed
+        self.profile.current = self.previous
+
+
+class RequestProfile:
+    """Phase timings and stack samples for one request"""
+
+    def __init__(self, label, trigger):
+        self.label = label
+        self.trigger = trigger
+        self.phases = {}
+        self.rules = {}
+        self.current = 'request'
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+        self.total = None
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def rule(self, rule, seconds):
+        self.rules[rule.id] = self.rules.get(rule.id, 0.0) + seconds
+
+    def set_label(self, label):
+        self.label = label
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def as_dict(self):
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        return {
+            'trigger': self.trigger,
+            'total_ms': round(total * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+            'rules_ms': {rule_id: round(seconds * 1000, 3) for rule_id, seconds in self.rules.items()},
+            'samples': sum(self.stacks.values()),
+        }
+
+    def server_timing(self):
+        """Server-Timing header value (durations in ms)"""
+        return ', '.join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.phases.items())
+
+
+class _NullProfile:
+    """Stand-in used when a request is not profiled; every call is a no-op"""
+
+    _phase = nullcontext()
+
+    def phase(self, name):
+        return self._phase
+
+    def rule(self, rule, seconds):
+        pass
+
+    def set_label(self, label):
+        pass
+
+
+NULL_PROFILE = _NullProfile()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+
+
+class StackSampler:
+    """
+    One daemon thread per process samples the stacks of all threads with an
+    active profile. It sleeps on an event while nothing is being profiled.
+    Sampling needs the GIL, so the effective interval is never shorter than
+    sys.getswitchinterval().
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, profile, thread_id=None):
+        self._active[thread_id or threading.get_ident()] = profile
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                    self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, thread_id=None):
+        self._active.pop(thread_id or threading.get_ident(), None)
+
+    def sample(self):
+        frames = sys._current_frames()
+        for thread_id, profile in list(self._active.items()):
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            names.append(f"phase:{profile.current}")
+            names.reverse()
+            profile.stacks[';'.join(names)] += 1
+
+    def _run(self):
+        while True:
+            if not self._active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            self.sample()
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """Writes folded stacks and phase summaries to a directory, keeping the newest max_files"""
+
+    def __init__(self, directory, max_files=500):
+        self.directory = directory
+        self.max_files = max_files
+        self._sequence = itertools.count()
+
+    def write(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        label = ''.join(char if char.isalnum() or char in '-_' else '_' for char in str(profile.label))[:64]
+        base = os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._sequence)}-{label}")
+
+        with open(f"{base}.folded", 'w') as handle:
+            for stack, count in profile.stacks.items():
+                handle.write(f"{stack} {count}\n")
+        with open(f"{base}.json", 'w') as handle:
+            json.dump(dict(profile.as_dict(), label=profile.label), handle)
+
+        self._prune()
+        return f"{base}.folded"
+
+    def _prune(self):
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith('.folded'))
+        except OSError:
+            return
+        for name in names[:max(0, len(names) - self.max_files)]:
+            for suffix in ('.folded', '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, name[:-len('.folded')] + suffix))
+                except OSError:
+                    pass
+
+
+class ProfilingToggle:
+    """
+    Admin switch shared by all workers: a JSON file with an expiry time and a
+    sample rate. Read at most once per TOGGLE_CHECK_SECONDS.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, TOGGLE_FILE)
+        self._checked_at = -TOGGLE_CHECK_SECONDS
+        self._state = None
+
+    def state(self):
+        now = time.monotonic()
+        if now - self._checked_at >= TOGGLE_CHECK_SECONDS:
+            self._checked_at = now
+            try:
+                with open(self.path) as handle:
+                    self._state = json.load(handle)
+            except (OSError, ValueError):
+                self._state = None
+        state = self._state
+        if state is None or state.get('until', 0) < time.time():
+            return None
+        return state
+
+    def enable(self, seconds, sample_rate):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        state = {'until': time.time() + seconds, 'sample_rate': sample_rate}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as handle:
+            json.dump(state, handle)
+        os.replace(tmp_path, self.path)
+        self._checked_at = -TOGGLE_CHECK_SECONDS
+        return state
+
+    def disable(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._checked_at = -TOGGLE_CHECK_SECONDS
+
+
+class Profiler:
+    def __init__(self, directory, token='', sample_rate=0.0, interval=0.001, max_files=500):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.sampler = StackSampler(interval)
+        self.store = ProfileStore(directory, max_files)
+        self.toggle = ProfilingToggle(directory)
+
+    def trigger_for(self, request):
+        """Why this request should be profiled ('header', 'sampled', 'toggle'), or None"""
+        header = request.META.get(PROFILE_HEADER)
+        if header and self.token and header == self.token:
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sampled'
+        state = self.toggle.state()
+        if state is not None and random.random() < state.get('sample_rate', 1.0):
+            return 'toggle'
+        return None
+
+    def begin(self, request, label=''):
+        """RequestProfile for a request that should be profiled, else None"""
+        trigger = self.trigger_for(request)
+        if trigger is None:
+            return None
+        profile = RequestProfile(label, trigger)
+        self.sampler.start(profile)
+        return profile
+
+    def end(self, profile):
+        self.sampler.stop()
+        profile.finish()
+        try:
+            path = self.store.write(profile)
+        except OSError as e:
+            logger.error(f"Failed to write request profile: {e}")
+            return None
+        logger.info(f"Profiled request {profile.label} ({profile.trigger}): {profile.total * 1000:.1f}ms, {path}")
+        return path
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = Profiler(
+                    settings.RULE_PROFILE_DIR,
+                    token=settings.RULE_PROFILE_TOKEN,
+                    sample_rate=settings.RULE_PROFILE_SAMPLE_RATE,
+                    interval=settings.RULE_PROFILE_INTERVAL_MS / 1000,
+                    max_files=settings.RULE_PROFILE_MAX_FILES,
+                )
+    return _profiler
@@ -0,0 +1,211 @@
+"""
+Latency protection for rule evaluation.
+
+A per-evaluation latency budget, per-rule timeouts for rule types that may
+block (ML scoring, external lookups), a per-rule circuit breaker that
+temporarily skips rules which keep failing or running slow, and admission
+control with a degraded mode for the evaluate endpoint.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class RuleTimeout(Exception):
+    """Rule did not finish within its timeout"""
+
+
+class Overloaded(Exception):
+    """No evaluation slot became free within the queue timeout"""
+
+
+class LatencyBudget:
+    """Deadline for a single transaction evaluation"""
+
+    __slots__ = ('deadline',)
+
+    def __init__(self, budget_seconds):
+        self.deadline = time.perf_counter() + budget_seconds
+
+    def remaining(self):
+        return self.deadline - time.perf_counter()
+
+    def exhausted(self):
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """
+    Per-rule circuit breaker.
+
+    After `failure_threshold` consecutive failures (errors, timeouts or slow
+    runs) the rule's circuit opens and the rule is skipped for
+    `reset_timeout` seconds. Then a single trial evaluation is let through:
+    success closes the circuit, another failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._lock = threading.Lock()
+
+    def allow(self, rule_id):
+        opened_at = self._opened_at.get(rule_id)
+        if opened_at is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            opened_at = self._opened_at.get(rule_id)
+            if opened_at is None:
+                return True
+            if now - opened_at < self.reset_timeout:
+                return False
+            # Half-open: let this call through, keep others out until it reports back
+            self._opened_at[rule_id] = now
+            return True
+
+    def record_success(self, rule_id):
+        if rule_id not in self._failures and rule_id not in self._opened_at:
+            return
+        with self._lock:
+            self._failures.pop(rule_id, None)
+            self._opened_at.pop(rule_id, None)
+
+    def record_failure(self, rule_id):
+        with self._lock:
+            failures = self._failures.get(rule_id, 0) + 1
+            self._failures[rule_id] = failures
+            if failures >= self.failure_threshold:
+                self._opened_at[rule_id] = time.monotonic()
+
+    def open_rules(self):
+        now = time.monotonic()
+        return [rule_id for rule_id, opened_at in list(self._opened_at.items())
+                if now - opened_at < self.reset_timeout]
+
+
+class IsolatedRunner:
+    """
+    Runs potentially blocking rule evaluations on a bounded thread pool so the
+    caller can stop waiting after a timeout. A timed-out evaluation keeps its
+    thread until it returns; the circuit breaker stops new ones piling up.
+    """
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rule-eval')
+
+    def run(self, func, timeout, *args):
+        future = self._executor.submit(func, *args)
+        try:
+            return future.result(timeout=max(timeout, 0))
+        except FutureTimeoutError:
+            future.cancel()
+            raise RuleTimeout()
+
+
+class Admission:
+    """One admitted request: time spent queued and the mode it runs in"""
+
+    __slots__ = ('queue_ms', 'degraded')
+
+    def __init__(self, queue_ms, degraded):
+        self.queue_ms = queue_ms
+        self.degraded = degraded
+
+
+class AdmissionController:
+    """
+    Bounded concurrency plus an automatic degraded mode.
+
+    At most `max_in_flight` evaluations run at once per process. A request
+    waits up to `queue_timeout` seconds for a slot and is refused (Overloaded)
+    after that, so excess load gets a fast rejection instead of making every
+    request slow. Queue time (plus time spent upstream, when the proxy reports
+    it) and service time feed an exponentially weighted average: above
+    `degrade_ms` new requests run degraded, and normal mode returns once the
+    average has stayed below `recover_ms` for `recover_seconds`. Each sample
+    counts at most `sample_cap_ms` (default twice `degrade_ms`), so a single
+    outlier cannot switch the mode; sustained slowness still does.
+    """
+
+    def __init__(self, max_in_flight=32, queue_timeout=0.05, degrade_ms=80.0, recover_ms=40.0,
+                 recover_seconds=10.0, alpha=0.1, sample_cap_ms=None):
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.degrade_ms = degrade_ms
+        self.recover_ms = recover_ms
+        self.recover_seconds = recover_seconds
+        self.alpha = alpha
+        self.sample_cap_ms = sample_cap_ms if sample_cap_ms is not None else 2 * degrade_ms
+        self.degraded = False
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.queue_ms = 0.0
+        self.latency_ms = 0.0
+        self._recovering_since = None
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, upstream_ms=0.0):
+        """Hold an evaluation slot for the block; raises Overloaded when none frees up in time"""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            self._observe(upstream_ms + self.queue_timeout * 1000, 0.0)
+            raise Overloaded()
+
+        queued = time.perf_counter()
+        admission = Admission(upstream_ms + (queued - start) * 1000, self.degraded)
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+        try:
+            yield admission
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+            self._observe(admission.queue_ms, (time.perf_counter() - queued) * 1000)
+
+    def _observe(self, queue_ms, service_ms):
+        now = time.monotonic()
+        latency_ms = min(queue_ms + service_ms, self.sample_cap_ms)
+        queue_ms = min(queue_ms, self.sample_cap_ms)
+        with self._lock:
+            self.queue_ms += self.alpha * (queue_ms - self.queue_ms)
+            self.latency_ms += self.alpha * (latency_ms - self.latency_ms)
+
+            if not self.degraded:
+                if self.latency_ms > self.degrade_ms:
+                    self.degraded = True
+                    self._recovering_since = None
+                    logger.warning(f"Entering degraded evaluation mode: average latency {self.latency_ms:.1f} ms")
+            elif self.latency_ms >= self.recover_ms:
+                self._recovering_since = None
+            elif self._recovering_since is None:
+                self._recovering_since = now
+            elif now - self._recovering_since >= self.recover_seconds:
+                self.degraded = False
+                self._recovering_since = None
+                logger.info(f"Leaving degraded evaluation mode: average latency {self.latency_ms:.1f} ms")
+
+    def stats(self):
+        return {
+            'degraded': self.degraded,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'avg_queue_ms': round(self.queue_ms, 2),
+            'avg_latency_ms': round(self.latency_ms, 2),
+        }
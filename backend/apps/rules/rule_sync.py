@@ -0,0 +1,138 @@
+"""
+Versioned rule reads for gateways and sidecars that sync the rule set.
+
+Every create, update or delete of a Rule appends a RuleChange row (signal
+receivers below); the id of the newest row is the rule-set version. Rule
+read endpoints use it as an ETag, so an unchanged rule set costs one indexed
+MAX() query and a 304. The encoded rule list is cached in memory per version,
+and `changes_since(version)` returns only the rules touched after a version
+the client already has.
+
+A version must only become visible once everything below it is committed,
+or a client could skip a change that commits later with a lower id. The
+RuleChange row is therefore written after the rule's transaction commits,
+in its own transaction that holds an exclusive lock on the table on
+PostgreSQL, so rows commit in id order (SQLite serializes writers anyway).
+
+Changes made with QuerySet.update() bypass signals and are not versioned;
+rule edits go through save() (views, admin).
+"""
+import threading
+from functools import partial
+
+from django.db import connections, transaction
+from django.db.models import Max
+
+from .models import Rule, RuleChange
+from .serialization import dumps
+
+
+def current_version():
+    return RuleChange.objects.aggregate(version=Max('id'))['version'] or 0
+
+
+def etag_for(version, scope='rules'):
+    return f'"{scope}-v{version}"'
+
+
+def if_none_match(request, etag):
+    """True when the client's cached copy (If-None-Match) is still current"""
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return header == '*' or etag in (value.strip() for value in header.split(','))
+
+
+def with_version_headers(response, etag, version):
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    response['X-Rule-Set-Version'] = str(version)
+    return response
+
+
+def rule_as_dict(rule):
+    return {
+        'id': rule.id,
+        'name': rule.name,
+        'type': rule.type,
+        'condition': rule.condition,
+        'threshold': rule.threshold,
+        'active': rule.active,
+        'shadow': rule.shadow,
+        'tags': rule.tags,
+        'suppression_window': rule.suppression_window,
+        'suppression_keys': rule.suppression_keys,
+        'created_at': rule.created_at.isoformat(),
+        'updated_at': rule.updated_at.isoformat(),
+    }
+
+
+class RuleListCache:
+    """Encoded response body of the active rule list, kept for the latest version only"""
+
+    def __init__(self):
+        self._version = None
+        self._body = None
+        self._lock = threading.Lock()
+
+    def body(self, version):
+        if self._version == version:
+            return self._body
+
+        rules_data = [rule_as_dict(rule) for rule in Rule.objects.filter(active=True)]
+        body = dumps({
+            'status': 'success',
+            'data': {
+                'rules': rules_data,
+                'total_count': len(rules_data),
+                'version': version,
+            }
+        })
+        # A change that landed while the list was read would be tagged with the
+        # old version; only cache when the version did not move
+        if current_version() == version:
+            with self._lock:
+                self._version, self._body = version, body
+        return body
+
+
+rule_list_cache = RuleListCache()
+
+
+def changes_since(version):
+    """
+    Rules changed after `version`: upserted (active, current state) and
+    removed (deleted or deactivated) rule IDs
+    """
+    latest = {}
+    for rule_id, action in RuleChange.objects.filter(id__gt=version).order_by('id').values_list('rule_id', 'action'):
+        latest[rule_id] = action
+
+    rules = {rule.id: rule for rule in Rule.objects.filter(id__in=list(latest))}
+    upserted, removed = [], []
+    for rule_id in sorted(latest):
+        rule = rules.get(rule_id)
+        if rule is None or not rule.active:
+            removed.append(rule_id)
+        else:
+            upserted.append(rule_as_dict(rule))
+    return upserted, removed
+
+
+def record_change(rule_id, action, using='default'):
+    """Append a RuleChange; ids commit in order, so MAX(id) never skips an uncommitted change"""
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {RuleChange._meta.db_table} IN EXCLUSIVE MODE')
+        RuleChange.objects.using(using).create(rule_id=rule_id, action=action)
+
+
+def record_rule_saved(sender, instance, created, using='default', **kwargs):
+    """post_save receiver for Rule; the change is recorded once the save commits"""
+    action = 'created' if created else 'updated'
+    transaction.on_commit(partial(record_change, instance.id, action, using), using=using)
+
+
+def record_rule_deleted(sender, instance, using='default', **kwargs):
+    """post_delete receiver for Rule; the change is recorded once the delete commits"""
+    transaction.on_commit(partial(record_change, instance.id, 'deleted', using), using=using)
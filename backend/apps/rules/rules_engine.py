@@ -1,7 +1,23 @@
+import atexit
 import json
+import os
+import threading
+import time
 from datetime import datetime
+from django.conf import settings
 from django.utils import timezone
-from .models import Rule, Alert, RuleMetrics
+from .models import Rule, Alert, RuleMetrics, RuleType, TransactionPayload
+from . import snapshot as rule_snapshot
+from .compiler import CompiledRuleSet
+from .metrics_history import MetricsHistory
+from .profiles import UserProfileStore
+from .profiling import NULL_PROFILE
+from .resilience import AdmissionController, CircuitBreaker, IsolatedRunner, LatencyBudget, RuleTimeout
+from .shadow import ShadowEvaluator
+from .shared_counters import SharedCounters
+from .suppression import AlertSuppressor
+from .text_match import text_of, text_patterns
+from .value_lists import get_value_lists
 import logging
 
 logger = logging.getLogger(__name__)
@@ -46,58 +62,228 @@ class MLService:
         
         return min(base_prob, 0.95)
 
+class EvaluationResult:
+    """Outcome of evaluating one transaction: created alerts and skipped rules"""
+    
+    def __init__(self, degraded=False):
+        self.alerts = []
+        self.skipped_rules = []
+        self.degraded = degraded
+    
+    def skip(self, rule, reason):
+        self.skipped_rules.append({'rule_id': rule.id, 'rule_name': rule.name, 'reason': reason})
+
 class RuleEngine:
-    def __init__(self):
+    def __init__(self, autoload=True):
         self.rules = []
+        self.compiled = CompiledRuleSet([])
         self.ml_service = MLService()
-        self.load_rules()
+        self.snapshot_version = None
+        # Optional ShadowEvaluator fed with sampled transactions after each evaluation
+        self.shadow = None
+        # Named value lists for in_list conditions (memory-mapped, shared by all workers)
+        self.lists = get_value_lists()
+        # Optional UserProfileStore read by profile conditions and updated after each evaluation
+        self.profiles = None
+        # Optional node-wide SharedCounters; RuleMetrics rows are written only if persist_metrics
+        self.counters = None
+        self.persist_metrics = settings.RULE_METRICS_PERSIST
+        # Optional MetricsHistory batching per-minute rule metrics into RuleMetricsBucket rows
+        self.history = None
+        # Folds repeat hits of rules with a suppression window into one alert per key
+        self.suppressor = AlertSuppressor(
+            max_keys=settings.ALERT_SUPPRESSION_MAX_KEYS,
+            flush_seconds=settings.ALERT_SUPPRESSION_FLUSH_SECONDS,
+        )
+        
+        # Latency protection
+        self.budget_seconds = settings.RULE_EVALUATION_BUDGET_MS / 1000
+        self.rule_timeout = settings.RULE_TIMEOUT_MS / 1000
+        self.isolated_types = set(settings.RULE_ISOLATED_TYPES)
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.RULE_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.RULE_BREAKER_RESET_SECONDS,
+        )
+        self.runner = IsolatedRunner(max_workers=settings.RULE_ISOLATED_WORKERS)
+        # Rules still evaluated in degraded mode (any of these tags, never ML rules)
+        self.degraded_tags = frozenset(settings.RULE_DEGRADED_TAGS)
+        
+        if autoload:
+            self.load_rules()
     
     def load_rules(self):
-        """Load active rules from database"""
-        self.rules = list(Rule.objects.filter(active=True))
+        """Load active (non-shadow) rules from database"""
+        self.set_rules(Rule.objects.filter(active=True, shadow=False))
+        self.snapshot_version = None
         logger.info(f"Loaded {len(self.rules)} active rules")
     
+    def set_rules(self, rules):
+        """Replace the rule set and recompile shared conditions"""
+        rules = list(rules)
+        self.compiled = CompiledRuleSet(rules)
+        self.rules = rules
+    
+    def load_snapshot(self, snapshot):
+        """Load rules from a compiled snapshot (no database access)"""
+        self.set_rules(rule_snapshot.rules_from_snapshot(snapshot))
+        self.snapshot_version = snapshot['version']
+        logger.info(f"Loaded {len(self.rules)} active rules from snapshot {snapshot['version']}")
+    
+    def refresh_if_stale(self):
+        """
+        Reload from the database if the rules came from a snapshot that no
+        longer matches the rule table. Returns True if rules were reloaded.
+        """
+        if self.snapshot_version is None:
+            return False
+        if rule_snapshot.rule_set_version() == self.snapshot_version:
+            return False
+        logger.info(f"Rule snapshot {self.snapshot_version} is stale, reloading from database")
+        self.load_rules()
+        return True
+    
     def evaluate_transaction(self, transaction_data):
         """
         Evaluate transaction against all rules
         Returns list of created alerts
         """
-        alerts = []
+        return self.evaluate(transaction_data).alerts
+    
+    def evaluate(self, transaction_data, profile=NULL_PROFILE, degraded=False):
+        """
+        Evaluate transaction against all rules within the latency budget
+        Returns EvaluationResult with created alerts and skipped rules
+        `profile` (profiling.RequestProfile) collects phase and per-rule timings
+        `degraded` runs only rules tagged with RULE_DEGRADED_TAGS, without ML rules,
+        RuleMetrics rows or shadow sampling (set by admission control under overload)
+        """
+        result = EvaluationResult(degraded)
+        persist_metrics = self.persist_metrics and not degraded
+        budget = LatencyBudget(self.budget_seconds)
+        errors = 0
+        # Stored on the first triggered rule and shared by all alerts of the transaction
+        payload = None
+        # Shared condition results, each distinct condition evaluated at most once
+        results = self.compiled.new_results(transaction_data, self._evaluate_condition)
         
         for rule in self.rules:
+            if degraded and not self._runs_degraded(rule):
+                result.skip(rule, 'degraded')
+                continue
+            if not self.breaker.allow(rule.id):
+                result.skip(rule, 'circuit_open')
+                continue
+            if budget.exhausted():
+                result.skip(rule, 'budget_exhausted')
+                continue
+            
             try:
-                # Update metrics
-                metrics, _ = RuleMetrics.objects.get_or_create(rule=rule)
-                metrics.evaluations_count += 1
+                metrics = None
+                if persist_metrics:
+                    # Update metrics
+                    with profile.phase('metrics_write'):
+                        metrics, _ = RuleMetrics.objects.get_or_create(rule=rule)
+                    metrics.evaluations_count += 1
+                
+                start_time = time.perf_counter()
+                try:
+                    with profile.phase('ml_scoring' if rule.type == RuleType.ML_BASED else 'rule_eval'):
+                        rule_triggered = self._run_rule(rule, transaction_data, results, budget)
+                except Exception as e:
+                    if isinstance(e, RuleTimeout):
+                        logger.warning(f"Rule {rule.name} timed out")
+                        result.skip(rule, 'timeout')
+                    else:
+                        logger.error(f"Error evaluating rule {rule.name}: {e}")
+                        result.skip(rule, 'error')
+                    errors += 1
+                    self.breaker.record_failure(rule.id)
+                    if metrics is not None:
+                        metrics.errors_count += 1
+                        with profile.phase('metrics_write'):
+                            metrics.save()
+                    elapsed = time.perf_counter() - start_time
+                    if self.counters is not None:
+                        self.counters.record_rule(rule.id, False, elapsed, error=True)
+                    if self.history is not None:
+                        self.history.record(rule.id, False, elapsed, error=True)
+                    continue
+                processing_time = time.perf_counter() - start_time
+                profile.rule(rule, processing_time)
                 
-                start_time = timezone.now()
-                rule_triggered = self._evaluate_single_rule(rule, transaction_data)
-                processing_time = (timezone.now() - start_time).total_seconds()
+                # Slow rules count against the breaker like failures
+                if processing_time > self.rule_timeout:
+                    self.breaker.record_failure(rule.id)
+                else:
+                    self.breaker.record_success(rule.id)
+                
+                if self.counters is not None:
+                    self.counters.record_rule(rule.id, rule_triggered, processing_time)
+                if self.history is not None:
+                    self.history.record(rule.id, rule_triggered, processing_time)
                 
-                # Update average processing time
-                total_time = metrics.avg_processing_time * (metrics.evaluations_count - 1) + processing_time
-                metrics.avg_processing_time = total_time / metrics.evaluations_count
+                if metrics is not None:
+                    # Update average processing time
+                    total_time = metrics.avg_processing_time * (metrics.evaluations_count - 1) + processing_time
+                    metrics.avg_processing_time = total_time / metrics.evaluations_count
+                    if rule_triggered:
+                        metrics.triggers_count += 1
                 
                 if rule_triggered:
-                    metrics.triggers_count += 1
-                    alert = self._create_alert(rule, transaction_data)
-                    alerts.append(alert)
+                    with profile.phase('alert_write'):
+                        alert = self.suppressor.fold(rule, transaction_data) if rule.suppression_window else None
+                        if alert is None:
+                            if payload is None:
+                                payload = self._store_payload(transaction_data)
+                            alert = self._create_alert(rule, transaction_data, payload)
+                            if rule.suppression_window:
+                                self.suppressor.opened(rule, transaction_data, alert)
+                    result.alerts.append(alert)
                 
-                metrics.save()
+                if metrics is not None:
+                    with profile.phase('metrics_write'):
+                        metrics.save()
                 
             except Exception as e:
                 logger.error(f"Error evaluating rule {rule.name}: {e}")
                 continue
         
-        return alerts
+        if self.counters is not None:
+            self.counters.record_evaluation(len(result.alerts), errors)
+        
+        if self.profiles is not None:
+            self._observe_profile(transaction_data)
+        
+        if self.shadow is not None and not degraded:
+            self.shadow.submit(transaction_data, self.rules)
+        
+        return result
     
-    def _evaluate_single_rule(self, rule, transaction_data):
+    def _runs_degraded(self, rule):
+        return rule.type != RuleType.ML_BASED and not self.degraded_tags.isdisjoint(rule.tags or ())
+    
+    def _run_rule(self, rule, transaction_data, results, budget):
+        """
+        Run a rule within min(rule timeout, remaining budget): blocking rule types
+        on the isolated pool with a hard timeout, others inline with the deadline
+        checked before each composite condition
+        """
+        timeout = min(self.rule_timeout, budget.remaining())
+        if rule.type in self.isolated_types:
+            return self.runner.run(self._evaluate_single_rule, timeout, rule, transaction_data)
+        results.deadline = time.perf_counter() + timeout
+        try:
+            return self._evaluate_single_rule(rule, transaction_data, results)
+        finally:
+            results.deadline = None
+    
+    def _evaluate_single_rule(self, rule, transaction_data, results=None):
         """Evaluate a single rule against transaction data"""
         
         if rule.type == 'threshold':
             return self._evaluate_threshold_rule(rule, transaction_data)
         elif rule.type == 'composite':
-            return self._evaluate_composite_rule(rule, transaction_data)
+            return self._evaluate_composite_rule(rule, transaction_data, results)
         elif rule.type == 'ml_based':
             return self._evaluate_ml_rule(rule, transaction_data)
         else:
@@ -138,8 +324,18 @@ class RuleEngine:
             logger.error(f"Error comparing values: {e}")
             return False
     
-    def _evaluate_composite_rule(self, rule, transaction_data):
+    def _evaluate_composite_rule(self, rule, transaction_data, results=None):
         """Evaluate composite rules with AND/OR logic"""
+        plan = self.compiled.plan_for(rule) if results is not None else None
+        if plan is not None:
+            logic, condition_ids = plan
+            if logic == 'AND':
+                return all(results.get(condition_id) for condition_id in condition_ids)
+            elif logic == 'OR':
+                return any(results.get(condition_id) for condition_id in condition_ids)
+            logger.warning(f"Unknown logic operator: {logic}")
+            return False
+        
         condition = rule.condition
         logic = condition.get('logic', 'AND').upper()
         conditions = condition.get('conditions', [])
@@ -195,16 +391,91 @@ class RuleEngine:
         elif condition_type == 'is_international':
             return transaction_data.get('is_international', False)
         
+        elif condition_type == 'in_list':
+            # {"type": "in_list", "list": "blocked_cards", "field": "card_id"}
+            return self.lists.contains(condition.get('list'), transaction_data.get(condition.get('field')))
+        
+        elif condition_type == 'text_match':
+            # {"type": "text_match", "field": "merchant_name", "patterns": ["casino", "crypto"]}
+            # Compiled rule sets answer these from one automaton scan per field (compiler.py)
+            text = text_of(transaction_data.get(condition.get('field')))
+            return text is not None and any(pattern in text for pattern in text_patterns(condition))
+        
+        elif condition_type in ('amount_zscore', 'unusual_hour', 'foreign_country'):
+            return self._evaluate_profile_condition(condition_type, condition, transaction_data)
+        
         return False
     
+    def _evaluate_profile_condition(self, condition_type, condition, transaction_data):
+        """Conditions relative to the user's own history (UserProfileStore); False without history"""
+        user_key = self._profile_key(transaction_data)
+        if self.profiles is None or user_key is None:
+            return False
+        
+        if condition_type == 'amount_zscore':
+            try:
+                amount = float(transaction_data.get('amount'))
+            except (TypeError, ValueError):
+                return False
+            zscore = self.profiles.zscore(user_key, amount, condition.get('min_history', 5))
+            return zscore is not None and zscore >= condition.get('threshold', 3)
+        
+        if condition_type == 'unusual_hour':
+            hour = self._transaction_hour(transaction_data)
+            if hour is None:
+                return False
+            share = self.profiles.hour_share(user_key, hour, condition.get('min_history', 10))
+            return share is not None and share <= condition.get('max_share', 0.05)
+        
+        # foreign_country
+        home = self.profiles.home_country(user_key)
+        country = transaction_data.get('user_country')
+        return bool(home and country and country != home)
+    
+    def _observe_profile(self, transaction_data):
+        user_key = self._profile_key(transaction_data)
+        try:
+            amount = float(transaction_data.get('amount'))
+        except (TypeError, ValueError):
+            return
+        if user_key is None:
+            return
+        self.profiles.observe(
+            user_key,
+            amount,
+            hour=self._transaction_hour(transaction_data),
+            country=transaction_data.get('user_country') or None,
+        )
+        self.profiles.maybe_checkpoint()
+    
+    def _profile_key(self, transaction_data):
+        user_id = transaction_data.get('user_id')
+        return str(user_id) if user_id not in (None, '') else None
+    
+    def _transaction_hour(self, transaction_data):
+        timestamp = transaction_data.get('timestamp')
+        if isinstance(timestamp, str):
+            try:
+                timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            except ValueError:
+                return None
+        return timestamp.hour if isinstance(timestamp, datetime) else None
+    
     def _evaluate_ml_rule(self, rule, transaction_data):
         """Evaluate ML-based rules"""
         fraud_probability = self.ml_service.predict_fraud_probability(transaction_data)
         threshold = rule.threshold or 0.5
         return fraud_probability > threshold
     
-    def _create_alert(self, rule, transaction_data):
-        """Create alert record in database"""
+    def _store_payload(self, transaction_data):
+        """Deduplicated payload row; False when the transaction has no ID to key it by"""
+        transaction_id = transaction_data.get('transaction_id')
+        if not transaction_id:
+            return False
+        return TransactionPayload.store(str(transaction_id), transaction_data)
+    
+    def _create_alert(self, rule, transaction_data, payload=None):
+        """Create alert record in database, referencing the shared payload when there is one"""
         reason = f"Rule '{rule.name}' triggered"
         
         # Determine severity based on rule type and conditions
@@ -215,13 +486,144 @@ class RuleEngine:
         else:
             severity = 'low'
         
+        now = timezone.now()
         alert = Alert.objects.create(
             rule=rule,
             transaction_id=transaction_data.get('transaction_id', 'unknown'),
             reason=reason,
             severity=severity,
-            transaction_data=transaction_data
+            payload=payload or None,
+            transaction_data=None if payload else transaction_data,
+            first_seen=now,
+            last_seen=now
         )
         
         logger.info(f"Alert created: {alert.id} for rule {rule.name}")
-        return alert
\ No newline at end of file
+        return alert
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_validated_pid = None
+_shadow = None
+_counters = None
+_profiles = None
+_admission = None
+_history = None
+
+
+def get_metrics_history():
+    """Process-wide MetricsHistory, or None when RULE_METRICS_HISTORY is off"""
+    global _history
+    if _history is None and settings.RULE_METRICS_HISTORY:
+        _history = MetricsHistory(flush_seconds=settings.RULE_METRICS_FLUSH_SECONDS)
+        atexit.register(_history.flush)
+    return _history
+
+
+def get_admission_controller():
+    """Process-wide AdmissionController for the evaluate endpoint"""
+    global _admission
+    if _admission is None:
+        with _engine_lock:
+            if _admission is None:
+                _admission = AdmissionController(
+                    max_in_flight=settings.EVALUATE_MAX_IN_FLIGHT,
+                    queue_timeout=settings.EVALUATE_QUEUE_TIMEOUT_MS / 1000,
+                    degrade_ms=settings.EVALUATE_DEGRADE_MS,
+                    recover_ms=settings.EVALUATE_RECOVER_MS,
+                    recover_seconds=settings.EVALUATE_RECOVER_SECONDS,
+                )
+    return _admission
+
+
+def get_profile_store():
+    """Per-process UserProfileStore restored from its checkpoint, or None when USER_PROFILE_PATH is empty"""
+    global _profiles
+    if _profiles is None and settings.USER_PROFILE_PATH:
+        _profiles = UserProfileStore.load(settings.USER_PROFILE_PATH, capacity=settings.USER_PROFILE_CAPACITY)
+        if settings.USER_PROFILE_CHECKPOINT_SECONDS:
+            _profiles.enable_checkpoints(settings.USER_PROFILE_PATH, settings.USER_PROFILE_CHECKPOINT_SECONDS)
+    return _profiles
+
+
+def get_shared_counters():
+    """Node-wide SharedCounters, or None when ENGINE_COUNTERS_PATH is empty"""
+    global _counters
+    if _counters is None and settings.ENGINE_COUNTERS_PATH:
+        try:
+            _counters = SharedCounters(
+                settings.ENGINE_COUNTERS_PATH,
+                stripes=settings.ENGINE_COUNTERS_STRIPES,
+                max_rules=settings.ENGINE_COUNTERS_MAX_RULES,
+            )
+        except OSError as e:
+            logger.error(f"Shared engine counters unavailable: {e}")
+    return _counters
+
+
+def get_shadow_evaluator():
+    """Process-wide ShadowEvaluator, or None when shadow sampling is disabled"""
+    global _shadow
+    if _shadow is None and settings.RULE_SHADOW_SAMPLE_RATE > 0:
+        _shadow = ShadowEvaluator(
+            sample_rate=settings.RULE_SHADOW_SAMPLE_RATE,
+            queue_size=settings.RULE_SHADOW_QUEUE_SIZE,
+            refresh_seconds=settings.RULE_SHADOW_REFRESH_SECONDS,
+        )
+    return _shadow
+
+
+def _build_engine(snapshot=None):
+    """RuleEngine with its optional components; rules come from `snapshot`, the snapshot file or the database"""
+    engine = RuleEngine(autoload=False)
+    engine.shadow = get_shadow_evaluator()
+    engine.counters = get_shared_counters()
+    engine.profiles = get_profile_store()
+    engine.history = get_metrics_history()
+    atexit.register(engine.suppressor.flush)
+    if snapshot is None:
+        snapshot = rule_snapshot.read_snapshot(settings.RULE_SNAPSHOT_PATH)
+    if snapshot is not None:
+        engine.load_snapshot(snapshot)
+    else:
+        engine.load_rules()
+    return engine
+
+
+def preload_rule_engine():
+    """
+    Deserialize the rule snapshot before workers fork (gunicorn --preload).
+    Never touches the database: connections must not be shared across forks.
+    """
+    global _engine
+    snapshot = rule_snapshot.read_snapshot(settings.RULE_SNAPSHOT_PATH)
+    if snapshot is None:
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = _build_engine(snapshot)
+    return _engine
+
+
+def get_rule_engine():
+    """
+    Process-wide RuleEngine, created on first use.
+    A snapshot-loaded engine is checked against the database once per process.
+    """
+    global _engine, _validated_pid
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _build_engine()
+
+    pid = os.getpid()
+    if _validated_pid != pid:
+        with _engine_lock:
+            if _validated_pid != pid:
+                try:
+                    _engine.refresh_if_stale()
+                    _validated_pid = pid
+                except Exception as e:
+                    logger.warning(f"Could not validate rule snapshot, using it as is: {e}")
+    return _engine
@@ -0,0 +1,130 @@
+"""
+Fast JSON encoding/decoding for the rule engine API.
+
+Uses orjson when it is installed and falls back to the stdlib json module
+with DjangoJSONEncoder otherwise, so the wire format is the same either way.
+MessagePack is negotiated through Content-Type/Accept when the msgpack
+package is installed.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+MSGPACK_CONTENT_TYPES = (MSGPACK_CONTENT_TYPE, 'application/x-msgpack')
+
+
+class PayloadDecodeError(ValueError):
+    """Request body could not be decoded in the negotiated format"""
+
+
+class UnsupportedMediaType(ValueError):
+    """Request body uses a format this server can't decode"""
+
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def _default(obj):
+    """Fallback for types orjson does not handle natively (Decimal, lazy strings...)"""
+    return _django_encoder.default(obj)
+
+
+def loads(data):
+    """
+    Decode JSON from bytes or str.
+    Raises json.JSONDecodeError on invalid input (orjson's error subclasses it).
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode('utf-8')
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encode object to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+
+
+class FastJsonResponse(HttpResponse):
+    """Drop-in replacement for JsonResponse that encodes with orjson when available"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', JSON_CONTENT_TYPE)
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class MsgpackResponse(HttpResponse):
+    """HttpResponse with a MessagePack-encoded body"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', MSGPACK_CONTENT_TYPE)
+        super().__init__(content=msgpack.packb(data, default=_default, use_bin_type=True), **kwargs)
+
+
+def _media_type(header_value):
+    return header_value.split(';', 1)[0].strip().lower()
+
+
+def is_msgpack_request(request):
+    return _media_type(request.content_type or '') in MSGPACK_CONTENT_TYPES
+
+
+def decode_request(request):
+    """
+    Decode the request body according to its Content-Type.
+    JSON errors propagate as json.JSONDecodeError, MessagePack errors
+    as PayloadDecodeError.
+    """
+    if not is_msgpack_request(request):
+        return loads(request.body)
+
+    if msgpack is None:
+        raise UnsupportedMediaType('MessagePack support is not installed')
+    try:
+        return msgpack.unpackb(request.body, raw=False)
+    except Exception as e:
+        raise PayloadDecodeError(str(e)) from e
+
+
+def wants_msgpack(request):
+    """
+    Pick the response encoding: an explicit Accept header wins, otherwise
+    the response mirrors the request body format.
+    """
+    if msgpack is None:
+        return False
+
+    accept = request.headers.get('Accept', '')
+    accepted = [_media_type(item) for item in accept.split(',') if item.strip()]
+    for media_type in accepted:
+        if media_type in MSGPACK_CONTENT_TYPES:
+            return True
+        if media_type == JSON_CONTENT_TYPE:
+            return False
+    return is_msgpack_request(request)
+
+
+def encode_response(request, data, status=200):
+    """Build the response in the encoding negotiated for this request"""
+    if wants_msgpack(request):
+        response = MsgpackResponse(data, status=status)
+    else:
+        response = FastJsonResponse(data, status=status)
+    response['Vary'] = 'Accept, Content-Type'
+    return response
@@ -0,0 +1,142 @@
+"""
+Shadow evaluation of draft rules on live traffic.
+
+Rules with `shadow=True` never run on the request path and never create
+alerts. The live engine hands a sample of evaluated transactions to a
+bounded queue; a background thread evaluates both the shadow rules and the
+live rules on the same sample and keeps in-memory counters per rule, so hit
+rates and latencies can be compared side by side.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+
+from django.db import close_old_connections
+
+from .models import Rule
+
+logger = logging.getLogger(__name__)
+
+
+class RuleCounters:
+    __slots__ = ('rule_id', 'name', 'evaluations', 'hits', 'errors', 'live_overlap', 'total_seconds', 'max_seconds')
+
+    def __init__(self, rule):
+        self.rule_id = rule.id
+        self.name = rule.name
+        self.evaluations = self.hits = self.errors = self.live_overlap = 0
+        self.total_seconds = self.max_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            'rule_id': self.rule_id,
+            'rule_name': self.name,
+            'evaluations': self.evaluations,
+            'hits': self.hits,
+            'errors': self.errors,
+            'hit_rate': round(self.hits / self.evaluations, 6) if self.evaluations else 0,
+            'live_overlap': self.live_overlap,
+            'avg_latency_ms': round(self.total_seconds / self.evaluations * 1000, 4) if self.evaluations else 0,
+            'max_latency_ms': round(self.max_seconds * 1000, 4),
+        }
+
+
+class ShadowEvaluator:
+    def __init__(self, sample_rate, queue_size=1000, refresh_seconds=60):
+        self.sample_rate = sample_rate
+        self.refresh_seconds = refresh_seconds
+        self.sampled = 0
+        self.dropped = 0
+        self.shadow_counters = {}
+        self.live_counters = {}
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._shadow_engine = None
+        self._live_engine = None
+        self._live_source = None
+        self._loaded_at = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, transaction_data, live_rules):
+        """Called on the request path: sample and enqueue, never blocks"""
+        if random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((dict(transaction_data), live_rules))
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.sampled += 1
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='shadow-evaluator', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            transaction_data, live_rules = self._queue.get()
+            try:
+                self.process(transaction_data, live_rules)
+            except Exception as e:
+                logger.error(f"Shadow evaluation failed: {e}")
+            finally:
+                close_old_connections()
+
+    def process(self, transaction_data, live_rules):
+        """Evaluate shadow and live rule sets on one transaction and update counters"""
+        from .rules_engine import RuleEngine, get_profile_store
+
+        if self._shadow_engine is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            engine = RuleEngine(autoload=False)
+            engine.profiles = get_profile_store()
+            engine.set_rules(Rule.objects.filter(shadow=True))
+            self._shadow_engine = engine
+            self._loaded_at = time.monotonic()
+        if live_rules is not self._live_source:
+            engine = RuleEngine(autoload=False)
+            engine.profiles = get_profile_store()
+            engine.set_rules(live_rules)
+            self._live_engine = engine
+            self._live_source = live_rules
+
+        live_flagged = self._evaluate(self._live_engine, self.live_counters, transaction_data, False)
+        self._evaluate(self._shadow_engine, self.shadow_counters, transaction_data, live_flagged)
+
+    def _evaluate(self, engine, counters, transaction_data, live_flagged):
+        results = engine.compiled.new_results(transaction_data, engine._evaluate_condition)
+        any_hit = False
+        for rule in engine.rules:
+            rule_counters = counters.get(rule.id)
+            if rule_counters is None:
+                rule_counters = counters[rule.id] = RuleCounters(rule)
+
+            started = time.perf_counter()
+            try:
+                hit = engine._evaluate_single_rule(rule, transaction_data, results)
+            except Exception:
+                rule_counters.errors += 1
+                hit = False
+            elapsed = time.perf_counter() - started
+
+            rule_counters.evaluations += 1
+            rule_counters.total_seconds += elapsed
+            rule_counters.max_seconds = max(rule_counters.max_seconds, elapsed)
+            if hit:
+                any_hit = True
+                rule_counters.hits += 1
+                if live_flagged:
+                    rule_counters.live_overlap += 1
+        return any_hit
+
+    def report(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'sampled': self.sampled,
+            'dropped': self.dropped,
+            'shadow_rules': [counters.as_dict() for counters in list(self.shadow_counters.values())],
+            'live_rules': [counters.as_dict() for counters in list(self.live_counters.values())],
+        }
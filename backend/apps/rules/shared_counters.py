@@ -0,0 +1,240 @@
+"""
+Node-wide engine counters in a shared memory-mapped file.
+
+Every worker process on a node maps the same file. The file is split into
+stripes; each writing process claims a stripe of its own, so no cross-process
+locking or atomics are needed. Threads of one process share its stripe under
+a process-local lock; a per-thread stripe would leak with servers that run
+requests in short-lived threads. Readers sum all stripes.
+
+Layout (native int64 slots):
+    header   HEADER_SLOTS    magic, layout version, stripes, max_rules
+    stripe   STRIPE_HEADER   owner pid, evaluations, triggers, errors
+             max_rules * RULE_SLOTS
+                             rule id, evaluations, triggers, errors, latency ns sum
+
+Rule slots are open-addressed by rule id within each stripe.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0x46524443  # "FRDC"
+LAYOUT_VERSION = 1
+
+HEADER_SLOTS = 8
+STRIPE_HEADER = 8
+RULE_SLOTS = 8
+
+# Offsets inside a stripe header
+OWNER, EVALUATIONS, TRIGGERS, ERRORS = 0, 1, 2, 3
+# Offsets inside a rule slot
+RULE_ID, RULE_EVALUATIONS, RULE_TRIGGERS, RULE_ERRORS, RULE_LATENCY_NS = 0, 1, 2, 3, 4
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedCounters:
+    def __init__(self, path, stripes=64, max_rules=1024, cache_seconds=1.0):
+        self.path = path
+        self.stripes = stripes
+        self.max_rules = max_rules
+        self.cache_seconds = cache_seconds
+        self.stripe_slots = STRIPE_HEADER + max_rules * RULE_SLOTS
+        self.total_slots = HEADER_SLOTS + stripes * self.stripe_slots
+
+        self._pid = None
+        self._base = None
+        self._rule_slots = {}
+        self._claim_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_at = 0.0
+        self._snapshot_lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        size = self.total_slots * 8
+        header = (MAGIC, LAYOUT_VERSION, self.stripes, self.max_rules)
+        # The counters file itself is replaced, so creation is serialized on a lock file next to it
+        with open(self.path + '.lock', 'ab') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not self._matches(size, header):
+                self._create(size, header)
+            fd = os.open(self.path, os.O_RDWR)
+            try:
+                self._mmap = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        self._slots = memoryview(self._mmap).cast('q')
+
+    def _matches(self, size, header):
+        try:
+            with open(self.path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size != size:
+                    return False
+                return struct.unpack('4q', f.read(32)) == header
+        except (FileNotFoundError, struct.error):
+            return False
+
+    def _create(self, size, header):
+        """
+        Write a zeroed file with the header and rename it into place: processes
+        still mapping a file of another layout keep their (now detached) copy
+        instead of faulting on a truncated mapping
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.truncate(size)
+                f.write(struct.pack('4q', *header))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    # Writer side
+
+    def _stripe(self):
+        """Base slot of this process's stripe, claiming one on first use"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._base
+
+        with self._claim_lock:
+            if self._pid != pid:
+                # First use in this process (or in a forked child): the parent's stripe is not ours
+                self._write_lock = threading.Lock()
+                self._rule_slots = {}
+                self._base = self._claim(pid)
+                self._pid = pid
+        return self._base
+
+    def _claim(self, pid):
+        with open(self.path, 'rb') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                for stripe in range(self.stripes):
+                    base = HEADER_SLOTS + stripe * self.stripe_slots
+                    owner = self._slots[base + OWNER]
+                    # Stripes of dead processes are reused; their counts are kept
+                    if owner == 0 or not _pid_alive(owner):
+                        self._slots[base + OWNER] = pid
+                        return base
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        logger.warning(f"No free counter stripe in {self.path}; increase ENGINE_COUNTERS_STRIPES")
+        return None
+
+    def _rule_slot(self, base, rule_id):
+        rule_slots = self._rule_slots
+        slot = rule_slots.get(rule_id)
+        if slot is not None:
+            return slot
+
+        start = rule_id % self.max_rules
+        for probe in range(self.max_rules):
+            slot = base + STRIPE_HEADER + ((start + probe) % self.max_rules) * RULE_SLOTS
+            current = self._slots[slot + RULE_ID]
+            if current == rule_id or current == 0:
+                self._slots[slot + RULE_ID] = rule_id
+                rule_slots[rule_id] = slot
+                return slot
+        return None
+
+    def record_rule(self, rule_id, triggered, seconds, error=False):
+        base = self._stripe()
+        if base is None:
+            return
+        with self._write_lock:
+            slot = self._rule_slot(base, rule_id)
+            if slot is None:
+                return
+            slots = self._slots
+            slots[slot + RULE_EVALUATIONS] += 1
+            if triggered:
+                slots[slot + RULE_TRIGGERS] += 1
+            if error:
+                slots[slot + RULE_ERRORS] += 1
+            slots[slot + RULE_LATENCY_NS] += int(seconds * 1e9)
+
+    def record_evaluation(self, triggers, errors):
+        base = self._stripe()
+        if base is None:
+            return
+        with self._write_lock:
+            slots = self._slots
+            slots[base + EVALUATIONS] += 1
+            slots[base + TRIGGERS] += triggers
+            slots[base + ERRORS] += errors
+
+    # Reader side
+
+    def aggregate(self):
+        """Sum all stripes; cached for cache_seconds so concurrent readers share one scan"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._snapshot_at < self.cache_seconds:
+            return self._snapshot
+
+        with self._snapshot_lock:
+            if self._snapshot is not None and time.monotonic() - self._snapshot_at < self.cache_seconds:
+                return self._snapshot
+
+            slots = self._slots
+            totals = {'evaluations': 0, 'triggers': 0, 'errors': 0, 'active_writers': 0}
+            rules = {}
+            for stripe in range(self.stripes):
+                base = HEADER_SLOTS + stripe * self.stripe_slots
+                owner = slots[base + OWNER]
+                if owner == 0:
+                    continue
+                if _pid_alive(owner):
+                    totals['active_writers'] += 1
+                totals['evaluations'] += slots[base + EVALUATIONS]
+                totals['triggers'] += slots[base + TRIGGERS]
+                totals['errors'] += slots[base + ERRORS]
+
+                for index in range(self.max_rules):
+                    slot = base + STRIPE_HEADER + index * RULE_SLOTS
+                    rule_id = slots[slot + RULE_ID]
+                    if rule_id == 0:
+                        continue
+                    stats = rules.setdefault(rule_id, [0, 0, 0, 0])
+                    stats[0] += slots[slot + RULE_EVALUATIONS]
+                    stats[1] += slots[slot + RULE_TRIGGERS]
+                    stats[2] += slots[slot + RULE_ERRORS]
+                    stats[3] += slots[slot + RULE_LATENCY_NS]
+
+            totals['rules'] = [
+                {
+                    'rule_id': rule_id,
+                    'evaluations': evaluations,
+                    'triggers': triggers,
+                    'errors': errors,
+                    'avg_processing_time_ms': round(latency_ns / evaluations / 1e6, 4) if evaluations else 0,
+                }
+                for rule_id, (evaluations, triggers, errors, latency_ns) in sorted(rules.items())
+            ]
+            self._snapshot = totals
+            self._snapshot_at = time.monotonic()
+            return totals
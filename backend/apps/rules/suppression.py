@@ -0,0 +1,110 @@
+"""
+Alert storm suppression.
+
+Rules with a suppression window (Rule.suppression_window, seconds) fold repeat
+hits into one alert: a hit for the same rule and key (the values of the
+transaction fields in Rule.suppression_keys, e.g. user_id or merchant_id)
+within the window since the previous hit adds to that alert's hit_count and
+moves its last_seen instead of creating a row. The window slides with every
+hit, so a misfiring rule writes one alert per key for the whole incident.
+
+Open aggregates are kept in a bounded LRU per process. Their counts are
+written with one UPDATE per alert every flush interval by a background
+PeriodicFlusher, which also writes aggregates that were evicted or
+replaced. Each worker aggregates on its own, so a key hit on N workers
+yields up to N alerts per window.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Alert
+from .periodic import PeriodicFlusher
+
+logger = logging.getLogger(__name__)
+
+
+class _Aggregate:
+    __slots__ = ('alert', 'window', 'last_seen', 'pending')
+
+    def __init__(self, alert, window):
+        self.alert = alert
+        self.window = window
+        self.last_seen = alert.last_seen
+        self.pending = 0
+
+
+class AlertSuppressor:
+    def __init__(self, max_keys=10000, flush_seconds=5):
+        self.max_keys = max_keys
+        self.flush_seconds = flush_seconds
+        self.suppressed = 0
+        self._open = OrderedDict()
+        # Aggregates with unwritten hits that were evicted or replaced
+        self._closed = []
+        self._lock = threading.Lock()
+        self._flusher = PeriodicFlusher(self.flush, flush_seconds, 'alert-suppression-flush')
+
+    @staticmethod
+    def key_for(rule, transaction_data):
+        return (rule.id,) + tuple(str(transaction_data.get(field, '')) for field in rule.suppression_keys or ())
+
+    def fold(self, rule, transaction_data, now=None):
+        """The open alert absorbing this hit, or None when a new alert has to be created"""
+        now = timezone.now() if now is None else now
+        key = self.key_for(rule, transaction_data)
+        with self._lock:
+            aggregate = self._open.get(key)
+            if aggregate is None or (now - aggregate.last_seen).total_seconds() > aggregate.window:
+                return None
+            aggregate.last_seen = now
+            aggregate.pending += 1
+            aggregate.alert.hit_count += 1
+            aggregate.alert.last_seen = now
+            self._open.move_to_end(key)
+            self.suppressed += 1
+        self._flusher.ensure_started()
+        return aggregate.alert
+
+    def opened(self, rule, transaction_data, alert):
+        """Track a newly created alert as the aggregate for its key"""
+        key = self.key_for(rule, transaction_data)
+        with self._lock:
+            previous = self._open.pop(key, None)
+            if previous is not None and previous.pending:
+                self._closed.append(previous)
+            self._open[key] = _Aggregate(alert, rule.suppression_window)
+            while len(self._open) > self.max_keys:
+                _, evicted = self._open.popitem(last=False)
+                if evicted.pending:
+                    self._closed.append(evicted)
+
+    def __len__(self):
+        return len(self._open)
+
+    def flush(self):
+        """Write pending hit counts; drops aggregates whose window has closed. Returns alerts updated"""
+        now = timezone.now()
+        with self._lock:
+            pending = self._closed
+            self._closed = []
+            for key, aggregate in list(self._open.items()):
+                if aggregate.pending:
+                    pending.append(aggregate)
+                if (now - aggregate.last_seen).total_seconds() > aggregate.window:
+                    del self._open[key]
+            updates = [(aggregate.alert.id, aggregate.pending, aggregate.last_seen) for aggregate in pending]
+            for aggregate in pending:
+                aggregate.pending = 0
+
+        for alert_id, hits, last_seen in updates:
+            try:
+                Alert.objects.filter(id=alert_id).update(hit_count=F('hit_count') + hits, last_seen=last_seen)
+            except Exception as e:
+                logger.error(f"Failed to write {hits} suppressed hits for alert {alert_id}: {e}")
+        if updates:
+            logger.info(f"Flushed suppressed hits for {len(updates)} alerts")
+        return len(updates)
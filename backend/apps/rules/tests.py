@@ -1,8 +1,58 @@
+from django.db import transaction as db_transaction
 from django.test import TestCase
 from django.test import Client
+from django.test import override_settings
+from django.test import SimpleTestCase
 from django.utils import timezone
-from .models import Rule
+from backend.db_routing import ReplicaRouter, is_replica_view, use_replica
+from .alert_stream import AlertBroker
+from .loadtest import LatencyHistogram, LoadRun, TrafficMix, WebhookSink
+from .archive import AlertArchive
+from .metrics_history import MetricsHistory, downsample
+from .models import Alert, Rule, RuleChange, RuleMetrics, RuleMetricsBucket, TransactionPayload
+from .resilience import AdmissionController, CircuitBreaker, Overloaded
+from . import rules_engine
+from .rules_engine import RuleEngine, get_rule_engine
+from .serialization import msgpack
+from .periodic import PeriodicFlusher
+from .profiles import UserProfileStore
+from .profiling import Profiler, RequestProfile
+from .shadow import ShadowEvaluator
+from .shared_counters import SharedCounters
+from .suppression import AlertSuppressor
+from .text_match import TextMatcher
+from .value_lists import ValueListRegistry
+from .snapshot import read_snapshot, rule_set_version, write_snapshot
+from django.contrib.auth.models import User
+from datetime import datetime, timedelta, timezone as dt_timezone
+from apps.transactions.models import Transactions
+from asgiref.sync import sync_to_async
+import asyncio
 import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+# Engine singletons keep node state in files: point them at a scratch directory
+STATE_DIR = tempfile.mkdtemp()
+state_settings = override_settings(
+    ENGINE_COUNTERS_PATH=os.path.join(STATE_DIR, 'engine-counters.bin'),
+    USER_PROFILE_PATH=os.path.join(STATE_DIR, 'user-profiles.bin'),
+)
+
+
+def setUpModule():
+    state_settings.enable()
+    rules_engine._counters = rules_engine._profiles = None
+
+
+def tearDownModule():
+    state_settings.disable()
+    rules_engine._counters = rules_engine._profiles = None
+
 
 class RuleEngineAPITestCase(TestCase):
     def setUp(self):
@@ -71,4 +121,1411 @@ class RuleEngineAPITestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.content)
         self.assertEqual(data['status'], 'success')
-        self.assertEqual(data['data']['service'], 'Rule Engine API')
\ No newline at end of file
+        self.assertEqual(data['data']['service'], 'Rule Engine API')
+
+
+@override_settings(ROOT_URLCONF='backend.api_urls', MIDDLEWARE=[])
+class LeanAPITestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+
+    def test_evaluate_response_schema(self):
+        """Тест схемы ответа облегчённого API"""
+        transaction_data = {
+            "transaction_id": "lean_1",
+            "amount": 10,
+            "user_id": "user_1",
+            "timestamp": timezone.now().isoformat(),
+        }
+
+        response = self.client.post(
+            '/rules/evaluate/',
+            data=json.dumps(transaction_data),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(response.content)
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['data']['transaction_id'], 'lean_1')
+        self.assertIn('is_suspicious', data['data']['evaluation_result'])
+        self.assertIn('alerts', data['data'])
+
+    def test_evaluate_invalid_json(self):
+        """Тест невалидного JSON в облегчённом API"""
+        response = self.client.post(
+            '/rules/evaluate/',
+            data='invalid json',
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['code'], 'INVALID_JSON')
+
+    def test_admin_not_routed(self):
+        """Тест: админка не доступна через облегчённый API"""
+        response = self.client.get('/admin/')
+        self.assertEqual(response.status_code, 404)
+
+
+class WireFormatTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.rule = Rule.objects.create(
+            name="Large Amount",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1000},
+            active=True
+        )
+        self.transaction_data = {
+            "transaction_id": "wire_1",
+            "amount": 5000,
+            "user_id": "user_1",
+            "timestamp": timezone.now().isoformat(),
+        }
+        get_rule_engine().load_rules()
+
+    def test_verdict_only(self):
+        """Тест режима verdict_only"""
+        response = self.client.post(
+            '/rules/evaluate/?verdict_only=1',
+            data=json.dumps(self.transaction_data),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)['data']
+        self.assertEqual(set(data), {'transaction_id', 'is_suspicious', 'severity', 'rule_ids', 'skipped_rule_ids'})
+        self.assertTrue(data['is_suspicious'])
+        self.assertEqual(data['rule_ids'], [self.rule.id])
+        self.assertEqual(data['severity'], 'low')
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_round_trip(self):
+        """Тест MessagePack в запросе и ответе"""
+        response = self.client.post(
+            '/rules/evaluate/',
+            data=msgpack.packb(self.transaction_data),
+            content_type='application/msgpack'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data['data']['transaction_id'], 'wire_1')
+        self.assertEqual(data['data']['evaluation_result']['alerts_triggered'], 1)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_accept_header_overrides_request_format(self):
+        """Тест: Accept определяет формат ответа"""
+        response = self.client.post(
+            '/rules/evaluate/',
+            data=msgpack.packb(self.transaction_data),
+            content_type='application/msgpack',
+            HTTP_ACCEPT='application/json'
+        )
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content)['status'], 'success')
+
+
+class RuleSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.rule = Rule.objects.create(
+            name="Snapshot Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 100},
+            active=True
+        )
+        Rule.objects.create(
+            name="Inactive Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1},
+            active=False
+        )
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'rules.snapshot')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_snapshot_round_trip(self):
+        """Тест записи и загрузки снапшота правил"""
+        write_snapshot(self.path)
+        snapshot = read_snapshot(self.path)
+
+        engine = RuleEngine(autoload=False)
+        with self.assertNumQueries(0):
+            engine.load_snapshot(snapshot)
+
+        self.assertEqual([rule.id for rule in engine.rules], [self.rule.id])
+        self.assertEqual(engine.rules[0].condition, self.rule.condition)
+        self.assertEqual(engine.snapshot_version, rule_set_version())
+
+    def test_stale_snapshot_reloads_from_database(self):
+        """Тест перезагрузки из БД при устаревшем снапшоте"""
+        write_snapshot(self.path)
+        engine = RuleEngine(autoload=False)
+        engine.load_snapshot(read_snapshot(self.path))
+
+        self.assertFalse(engine.refresh_if_stale())
+
+        Rule.objects.create(
+            name="New Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 5},
+            active=True
+        )
+        self.assertTrue(engine.refresh_if_stale())
+        self.assertEqual(len(engine.rules), 2)
+        self.assertIsNone(engine.snapshot_version)
+
+    def test_missing_snapshot(self):
+        """Тест отсутствующего файла снапшота"""
+        self.assertIsNone(read_snapshot(self.path))
+
+
+class SharedConditionTestCase(TestCase):
+    def setUp(self):
+        shared = [
+            {"type": "is_international"},
+            {"type": "amount_threshold", "threshold": 500, "operator": ">"},
+        ]
+        for index in range(3):
+            Rule.objects.create(
+                name=f"Composite {index}",
+                type="composite",
+                condition={"logic": "AND", "conditions": shared + [{"type": "is_new_user"}]},
+                active=True
+            )
+        self.engine = RuleEngine()
+
+    def test_conditions_are_deduplicated(self):
+        """Тест дедупликации одинаковых условий между правилами"""
+        self.assertEqual(len(self.engine.compiled.conditions), 3)
+        self.assertEqual(len(self.engine.compiled.plans), 3)
+
+    def test_each_condition_evaluated_once(self):
+        """Тест: каждое условие вычисляется один раз на транзакцию"""
+        transaction_data = {
+            "transaction_id": "shared_1",
+            "amount": 900,
+            "is_international": True,
+            "is_new_user": True,
+        }
+
+        with mock.patch.object(self.engine, '_evaluate_condition',
+                               wraps=self.engine._evaluate_condition) as evaluate:
+            alerts = self.engine.evaluate_transaction(transaction_data)
+
+        self.assertEqual(len(alerts), 3)
+        self.assertEqual(evaluate.call_count, 3)
+
+
+class LatencyProtectionTestCase(TestCase):
+    def setUp(self):
+        self.ml_rule = Rule.objects.create(
+            name="Slow ML Rule",
+            type="ml_based",
+            condition={},
+            threshold=0.5,
+            active=True
+        )
+        self.threshold_rule = Rule.objects.create(
+            name="Amount Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 100},
+            active=True
+        )
+        self.transaction_data = {"transaction_id": "slow_1", "amount": 6000}
+
+    @override_settings(RULE_TIMEOUT_MS=20, RULE_BREAKER_FAILURE_THRESHOLD=2)
+    def test_slow_rule_times_out_and_opens_circuit(self):
+        """Тест таймаута медленного правила и размыкания цепи"""
+        engine = RuleEngine()
+        release = threading.Event()
+
+        def slow_prediction(transaction_data):
+            release.wait(1)
+            return 0.9
+
+        engine.ml_service.predict_fraud_probability = slow_prediction
+        try:
+            for expected_reason in ['timeout', 'timeout', 'circuit_open']:
+                result = engine.evaluate(self.transaction_data)
+                skipped = {item['rule_id']: item['reason'] for item in result.skipped_rules}
+                self.assertEqual(skipped, {self.ml_rule.id: expected_reason})
+                self.assertEqual([alert.rule_id for alert in result.alerts], [self.threshold_rule.id])
+        finally:
+            release.set()
+
+    @override_settings(RULE_TIMEOUT_MS=20)
+    def test_inline_composite_rule_times_out(self):
+        """Тест: составное правило вне пула прерывается по таймауту между условиями"""
+        composite_rule = Rule.objects.create(
+            name="Slow Composite",
+            type="composite",
+            condition={"logic": "AND", "conditions": [
+                {"type": "amount_threshold", "threshold": 100, "operator": ">"},
+                {"type": "is_international"},
+            ]},
+            active=True
+        )
+        engine = RuleEngine()
+        engine.set_rules([composite_rule])
+        evaluate_condition = engine._evaluate_condition
+
+        def slow_condition(condition, transaction_data):
+            time.sleep(0.03)
+            return evaluate_condition(condition, transaction_data)
+
+        with mock.patch.object(engine, '_evaluate_condition', side_effect=slow_condition) as condition:
+            result = engine.evaluate(dict(self.transaction_data, is_international=True))
+
+        self.assertEqual(condition.call_count, 1)
+        self.assertEqual(result.alerts, [])
+        self.assertEqual(result.skipped_rules[0]['reason'], 'timeout')
+
+    def test_rule_error_recorded_in_metrics(self):
+        """Тест: ошибка правила учитывается в RuleMetrics"""
+        engine = RuleEngine()
+        engine.set_rules([self.threshold_rule])
+        with mock.patch.object(engine, '_evaluate_threshold_rule', side_effect=RuntimeError('broken')):
+            result = engine.evaluate(self.transaction_data)
+
+        self.assertEqual(result.skipped_rules[0]['reason'], 'error')
+        metrics = RuleMetrics.objects.get(rule=self.threshold_rule)
+        self.assertEqual((metrics.evaluations_count, metrics.errors_count, metrics.triggers_count), (1, 1, 0))
+
+    @override_settings(RULE_EVALUATION_BUDGET_MS=0)
+    def test_budget_exhausted(self):
+        """Тест исчерпания бюджета задержки"""
+        result = RuleEngine().evaluate(self.transaction_data)
+
+        self.assertEqual(result.alerts, [])
+        self.assertEqual({item['reason'] for item in result.skipped_rules}, {'budget_exhausted'})
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    def test_half_open_after_reset(self):
+        """Тест полуоткрытого состояния после таймаута"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure(1)
+        self.assertTrue(breaker.allow(1))
+        breaker.record_success(1)
+        self.assertEqual(breaker.open_rules(), [])
+
+
+class AlertStreamTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.rule = Rule.objects.create(
+            name="Stream Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 100},
+            active=True
+        )
+        self.broker = AlertBroker(buffer_size=3, poll_seconds=0, settle_seconds=0)
+        self.broker.poll()
+        self.cursor = self.broker.head
+        patcher = mock.patch('apps.rules.views.alert_broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _create_alert(self, severity):
+        return Alert.objects.create(
+            rule=self.rule,
+            transaction_id=f"stream_{severity}",
+            reason="test",
+            severity=severity
+        )
+
+    def test_long_poll_with_filters(self):
+        """Тест long-poll с курсором и фильтром по severity"""
+        self._create_alert('low')
+        high = self._create_alert('high')
+        self.broker.poll()
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/rules/alerts/stream/', {
+                'mode': 'poll', 'cursor': self.cursor, 'severity': 'high', 'timeout': 0
+            })
+
+        data = json.loads(response.content)['data']
+        self.assertEqual([alert['id'] for alert in data['alerts']], [high.id])
+        self.assertEqual(data['cursor'], high.id)
+        self.assertFalse(data['gap'])
+
+    def test_long_poll_resume(self):
+        """Тест продолжения с курсора"""
+        self._create_alert('medium')
+        self.broker.poll()
+        response = self.client.get('/rules/alerts/stream/', {'mode': 'poll', 'cursor': self.cursor, 'timeout': 0})
+        cursor = json.loads(response.content)['data']['cursor']
+
+        response = self.client.get('/rules/alerts/stream/', {'mode': 'poll', 'cursor': cursor, 'timeout': 0})
+        self.assertEqual(json.loads(response.content)['data']['alerts'], [])
+
+    @override_settings(ALERT_STREAM_MAX_SECONDS=0.3, ALERT_STREAM_HEARTBEAT_SECONDS=0.1)
+    async def test_sse_stream(self):
+        """Тест SSE-потока асинхронного представления"""
+        alert = await Alert.objects.acreate(rule=self.rule, transaction_id="stream_sse", reason="test", severity="high")
+        await sync_to_async(self.broker.poll)()
+
+        response = await self.async_client.get('/rules/alerts/stream/', {'cursor': self.cursor})
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertIn(f'id: {alert.id}\nevent: alert', body)
+        self.assertIn(': keepalive', body)
+
+    def test_alerts_of_other_processes_and_portable_cursor(self):
+        """Тест: алерты других процессов видны, курсор одного воркера подходит другому"""
+        first = self._create_alert('low')
+        self.broker.poll()
+        events, cursor, _ = self.broker.read(self.cursor)
+        self.assertEqual([event['alert']['id'] for event in events], [first.id])
+
+        second = self._create_alert('high')
+        other_worker = AlertBroker(buffer_size=3, poll_seconds=0, settle_seconds=0)
+        other_worker.poll()
+        events, _, gap = other_worker.read(cursor)
+        self.assertEqual([event['alert']['id'] for event in events], [second.id])
+        self.assertFalse(gap)
+
+    def test_recent_alerts_settle_and_buffer_reports_gap(self):
+        """Тест: свежие алерты ждут завершения чужих транзакций, вытесненные дают gap"""
+        broker = AlertBroker(buffer_size=3, poll_seconds=0, settle_seconds=5)
+        broker.poll()
+        alerts = [self._create_alert(severity) for severity in ('low', 'medium', 'high', 'critical')]
+
+        self.assertEqual(broker.poll(), 0)
+        self.assertEqual(broker.poll(now=timezone.now() + timedelta(seconds=10)), 3)
+        events, _, gap = broker.read(0)
+        self.assertTrue(gap)
+        self.assertEqual([event['alert']['id'] for event in events], [alert.id for alert in alerts[1:]])
+
+    def test_rolled_back_alert_not_published(self):
+        """Тест: алерт из откаченной транзакции не попадает в поток"""
+        try:
+            with db_transaction.atomic():
+                self._create_alert('high')
+                raise RuntimeError('rollback')
+        except RuntimeError:
+            pass
+        self.assertEqual(self.broker.poll(), 0)
+        self.assertEqual(self.broker.head, self.cursor)
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class BacktestTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='history')
+        rows = [
+            # (amount, hour, fraud)
+            (5000, 3, True),
+            (2000, 14, True),
+            (1500, 2, False),
+            (50, 3, False),
+            (20, 12, False),
+        ]
+        Transactions.objects.bulk_create([
+            Transactions(user=user, value=amount, fraud_flag=fraud,
+                         created_at=datetime(2024, 5, 1 + index, hour, tzinfo=dt_timezone.utc))
+            for index, (amount, hour, fraud) in enumerate(rows)
+        ])
+        self.draft = Rule.objects.create(
+            name="Draft Large Amount",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1000},
+            active=False
+        )
+
+    def test_confusion_matrix(self):
+        """Тест матрицы ошибок для черновика правила"""
+        from .backtest import candidates_from, run_backtest
+
+        report = run_backtest(candidates_from([self.draft.id]), chunk_size=2)
+
+        self.assertEqual(report['transactions'], 5)
+        self.assertEqual(report['chunks'], 3)
+        result = report['rules'][0]
+        self.assertEqual(result['confusion_matrix'], {'tp': 2, 'fp': 1, 'fn': 0, 'tn': 2})
+        self.assertEqual(result['alerts_per_day'], {'2024-05-01': 1, '2024-05-02': 1, '2024-05-03': 1})
+
+    def test_composite_definition_via_api(self):
+        """Тест API бэктеста с несохранённым составным правилом"""
+        definition = {
+            "name": "Night large",
+            "type": "composite",
+            "condition": {"logic": "AND", "conditions": [
+                {"type": "nighttime"},
+                {"type": "amount_threshold", "threshold": 1000, "operator": ">"},
+                {"type": "is_new_user"},
+            ]},
+        }
+        self.client.force_login(User.objects.create_user('backtest_admin', password='x', is_staff=True))
+        response = self.client.post('/rules/backtest/', data=json.dumps({"rules": [definition]}),
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content)['data']['rules'][0]
+        self.assertEqual(result['alerts'], 0)
+        self.assertEqual(result['unsupported'], ['condition is_new_user'])
+
+    def test_api_requires_staff_csrf_and_valid_dates(self):
+        """Тест: бэктест доступен только staff с CSRF-токеном, некорректные даты дают 400"""
+        body = json.dumps({"rule_ids": [self.draft.id]})
+        response = self.client.post('/rules/backtest/', data=body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(User.objects.create_user('backtest_admin', password='x', is_staff=True))
+        response = client.post('/rules/backtest/', data=body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(User.objects.get(username='backtest_admin'))
+        for start in ("yesterday", "2024-13-01T00:00:00", 20240501):
+            response = self.client.post('/rules/backtest/', content_type='application/json',
+                                        data=json.dumps({"rule_ids": [self.draft.id], "start": start}))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['code'], 'INVALID_RANGE')
+
+
+class ShadowEvaluationTestCase(TestCase):
+    def setUp(self):
+        self.live_rule = Rule.objects.create(
+            name="Live Amount",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1000},
+            active=True
+        )
+        self.shadow_rule = Rule.objects.create(
+            name="Shadow Amount",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 500},
+            active=True,
+            shadow=True
+        )
+
+    def test_shadow_rules_do_not_alert(self):
+        """Тест: shadow-правила не создают алертов"""
+        engine = RuleEngine()
+        engine.shadow = ShadowEvaluator(sample_rate=0)
+
+        alerts = engine.evaluate_transaction({"transaction_id": "shadow_1", "amount": 700})
+
+        self.assertEqual([rule.id for rule in engine.rules], [self.live_rule.id])
+        self.assertEqual(alerts, [])
+        self.assertFalse(Alert.objects.exists())
+
+    def test_side_by_side_counters(self):
+        """Тест счётчиков shadow и боевых правил на одной выборке"""
+        engine = RuleEngine()
+        shadow = ShadowEvaluator(sample_rate=1)
+
+        for amount in (100, 700, 2000):
+            shadow.process({"transaction_id": f"shadow_{amount}", "amount": amount}, engine.rules)
+
+        report = shadow.report()
+        self.assertEqual(report['shadow_rules'][0]['rule_id'], self.shadow_rule.id)
+        self.assertEqual(report['shadow_rules'][0]['hits'], 2)
+        self.assertEqual(report['shadow_rules'][0]['live_overlap'], 1)
+        self.assertEqual(report['live_rules'][0]['hits'], 1)
+        self.assertEqual(report['live_rules'][0]['evaluations'], 3)
+
+
+class SharedCountersTestCase(TestCase):
+    def setUp(self):
+        self.rule = Rule.objects.create(
+            name="Counted Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1000},
+            active=True
+        )
+        tmp = tempfile.mkdtemp()
+        self.path = os.path.join(tmp, 'counters.bin')
+
+    @override_settings(RULE_METRICS_PERSIST=False)
+    def test_engine_counts_without_metric_rows(self):
+        """Тест: счётчики узла обновляются без записи RuleMetrics"""
+        engine = RuleEngine()
+        engine.counters = SharedCounters(self.path, stripes=4, max_rules=16, cache_seconds=0)
+
+        for amount in (500, 1500, 2500):
+            engine.evaluate({"transaction_id": f"counted_{amount}", "amount": amount})
+
+        node = engine.counters.aggregate()
+        self.assertEqual(node['evaluations'], 3)
+        self.assertEqual(node['triggers'], 2)
+        self.assertEqual(node['rules'][0]['rule_id'], self.rule.id)
+        self.assertEqual(node['rules'][0]['triggers'], 2)
+        self.assertFalse(RuleMetrics.objects.exists())
+
+    def test_threads_share_process_stripe(self):
+        """Тест: потоки процесса пишут в одну полосу, другой экземпляр видит сумму"""
+        counters = SharedCounters(self.path, stripes=4, max_rules=16, cache_seconds=0)
+
+        def work():
+            for _ in range(100):
+                counters.record_rule(7, True, 0.001)
+                counters.record_evaluation(1, 0)
+
+        threads = [threading.Thread(target=work) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        node = SharedCounters(self.path, stripes=4, max_rules=16, cache_seconds=0).aggregate()
+        self.assertEqual(node['evaluations'], 300)
+        self.assertEqual(node['rules'][0]['evaluations'], 300)
+        self.assertEqual(node['rules'][0]['avg_processing_time_ms'], 1.0)
+        self.assertEqual(node['active_writers'], 1)
+
+    def test_short_lived_threads_do_not_exhaust_stripes(self):
+        """Тест: короткоживущих потоков больше, чем полос, и все они учитываются"""
+        counters = SharedCounters(self.path, stripes=2, max_rules=16, cache_seconds=0)
+
+        for _ in range(20):
+            thread = threading.Thread(target=counters.record_evaluation, args=(1, 0))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(counters.aggregate()['evaluations'], 20)
+
+    def test_layout_change_replaces_file(self):
+        """Тест: смена раскладки создаёт новый файл, старый экземпляр продолжает работать со своей копией"""
+        old = SharedCounters(self.path, stripes=2, max_rules=16, cache_seconds=0)
+        old.record_evaluation(1, 0)
+
+        new = SharedCounters(self.path, stripes=4, max_rules=16, cache_seconds=0)
+        old.record_evaluation(1, 0)
+
+        self.assertEqual(old.aggregate()['evaluations'], 2)
+        self.assertEqual(new.aggregate()['evaluations'], 0)
+        self.assertEqual(os.path.getsize(self.path), new.total_slots * 8)
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.rule = Rule.objects.create(
+            name="Profiled Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1000},
+            active=True
+        )
+        get_rule_engine().load_rules()
+        self.directory = tempfile.mkdtemp()
+        self.profiler = Profiler(self.directory, token='secret')
+        self.transaction_data = {
+            "transaction_id": "profiled_1",
+            "amount": 1500,
+            "user_id": "user_1",
+            "timestamp": timezone.now().isoformat()
+        }
+
+    def _post(self, **headers):
+        with mock.patch('apps.rules.views.get_profiler', return_value=self.profiler):
+            return self.client.post(
+                '/rules/evaluate/',
+                data=json.dumps(self.transaction_data),
+                content_type='application/json',
+                **headers
+            )
+
+    def test_header_profile(self):
+        """Тест профилирования по заголовку: фазы в ответе и профиль на диске"""
+        response = self._post(HTTP_X_RULE_PROFILE='secret')
+
+        self.assertEqual(response.status_code, 200)
+        profile = response.json()['data']['profile']
+        self.assertEqual(profile['trigger'], 'header')
+        self.assertIn('rule_eval', profile['phases_ms'])
+        self.assertIn('alert_write', profile['phases_ms'])
+        self.assertIn(str(self.rule.id), profile['rules_ms'])
+        self.assertIn('parse;dur=', response['Server-Timing'])
+        self.assertTrue(any(name.endswith('profiled_1.folded') for name in os.listdir(self.directory)))
+
+    def test_not_profiled_without_token(self):
+        """Тест: без верного токена запрос не профилируется"""
+        response = self._post(HTTP_X_RULE_PROFILE='wrong')
+
+        self.assertNotIn('profile', response.json()['data'])
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_toggle_profiles_all_requests(self):
+        """Тест переключателя: профилируются запросы без заголовка"""
+        self.profiler.toggle.enable(60, 1.0)
+        response = self._post()
+
+        self.assertTrue(response.has_header('Server-Timing'))
+        self.assertNotIn('profile', response.json()['data'])
+
+    def test_toggle_requires_staff(self):
+        """Тест: переключатель доступен только staff"""
+        response = self.client.post('/rules/profiling/', data='{}', content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_toggle_requires_csrf_token(self):
+        """Тест: сессия staff без CSRF-токена не включает профилирование"""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(User.objects.create_user('profiling_admin', password='x', is_staff=True))
+
+        with mock.patch('apps.rules.views.get_profiler', return_value=self.profiler):
+            response = client.post('/rules/profiling/', data='{"seconds": 60}', content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNone(self.profiler.toggle.state())
+
+    def test_stack_samples_folded(self):
+        """Тест сэмплирования стека в folded-формате"""
+        profile = RequestProfile('sampled', 'sampled')
+        self.profiler.sampler._active[threading.get_ident()] = profile
+        with profile.phase('rule_eval'):
+            self.profiler.sampler.sample()
+        self.profiler.sampler.stop()
+
+        stack, count = next(iter(profile.stacks.items()))
+        self.assertEqual(count, 1)
+        self.assertTrue(stack.startswith('phase:rule_eval;'))
+        self.assertIn('test_stack_samples_folded', stack)
+
+
+class AlertArchiveTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.rule = Rule.objects.create(
+            name="Archived Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1000},
+            active=True
+        )
+        self.archive = AlertArchive(tempfile.mkdtemp(), block_size=2)
+        old = datetime(2024, 1, 10, 12, 0, tzinfo=dt_timezone.utc)
+        for number in range(5):
+            alert = Alert.objects.create(
+                rule=self.rule,
+                transaction_id=f"old_{number % 2}",
+                reason="old",
+                severity="low",
+                transaction_data={"amount": 1500 + number},
+                first_seen=old
+            )
+            Alert.objects.filter(id=alert.id).update(created_at=old)
+        self.recent = Alert.objects.create(rule=self.rule, transaction_id="old_0", reason="recent", severity="low")
+
+    def test_archive_and_lookup(self):
+        """Тест переноса старых алертов в архив и поиска по transaction_id"""
+        stats = self.archive.archive(datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(stats['archived'], 5)
+        self.assertEqual(stats['days'], ['2024-01-10'])
+        self.assertEqual(list(Alert.objects.values_list('id', flat=True)), [self.recent.id])
+
+        records = self.archive.lookup('old_0')
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]['rule_name'], "Archived Rule")
+        self.assertEqual(records[0]['first_seen'], '2024-01-10T12:00:00+00:00')
+        self.assertEqual(self.archive.lookup('old_0', start_day='2024-01-11'), [])
+
+        with mock.patch('apps.rules.views.get_alert_archive', return_value=self.archive):
+            response = self.client.get('/rules/alerts/lookup/', {'transaction_id': 'old_0'})
+        alerts = response.json()['data']['alerts']
+        self.assertEqual([alert['archived'] for alert in alerts], [False, True, True, True])
+
+    def test_compact_merges_day_segments(self):
+        """Тест слияния сегментов одного дня"""
+        self.archive.archive(datetime(2024, 2, 1, tzinfo=dt_timezone.utc), batch_size=2)
+        self.assertEqual(len(self.archive.segments()), 3)
+
+        self.assertEqual(self.archive.compact('2024-01-10'), 3)
+
+        self.assertEqual(len(self.archive.segments()), 1)
+        self.assertEqual(len(self.archive.read_day('2024-01-10')), 5)
+        self.assertEqual(self.archive.stats()['alerts'], 5)
+
+    def test_lookup_uses_transaction_index(self):
+        """Тест: поиск без диапазона дат читает только дни из индекса транзакций и непроиндексированные дни"""
+        self.archive.archive(datetime(2024, 2, 1, tzinfo=dt_timezone.utc), batch_size=2)
+        self.archive.compact('2024-01-10')
+        later = datetime(2024, 1, 20, 12, 0, tzinfo=dt_timezone.utc)
+        for transaction_id in ("new_0", "old_1"):
+            alert = Alert.objects.create(rule=self.rule, transaction_id=transaction_id, reason="later", severity="low")
+            Alert.objects.filter(id=alert.id).update(created_at=later)
+        self.archive.archive(datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+
+        with mock.patch.object(self.archive, '_load_index', wraps=self.archive._load_index) as load_index:
+            self.assertEqual(len(self.archive.lookup('old_1')), 3)
+        self.assertEqual(load_index.call_count, 2)
+
+        self.archive.compact('2024-01-20')
+        with mock.patch.object(self.archive, '_load_index', wraps=self.archive._load_index) as load_index:
+            self.assertEqual(len(self.archive.lookup('new_0')), 1)
+            self.assertEqual(self.archive.lookup('missing'), [])
+        self.assertEqual(load_index.call_count, 1)
+
+    def test_index_cache_is_bounded(self):
+        """Тест: поиск без диапазона дат не держит в памяти индексы всех дней"""
+        self.archive.cached_indexes = 2
+        self.archive.archive(datetime(2024, 2, 1, tzinfo=dt_timezone.utc), batch_size=1)
+
+        self.assertEqual(len(self.archive.lookup('old_1')), 2)
+        self.assertEqual(len(self.archive._indexes), 2)
+
+
+class TransactionPayloadTestCase(TestCase):
+    def setUp(self):
+        for number in range(3):
+            Rule.objects.create(
+                name=f"Payload Rule {number}",
+                type="threshold",
+                condition={"field": "amount", "operator": ">", "value": 100 * number},
+                active=True
+            )
+
+    def test_payload_stored_once_per_transaction(self):
+        """Тест: данные транзакции хранятся один раз на все алерты"""
+        transaction_data = {"transaction_id": "payload_1", "amount": 1500, "note": "x" * 200}
+        alerts = RuleEngine().evaluate_transaction(transaction_data)
+
+        self.assertEqual(len(alerts), 3)
+        payload = TransactionPayload.objects.get()
+        self.assertLess(len(bytes(payload.data)), payload.raw_size)
+        for alert in Alert.objects.select_related('payload'):
+            self.assertEqual(alert.payload_id, payload.id)
+            self.assertIsNone(alert.legacy_transaction_data)
+            self.assertEqual(alert.transaction_data, transaction_data)
+
+    def test_legacy_inline_data_readable(self):
+        """Тест: старые алерты с inline-данными читаются через тот же атрибут"""
+        rule = Rule.objects.first()
+        alert = Alert.objects.create(rule=rule, transaction_id="legacy_1", reason="old",
+                                     transaction_data={"amount": 10})
+
+        self.assertEqual(Alert.objects.get(id=alert.id).transaction_data, {"amount": 10})
+
+
+class ReplicaRoutingTestCase(SimpleTestCase):
+    @override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'])
+    def test_reads_use_replica_only_in_scope(self):
+        """Тест: чтение с реплики только внутри use_replica, запись всегда на primary"""
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Alert))
+
+        with use_replica():
+            replica = router.db_for_read(Alert)
+            self.assertIn(replica, ['replica_0', 'replica_1'])
+            self.assertEqual(router.db_for_read(Rule), replica)
+            self.assertEqual(router.db_for_write(Alert), 'default')
+
+        self.assertIsNone(router.db_for_read(Alert))
+        self.assertFalse(router.allow_migrate('replica_0', 'rules'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        """Тест: без реплик всё читается с default"""
+        with use_replica():
+            self.assertIsNone(ReplicaRouter().db_for_read(Alert))
+
+    def test_replica_views(self):
+        """Тест списка read-only представлений"""
+        self.assertTrue(is_replica_view('rule_alerts'))
+        self.assertTrue(is_replica_view('admin:rules_alert_changelist'))
+        self.assertFalse(is_replica_view('evaluate_transaction'))
+        self.assertFalse(is_replica_view('admin:rules_alert_change'))
+
+
+class RuleSyncTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.rule = Rule.objects.create(
+            name="Synced Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 1000},
+            active=True
+        )
+
+    def test_etag_not_modified_until_rule_changes(self):
+        """Тест ETag/304 для списка правил и сброса версии при изменении"""
+        response = self.client.get('/rules/rules/')
+        etag = response['ETag']
+        self.assertEqual(response.json()['data']['total_count'], 1)
+
+        response = self.client.get('/rules/rules/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        detail = self.client.get(f'/rules/rules/{self.rule.id}/')
+        self.assertEqual(self.client.get(f'/rules/rules/{self.rule.id}/', HTTP_IF_NONE_MATCH=detail['ETag']).status_code, 304)
+
+        self.rule.active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rule.save()
+
+        response = self.client.get('/rules/rules/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['data']['total_count'], 0)
+
+    def test_changes_since_version(self):
+        """Тест дельты изменений после версии"""
+        version = int(self.client.get('/rules/rules/')['X-Rule-Set-Version'])
+        removed_id = self.rule.id
+        with self.captureOnCommitCallbacks(execute=True):
+            new_rule = Rule.objects.create(name="New Rule", type="threshold", condition={}, active=True)
+            self.rule.delete()
+
+        data = self.client.get('/rules/rules/changes/', {'since': version}).json()['data']
+
+        self.assertEqual([rule['id'] for rule in data['upserted']], [new_rule.id])
+        self.assertEqual(data['removed'], [removed_id])
+        self.assertEqual(data['version'], version + 2)
+        self.assertEqual(self.client.get('/rules/rules/changes/', {'since': version + 5}).status_code, 400)
+
+    def test_version_moves_only_after_commit(self):
+        """Тест: версия набора правил меняется только после коммита изменения"""
+        version = int(self.client.get('/rules/rules/')['X-Rule-Set-Version'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.rule.active = False
+            self.rule.save()
+            self.assertEqual(int(self.client.get('/rules/rules/')['X-Rule-Set-Version']), version)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(int(self.client.get('/rules/rules/')['X-Rule-Set-Version']), version + 1)
+        self.assertEqual(RuleChange.objects.get().action, 'updated')
+
+
+class UserProfileTestCase(TestCase):
+    def test_running_statistics_and_checkpoint(self):
+        """Тест статистик Уэлфорда, роста хранилища и восстановления из checkpoint"""
+        store = UserProfileStore(capacity=2)
+        amounts = [10, 12, 11, 13, 9, 250]
+        for amount in amounts:
+            store.observe('u1', amount, hour=14, country='DE')
+        for user in range(5):
+            store.observe(f'other_{user}', 1, country='FR')
+
+        stats = store.stats('u1')
+        mean = sum(amounts) / len(amounts)
+        variance = sum((amount - mean) ** 2 for amount in amounts) / (len(amounts) - 1)
+        self.assertEqual(store.capacity, 8)
+        self.assertAlmostEqual(stats['mean'], mean)
+        self.assertAlmostEqual(stats['std'] ** 2, variance)
+        self.assertEqual(stats['home_country'], 'DE')
+        self.assertEqual(store.hour_share('u1', 14), 1.0)
+
+        path = os.path.join(tempfile.mkdtemp(), 'profiles.bin')
+        self.assertTrue(store.checkpoint(path))
+        restored = UserProfileStore.load(path)
+        self.assertEqual(len(restored), 6)
+        self.assertEqual(restored.stats('u1'), stats)
+        restored.observe('new_user', 5)
+        self.assertEqual(restored.stats('new_user')['count'], 1)
+        self.assertEqual(UserProfileStore.load(path).stats('new_user'), None)
+
+    def test_checkpoint_keys_with_separators(self):
+        """Тест: ключи пользователей с переводом строки не сдвигают индекс после восстановления"""
+        store = UserProfileStore(capacity=4)
+        store.observe('evil\nx', 1)
+        store.observe('victim', 100)
+        path = os.path.join(tempfile.mkdtemp(), 'profiles.bin')
+        store.checkpoint(path)
+
+        restored = UserProfileStore.load(path)
+        self.assertEqual(restored.stats('victim')['mean'], 100)
+        self.assertEqual(restored.stats('evil\nx')['mean'], 1)
+        self.assertIsNone(restored.stats('x'))
+
+    def test_non_finite_amounts_ignored(self):
+        """Тест: NaN и бесконечность не портят статистику пользователя"""
+        store = UserProfileStore(capacity=4)
+        for amount in (10, 12, float('nan'), float('inf'), 11):
+            store.observe('u1', amount)
+        self.assertEqual(store.stats('u1')['count'], 3)
+        self.assertAlmostEqual(store.stats('u1')['mean'], 11)
+
+        other = UserProfileStore(capacity=4)
+        other.observe('u1', 13)
+        other._mean[0] = float('nan')
+        store.merge(other)
+        self.assertAlmostEqual(store.stats('u1')['mean'], 11)
+
+    def test_worker_checkpoints_merge(self):
+        """Тест: checkpoint воркера добавляет его наблюдения, не затирая наблюдения других воркеров"""
+        path = os.path.join(tempfile.mkdtemp(), 'profiles.bin')
+        seed = UserProfileStore(capacity=4)
+        seed.observe('shared', 10, hour=9, country='DE')
+        seed.checkpoint(path)
+
+        workers = [UserProfileStore.load(path), UserProfileStore.load(path)]
+        for worker in workers:
+            worker.enable_checkpoints(path, 300)
+        workers[0].observe('shared', 20, hour=9, country='FR')
+        workers[0].observe('first_only', 5)
+        workers[1].observe('shared', 30, hour=10, country='DE')
+        workers[1].observe('second_only', 7)
+
+        self.assertEqual(workers[0].merge_into(path), 2)
+        self.assertEqual(workers[1].merge_into(path), 2)
+        self.assertEqual(workers[1].merge_into(path), 0)
+
+        merged = UserProfileStore.load(path)
+        reference = UserProfileStore(capacity=4)
+        for amount in (10, 20, 30):
+            reference.observe('shared', amount)
+        shared = merged.stats('shared')
+        self.assertEqual(shared['count'], 3)
+        self.assertAlmostEqual(shared['mean'], 20)
+        self.assertAlmostEqual(shared['std'], reference.stats('shared')['std'])
+        self.assertEqual(shared['home_country'], 'DE')
+        self.assertEqual((shared['hours'][9], shared['hours'][10]), (2, 1))
+        self.assertEqual(merged.stats('first_only')['count'], 1)
+        self.assertEqual(merged.stats('second_only')['count'], 1)
+
+    def test_amount_zscore_condition(self):
+        """Тест условия amount_zscore относительно истории пользователя"""
+        Rule.objects.create(
+            name="Unusual Amount",
+            type="composite",
+            condition={"logic": "AND", "conditions": [{"type": "amount_zscore", "threshold": 3}]},
+            active=True
+        )
+        engine = RuleEngine()
+        engine.profiles = UserProfileStore(capacity=16)
+
+        for number, amount in enumerate([100, 110, 90, 105, 95]):
+            alerts = engine.evaluate_transaction({"transaction_id": f"z_{number}", "user_id": 7, "amount": amount})
+            self.assertEqual(alerts, [])
+
+        self.assertEqual(len(engine.evaluate_transaction({"transaction_id": "z_big", "user_id": 7, "amount": 500})), 1)
+        self.assertEqual(engine.evaluate_transaction({"transaction_id": "z_other", "user_id": 8, "amount": 500}), [])
+
+
+class ValueListTestCase(TestCase):
+    def setUp(self):
+        self.registry = ValueListRegistry(tempfile.mkdtemp())
+
+    def test_upload_lookup_and_version_swap(self):
+        """Тест загрузки списка, проверки вхождения и атомарной смены версии"""
+        info = self.registry.upload('blocked_cards', (f"card-{number}\n" for number in range(1000)))
+        self.assertEqual((info['version'], info['count'], info['bloom']), (1, 1000, True))
+        self.assertTrue(self.registry.contains('blocked_cards', 'card-999'))
+        self.assertTrue(self.registry.contains('blocked_cards', ' card-5 '))
+        self.assertFalse(any(self.registry.contains('blocked_cards', f"other-{number}") for number in range(1000)))
+
+        self.registry.upload('blocked_cards', ['card-new'], append=True)
+        info = self.registry.upload('blocked_cards', ['only-this'], bloom=False)
+        self.assertEqual((info['version'], info['count'], info['bloom']), (3, 1, False))
+
+        fresh = ValueListRegistry(self.registry.directory)
+        self.assertTrue(fresh.contains('blocked_cards', 'only-this'))
+        self.assertFalse(fresh.contains('blocked_cards', 'card-1'))
+        self.assertFalse(fresh.contains('missing_list', 'card-1'))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.registry.directory, 'blocked_cards'))),
+                         ['.lock', 'current', 'v000002.lst', 'v000003.lst'])
+
+    def test_in_list_condition(self):
+        """Тест условия in_list в составном правиле"""
+        self.registry.upload('blocked_users', ['user_13'])
+        Rule.objects.create(
+            name="Blocked User",
+            type="composite",
+            condition={"conditions": [{"type": "in_list", "list": "blocked_users", "field": "user_id"}]},
+            active=True
+        )
+        engine = RuleEngine()
+        engine.lists = self.registry
+
+        self.assertEqual(len(engine.evaluate_transaction({"transaction_id": "l_1", "user_id": "user_13"})), 1)
+        self.assertEqual(engine.evaluate_transaction({"transaction_id": "l_2", "user_id": "user_14"}), [])
+
+    def test_upload_requires_staff(self):
+        """Тест: загрузка списка только для staff"""
+        client = Client()
+        response = client.post('/rules/lists/blocked/', data='a\nb', content_type='text/plain')
+        self.assertEqual(response.status_code, 403)
+
+        client.force_login(User.objects.create_user('list_admin', password='x', is_staff=True))
+        with mock.patch('apps.rules.views.get_value_lists', return_value=self.registry):
+            response = client.post('/rules/lists/blocked/', data='a\nb\n', content_type='text/plain')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()['data']['count'], 2)
+            response = client.get('/rules/lists/blocked/', {'value': 'b'})
+        self.assertTrue(response.json()['data']['contains'])
+
+    def test_upload_requires_csrf_token(self):
+        """Тест: без CSRF-токена сессия staff не может заменить список"""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(User.objects.create_user('list_admin', password='x', is_staff=True))
+        with mock.patch('apps.rules.views.get_value_lists', return_value=self.registry):
+            response = client.post('/rules/lists/blocked/', data='a\nb\n', content_type='text/plain')
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(client.get('/rules/lists/blocked/').status_code, 404)
+
+
+class TextMatchTestCase(TestCase):
+    def test_overlapping_patterns(self):
+        """Тест автомата Ахо-Корасик на пересекающихся шаблонах"""
+        matcher = TextMatcher()
+        for bit, pattern in enumerate(["he", "she", "his", "hers"]):
+            matcher.add(pattern, 1 << bit)
+        matcher.build()
+
+        self.assertEqual(matcher.scan("ushers"), 0b1011)
+        self.assertEqual(matcher.scan("this"), 0b0100)
+        self.assertEqual(matcher.scan("xyz"), 0)
+
+    def test_text_match_rules_share_one_scan(self):
+        """Тест: условия text_match всех правил решаются одним проходом по полю"""
+        Rule.objects.create(
+            name="Gambling Merchant",
+            type="composite",
+            condition={"conditions": [{"type": "text_match", "field": "merchant_name", "patterns": ["casino", "poker"]}]},
+            active=True
+        )
+        Rule.objects.create(
+            name="Crypto Merchant",
+            type="composite",
+            condition={"logic": "AND", "conditions": [
+                {"type": "text_match", "field": "merchant_name", "patterns": ["CRYPTO", "coin"]},
+                {"type": "amount_threshold", "threshold": 100, "operator": ">"},
+            ]},
+            active=True
+        )
+        engine = RuleEngine()
+        self.assertEqual(len(engine.compiled.matchers), 1)
+
+        with mock.patch.object(engine, '_evaluate_condition', wraps=engine._evaluate_condition) as evaluate:
+            alerts = engine.evaluate_transaction({
+                "transaction_id": "t_1", "amount": 500, "merchant_name": "Royal CASINO & Bitcoin",
+            })
+        self.assertEqual(sorted(alert.rule.name for alert in alerts), ["Crypto Merchant", "Gambling Merchant"])
+        self.assertEqual(evaluate.call_count, 1)
+
+        self.assertEqual(engine.evaluate_transaction({"transaction_id": "t_2", "amount": 500, "merchant_name": "Bakery"}), [])
+        self.assertEqual(engine.evaluate_transaction({"transaction_id": "t_3", "amount": 500}), [])
+
+    def test_uncompiled_fallback(self):
+        """Тест вычисления text_match без скомпилированного автомата"""
+        engine = RuleEngine()
+        condition = {"type": "text_match", "field": "description", "patterns": ["Gift Card"]}
+        self.assertTrue(engine._evaluate_condition(condition, {"description": "buy GIFT CARDS now"}))
+        self.assertFalse(engine._evaluate_condition(condition, {"description": None}))
+
+    def test_empty_patterns_match_nothing(self):
+        """Тест: пустые шаблоны не совпадают с любым текстом ни в автомате, ни без него"""
+        condition = {"type": "text_match", "field": "description", "patterns": ["", None]}
+        self.assertFalse(RuleEngine()._evaluate_condition(condition, {"description": "anything"}))
+
+        Rule.objects.create(
+            name="Empty Pattern Rule",
+            type="composite",
+            condition={"conditions": [condition]},
+            active=True
+        )
+        engine = RuleEngine()
+        self.assertEqual(engine.evaluate_transaction({"transaction_id": "t_empty", "description": "anything"}), [])
+
+
+class AlertSuppressionTestCase(TestCase):
+    def setUp(self):
+        self.rule = Rule.objects.create(
+            name="Storm Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 100},
+            active=True,
+            suppression_window=60,
+            suppression_keys=["user_id"]
+        )
+        self.engine = RuleEngine()
+
+    def test_repeat_hits_fold_into_one_alert(self):
+        """Тест: повторные срабатывания по одному ключу сворачиваются в один алерт"""
+        for index in range(50):
+            alerts = self.engine.evaluate_transaction({"transaction_id": f"s_{index}", "amount": 500, "user_id": "u1"})
+            self.assertEqual(len(alerts), 1)
+        self.engine.evaluate_transaction({"transaction_id": "s_other", "amount": 500, "user_id": "u2"})
+
+        self.assertEqual(Alert.objects.count(), 2)
+        self.assertEqual(self.engine.suppressor.suppressed, 49)
+        self.assertEqual(self.engine.suppressor.flush(), 1)
+
+        alert = Alert.objects.get(rule=self.rule, transaction_id="s_0")
+        self.assertEqual(alert.hit_count, 50)
+        self.assertGreaterEqual(alert.last_seen, alert.first_seen)
+        self.assertEqual(Alert.objects.get(transaction_id="s_other").hit_count, 1)
+
+    def test_window_expiry_and_eviction(self):
+        """Тест: после окна создаётся новый алерт, вытесненные агрегаты сбрасываются"""
+        suppressor = AlertSuppressor(max_keys=1)
+        start = timezone.now()
+        alert = self.engine._create_alert(self.rule, {"transaction_id": "w_1"})
+        suppressor.opened(self.rule, {"user_id": "u1"}, alert)
+
+        self.assertIs(suppressor.fold(self.rule, {"user_id": "u1"}, now=start + timedelta(seconds=30)), alert)
+        self.assertIsNone(suppressor.fold(self.rule, {"user_id": "u1"}, now=start + timedelta(seconds=200)))
+
+        other = self.engine._create_alert(self.rule, {"transaction_id": "w_2"})
+        suppressor.opened(self.rule, {"user_id": "u2"}, other)
+        self.assertEqual(len(suppressor), 1)
+        self.assertEqual(suppressor.flush(), 1)
+        self.assertEqual(Alert.objects.get(id=alert.id).hit_count, 2)
+
+    def test_background_flush_without_requests(self):
+        """Тест: накопленные счётчики сбрасываются фоновым потоком без новых запросов"""
+        flushed = threading.Event()
+
+        class Buffer:
+            def flush(self):
+                flushed.set()
+
+        buffer = Buffer()
+        flusher = PeriodicFlusher(buffer.flush, 0.01, 'test-flush')
+        flusher.ensure_started()
+        flusher.ensure_started()
+
+        self.assertTrue(flushed.wait(5))
+        self.assertEqual(sum(thread.name == 'test-flush' for thread in threading.enumerate()), 1)
+        del buffer
+        time.sleep(0.1)
+        self.assertFalse(any(thread.name == 'test-flush' for thread in threading.enumerate()))
+
+    def test_rules_without_window_are_not_suppressed(self):
+        """Тест: правила без окна подавления создают алерт на каждое срабатывание"""
+        self.rule.suppression_window = 0
+        self.rule.save()
+        engine = RuleEngine()
+        for index in range(3):
+            engine.evaluate_transaction({"transaction_id": f"n_{index}", "amount": 500, "user_id": "u1"})
+        self.assertEqual(Alert.objects.count(), 3)
+
+
+class AdmissionControlTestCase(TestCase):
+    def setUp(self):
+        self.cheap_rule = Rule.objects.create(
+            name="Cheap Amount",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 100},
+            tags=["cheap"],
+            active=True
+        )
+        Rule.objects.create(
+            name="Untagged Amount",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 100},
+            active=True
+        )
+        Rule.objects.create(name="Critical ML", type="ml_based", condition={}, threshold=0.0, tags=["critical"], active=True)
+        self.transaction_data = {
+            "transaction_id": "adm_1",
+            "amount": 500,
+            "user_id": "user_1",
+            "timestamp": timezone.now().isoformat(),
+        }
+
+    def test_rejects_when_no_slot_frees_up(self):
+        """Тест: запрос без свободного слота отклоняется"""
+        controller = AdmissionController(max_in_flight=1, queue_timeout=0.01)
+        with controller.admit():
+            with self.assertRaises(Overloaded):
+                with controller.admit():
+                    pass
+        self.assertEqual((controller.admitted, controller.rejected, controller.in_flight), (1, 1, 0))
+
+    def test_degraded_mode_enters_and_recovers(self):
+        """Тест входа в деградированный режим и автоматического восстановления"""
+        controller = AdmissionController(degrade_ms=50, recover_ms=20, recover_seconds=0, alpha=1.0)
+        controller._observe(10, 90)
+        self.assertTrue(controller.degraded)
+        controller._observe(0, 30)
+        self.assertTrue(controller.degraded)
+        controller._observe(0, 5)
+        controller._observe(0, 5)
+        self.assertFalse(controller.degraded)
+
+    def test_forged_request_start_cannot_degrade(self):
+        """Тест: поддельный X-Request-Start не переводит сервис в деградированный режим"""
+        controller = AdmissionController()
+        client = Client()
+        with mock.patch('apps.rules.views.get_admission_controller', return_value=controller), \
+                mock.patch('apps.rules.views.get_rule_engine', return_value=RuleEngine()):
+            client.post('/rules/evaluate/', data=json.dumps(self.transaction_data),
+                        content_type='application/json', HTTP_X_REQUEST_START='t=0')
+            self.assertFalse(controller.degraded)
+
+            with override_settings(EVALUATE_TRUST_REQUEST_START=True):
+                for header in ('t=0', f't={time.time() + 3600}'):
+                    client.post('/rules/evaluate/', data=json.dumps(self.transaction_data),
+                                content_type='application/json', HTTP_X_REQUEST_START=header)
+        self.assertFalse(controller.degraded)
+
+        controller = AdmissionController(degrade_ms=80)
+        controller._observe(1e12, 0)
+        self.assertEqual(controller.latency_ms, controller.alpha * 160)
+        self.assertFalse(controller.degraded)
+
+    def test_degraded_evaluation_runs_tagged_rules_only(self):
+        """Тест: в деградированном режиме оцениваются только правила cheap/critical без ML и метрик"""
+        result = RuleEngine().evaluate(self.transaction_data, degraded=True)
+
+        self.assertTrue(result.degraded)
+        self.assertEqual([alert.rule_id for alert in result.alerts], [self.cheap_rule.id])
+        self.assertEqual(sorted(skipped['rule_name'] for skipped in result.skipped_rules), ["Critical ML", "Untagged Amount"])
+        self.assertEqual({skipped['reason'] for skipped in result.skipped_rules}, {'degraded'})
+        self.assertFalse(RuleMetrics.objects.exists())
+
+    def test_evaluate_endpoint(self):
+        """Тест эндпоинта оценки: деградированный режим в ответе и 503 при перегрузке"""
+        controller = AdmissionController(max_in_flight=1, queue_timeout=0.01)
+        controller.degraded = True
+        client = Client()
+        with mock.patch('apps.rules.views.get_admission_controller', return_value=controller), \
+                mock.patch('apps.rules.views.get_rule_engine', return_value=RuleEngine()):
+            response = client.post('/rules/evaluate/', data=json.dumps(self.transaction_data), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.json()['data']['evaluation_result']['degraded'])
+            self.assertEqual(response.json()['data']['evaluation_result']['alerts_triggered'], 1)
+
+            with controller.admit():
+                response = client.post('/rules/evaluate/', data=json.dumps(self.transaction_data), content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['code'], 'OVERLOADED')
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class LoadTestTestCase(SimpleTestCase):
+    def test_histogram_percentiles(self):
+        """Тест перцентилей лог-линейной гистограммы задержек"""
+        histogram = LatencyHistogram()
+        for value in range(1, 10001):
+            histogram.record(value / 1_000_000)
+        self.assertEqual(histogram.percentile(1), 100)
+        self.assertAlmostEqual(histogram.percentile(50), 5000, delta=5000 * 0.016)
+        self.assertAlmostEqual(histogram.percentile(99), 9900, delta=9900 * 0.016)
+        self.assertEqual(histogram.percentile(100), 10000)
+        self.assertEqual(histogram.summary()['count'], 10000)
+
+    def test_traffic_mix(self):
+        """Тест синтетического трафика: доля подозрительных и обязательные поля"""
+        mix = TrafficMix(suspicious_ratio=0.3, seed=7)
+        transactions = [mix.transaction(index) for index in range(2000)]
+        self.assertAlmostEqual(mix.suspicious_sent / 2000, 0.3, delta=0.05)
+        self.assertEqual(len({transaction['transaction_id'] for transaction in transactions}), 2000)
+        for field in ('transaction_id', 'amount', 'user_id', 'timestamp'):
+            self.assertIn(field, transactions[0])
+
+    def test_open_loop_run_against_sink(self):
+        """Тест открытого цикла нагрузки против локальной заглушки"""
+        async def run(failure_rate):
+            sink = await WebhookSink(failure_rate=failure_rate, seed=1).start()
+            try:
+                load = LoadRun(sink.url + 'rules/evaluate/', TrafficMix(seed=1), rate=200, duration=0.5,
+                               batch_size=2, connections=8)
+                return await load.run(), sink.stats()
+            finally:
+                await sink.stop()
+
+        report, sink_stats = asyncio.run(run(0.0))
+        self.assertEqual(report['requests']['scheduled'], 200)
+        self.assertEqual(report['requests']['ok'], 200)
+        self.assertEqual(sink_stats['requests'], 200)
+        self.assertEqual(report['latency_ms']['corrected']['count'], 200)
+        self.assertGreaterEqual(report['latency_ms']['corrected']['max'], report['latency_ms']['service']['p50'])
+
+        report, _ = asyncio.run(run(1.0))
+        self.assertEqual(report['requests']['errors'], {'http_500': 200})
+        self.assertEqual(report['requests']['error_rate'], 1.0)
+
+
+class MetricsHistoryTestCase(TestCase):
+    def setUp(self):
+        self.rule = Rule.objects.create(
+            name="Amount Rule",
+            type="threshold",
+            condition={"field": "amount", "operator": ">", "value": 100},
+            active=True
+        )
+
+    def test_engine_batches_minute_buckets(self):
+        """Тест: движок копит метрики в памяти и пишет их пачкой в минутные бакеты"""
+        engine = RuleEngine()
+        engine.history = MetricsHistory(flush_seconds=3600)
+        for index, amount in enumerate([50, 500, 700]):
+            engine.evaluate_transaction({"transaction_id": f"h_{index}", "amount": amount})
+        self.assertFalse(RuleMetricsBucket.objects.exists())
+
+        self.assertEqual(engine.history.flush(), 1)
+        engine.history.record(self.rule.id, False, 0.3)
+        engine.history.flush()
+
+        bucket = RuleMetricsBucket.objects.get(rule=self.rule, resolution='minute')
+        self.assertEqual((bucket.evaluations, bucket.triggers, bucket.errors), (4, 2, 0))
+        self.assertEqual(bucket.le_1ms + bucket.gt_250ms, 4)
+
+    @override_settings(RULE_METRICS_MINUTE_RETENTION_HOURS=1)
+    def test_downsample_into_hours_and_days(self):
+        """Тест свёртки минут в часы и дни и удаления по сроку хранения"""
+        day = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        for minute in range(0, 180, 30):
+            RuleMetricsBucket.objects.create(
+                rule=self.rule, resolution='minute', bucket_start=day + timedelta(minutes=minute),
+                evaluations=10, triggers=1, total_time=0.02, le_1ms=10
+            )
+
+        stats = downsample(now=day + timedelta(days=1, hours=1))
+        self.assertEqual((stats['hour_written'], stats['day_written'], stats['minute_deleted']), (3, 1, 6))
+        self.assertEqual(RuleMetricsBucket.objects.get(resolution='day').evaluations, 60)
+        self.assertEqual(
+            list(RuleMetricsBucket.objects.filter(resolution='hour').order_by('bucket_start').values_list('triggers', flat=True)),
+            [2, 2, 2]
+        )
+
+        stats = downsample(now=day + timedelta(days=1, hours=2))
+        self.assertEqual((stats['hour_written'], stats['day_written']), (0, 0))
+
+    def test_late_minutes_are_rolled_up_again(self):
+        """Тест: минуты, записанные после свёртки своего часа, пересчитывают час и день"""
+        hour = datetime(2026, 3, 1, 10, tzinfo=dt_timezone.utc)
+        history = MetricsHistory(flush_seconds=0)
+        history._add(self.rule.id, hour, [10, 1, 0, 0.02, 10, 0, 0, 0, 0, 0, 0, 0])
+        downsample(now=hour + timedelta(days=1))
+
+        history._add(self.rule.id, hour, [5, 5, 0, 0.01, 5, 0, 0, 0, 0, 0, 0, 0])
+        history._add(self.rule.id, hour + timedelta(minutes=59), [1, 0, 0, 0.001, 1, 0, 0, 0, 0, 0, 0, 0])
+        stats = downsample(now=hour + timedelta(days=1, minutes=10))
+
+        self.assertEqual((stats['hour_written'], stats['day_written']), (1, 1))
+        hour_bucket = RuleMetricsBucket.objects.get(resolution='hour')
+        self.assertEqual((hour_bucket.evaluations, hour_bucket.triggers), (16, 6))
+        self.assertEqual(RuleMetricsBucket.objects.get(resolution='day').evaluations, 16)
+        self.assertFalse(RuleMetricsBucket.objects.filter(resolution='minute', rolled_up=False).exists())
+
+    def test_metrics_time_range_query(self):
+        """Тест запроса истории метрик по диапазону времени"""
+        start = datetime(2026, 3, 1, 10, tzinfo=dt_timezone.utc)
+        for hour in range(3):
+            RuleMetricsBucket.objects.create(
+                rule=self.rule, resolution='hour', bucket_start=start + timedelta(hours=hour),
+                evaluations=100, triggers=5 * hour, total_time=0.5, le_5ms=96, le_50ms=4
+            )
+
+        client = Client()
+        response = client.get('/rules/metrics/', {
+            'from': '2026-03-01T10:00:00Z', 'to': '2026-03-01T12:00:00Z', 'resolution': 'hour'
+        })
+        self.assertEqual(response.status_code, 200)
+        history = response.json()['data']['history']
+        buckets = history['series'][0]['buckets']
+        self.assertEqual([bucket['triggers'] for bucket in buckets], [0, 5])
+        self.assertEqual((buckets[1]['avg_ms'], buckets[1]['p95_ms']), (5.0, 5.0))
+
+        response = client.get('/rules/metrics/', {'from': '2026-01-01T00:00:00', 'resolution': 'minute'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['code'], 'INVALID_RANGE')
+        self.assertIsNone(client.get('/rules/metrics/').json()['data']['history'])
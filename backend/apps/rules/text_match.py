@@ -0,0 +1,82 @@
+"""
+Multi-pattern substring matching for text_match conditions.
+
+All patterns of all text_match conditions on one field are compiled into a
+single Aho-Corasick automaton. Each pattern carries a bitmask of the
+conditions that list it, so one scan of the (case-folded) field value yields
+the mask of every matching condition, independent of how many rules or
+patterns there are.
+"""
+from collections import deque
+
+
+class TextMatcher:
+    def __init__(self):
+        self._patterns = {}
+        self._goto = None
+        self._fail = None
+        self._out = None
+
+    def add(self, pattern, mask):
+        pattern = pattern.casefold()
+        if pattern:
+            self._patterns[pattern] = self._patterns.get(pattern, 0) | mask
+
+    def build(self):
+        goto = [{}]
+        out = [0]
+        for pattern, mask in self._patterns.items():
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = goto[state][char] = len(goto)
+                    goto.append({})
+                    out.append(0)
+                state = next_state
+            out[state] |= mask
+
+        # Breadth-first failure links; outputs of the failure state are merged in
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                out[next_state] |= out[fail[next_state]]
+
+        self._goto, self._fail, self._out = goto, fail, out
+        return self
+
+    @property
+    def pattern_count(self):
+        return len(self._patterns)
+
+    def scan(self, text):
+        """Mask of conditions with at least one pattern in `text` (already case-folded)"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        hits = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            hits |= out[state]
+        return hits
+
+
+def text_patterns(condition):
+    """Case-folded patterns of a text_match condition; empty ones are dropped, they would match any text"""
+    patterns = (str(pattern).casefold() for pattern in condition.get('patterns') or [] if pattern is not None)
+    return [pattern for pattern in patterns if pattern]
+
+
+def text_of(value):
+    """Case-folded text of a field value; None for missing values"""
+    if value is None:
+        return None
+    return str(value).casefold()
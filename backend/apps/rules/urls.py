@@ -6,7 +6,15 @@ urlpatterns = [
     path('evaluate/', views.EvaluateTransactionView.as_view(), name='evaluate_transaction'),
     path('rules/', views.RuleManagementView.as_view(), name='rule_management'),
     path('rules/<int:rule_id>/', views.RuleDetailView.as_view(), name='rule_detail'),
+    path('rules/changes/', views.get_rule_changes, name='rule_changes'),
     path('metrics/', views.get_metrics, name='rule_metrics'),
     path('alerts/', views.get_alerts, name='rule_alerts'),
+    path('alerts/stream/', views.stream_alerts, name='rule_alerts_stream'),
+    path('alerts/lookup/', views.lookup_alerts, name='rule_alerts_lookup'),
+    path('shadow/', views.get_shadow_report, name='rule_shadow_report'),
+    path('backtest/', views.backtest_rules, name='rule_backtest'),
+    path('profiling/', views.profiling_toggle, name='rule_profiling_toggle'),
+    path('lists/', views.get_value_lists_view, name='rule_value_lists'),
+    path('lists/<str:name>/', views.value_list_detail, name='rule_value_list_detail'),
     path('health/', views.HealthCheckView.as_view(), name='health_check'),
 ]
\ No newline at end of file
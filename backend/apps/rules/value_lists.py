@@ -0,0 +1,260 @@
+"""
+Named value lists (blocklists of user IDs, cards, devices...) for in_list conditions.
+
+Each list is a directory under VALUE_LISTS_DIR holding immutable versions
+(`v000001.lst`, ...) and a `current` symlink. A version file is an
+open-addressing hash table of 64-bit value fingerprints, optionally preceded
+by a Bloom filter that is checked first:
+
+    header   magic, format, bloom hashes, count, table slots, bloom bits
+    bloom    bloom bits / 8 bytes (absent when bloom bits is 0)
+    table    table slots * uint64 fingerprints (0 = empty), load factor <= 0.5
+
+Uploads write a new version and swap the symlink atomically. Workers map
+the files read-only, so every process on a node shares the same page-cache
+copy, and pick up a new version within LIST_CHECK_SECONDS. Values are
+compared as stripped strings; fingerprints are 64-bit BLAKE2b, so a false
+match needs a hash collision (~n / 2**64).
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from array import array
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FRDLIST1'
+FORMAT = 1
+HEADER = struct.Struct('<8sIIQQQ')  # magic, format, bloom hashes, count, table slots, bloom bits
+
+CURRENT = 'current'
+VERSION_PATTERN = re.compile(r'^v(\d{6})\.lst$')
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+BLOOM_BITS_PER_VALUE = 10
+BLOOM_HASHES = 7
+KEEP_VERSIONS = 2
+
+# How often a process re-reads the `current` symlink of a list it has mapped
+LIST_CHECK_SECONDS = 1.0
+
+
+class InvalidListName(ValueError):
+    pass
+
+
+def normalize(value):
+    return str(value).strip()
+
+
+def fingerprint(value):
+    digest = int.from_bytes(hashlib.blake2b(normalize(value).encode('utf-8'), digest_size=8).digest(), 'little')
+    return digest or 1
+
+
+def _bloom_positions(digest, bits, hashes):
+    # Kirsch-Mitzenmacher double hashing from the two halves of the fingerprint
+    low, high = digest & 0xFFFFFFFF, (digest >> 32) | 1
+    return [(low + i * high) % bits for i in range(hashes)]
+
+
+class MappedList:
+    """One version file mapped read-only"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, file_format, self.bloom_hashes, self.count, self.slots, self.bloom_bits = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or file_format != FORMAT:
+            raise ValueError(f"{path} is not a value list file")
+        bloom_bytes = (self.bloom_bits // 8 + 7) // 8 * 8
+        view = memoryview(self._mmap)
+        self._bloom = view[HEADER.size:HEADER.size + bloom_bytes]
+        start = HEADER.size + bloom_bytes
+        self._table = view[start:start + self.slots * 8].cast('Q')
+        self._mask = self.slots - 1
+
+    def __contains__(self, value):
+        digest = fingerprint(value)
+        if self.bloom_bits:
+            bloom = self._bloom
+            for position in _bloom_positions(digest, self.bloom_bits, self.bloom_hashes):
+                if not bloom[position >> 3] & (1 << (position & 7)):
+                    return False
+        table, mask = self._table, self._mask
+        slot = digest & mask
+        while True:
+            stored = table[slot]
+            if stored == digest:
+                return True
+            if stored == 0:
+                return False
+            slot = (slot + 1) & mask
+
+    def fingerprints(self):
+        return (stored for stored in self._table if stored)
+
+
+def build_list_file(path, digests, bloom=True):
+    """Write a version file for a set of fingerprints"""
+    count = len(digests)
+    slots = 8
+    while slots < count * 2:
+        slots *= 2
+    mask = slots - 1
+    table = array('Q', bytes(slots * 8))
+    for digest in digests:
+        slot = digest & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = digest
+
+    bloom_bits = max(64, count * BLOOM_BITS_PER_VALUE) // 64 * 64 if bloom else 0
+    bloom_bytes = bytearray(bloom_bits // 8)
+    if bloom:
+        for digest in digests:
+            for position in _bloom_positions(digest, bloom_bits, BLOOM_HASHES):
+                bloom_bytes[position >> 3] |= 1 << (position & 7)
+
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.list-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT, BLOOM_HASHES if bloom else 0, count, slots, bloom_bits))
+            f.write(bloom_bytes)
+            f.write(table.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class ValueListRegistry:
+    def __init__(self, directory):
+        self.directory = directory
+        self._mapped = {}
+        self._lock = threading.Lock()
+        self._missing_logged = set()
+
+    def _list_dir(self, name):
+        if not NAME_PATTERN.match(name or ''):
+            raise InvalidListName(f"Invalid list name: {name!r}")
+        return os.path.join(self.directory, name)
+
+    def _versions(self, list_dir):
+        try:
+            names = os.listdir(list_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(int(match.group(1)) for match in map(VERSION_PATTERN.match, names) if match)
+
+    # Writing
+
+    def upload(self, name, values, append=False, bloom=True):
+        """Publish a new version of a list; returns its info"""
+        list_dir = self._list_dir(name)
+        os.makedirs(list_dir, exist_ok=True)
+
+        digests = {fingerprint(value) for value in values if normalize(value)}
+
+        # Versions of one list are written under an exclusive lock file
+        with open(os.path.join(list_dir, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if append:
+                current = self._get(name, max_age=0)
+                if current is not None:
+                    digests.update(current.fingerprints())
+            versions = self._versions(list_dir)
+            version = (versions[-1] if versions else 0) + 1
+            file_name = f"v{version:06d}.lst"
+            build_list_file(os.path.join(list_dir, file_name), digests, bloom=bloom)
+
+            link_tmp = os.path.join(list_dir, f".{CURRENT}-{os.getpid()}")
+            if os.path.lexists(link_tmp):
+                os.unlink(link_tmp)
+            os.symlink(file_name, link_tmp)
+            os.replace(link_tmp, os.path.join(list_dir, CURRENT))
+
+            # Processes that still map an old version keep reading it until they re-check
+            for old in versions[:max(0, len(versions) + 1 - KEEP_VERSIONS)]:
+                os.unlink(os.path.join(list_dir, f"v{old:06d}.lst"))
+
+        logger.info(f"Published value list {name} v{version} with {len(digests)} values")
+        return self.info(name)
+
+    # Reading
+
+    def _get(self, name, max_age=LIST_CHECK_SECONDS):
+        entry = self._mapped.get(name)
+        now = time.monotonic()
+        if entry is not None and now - entry[1] < max_age:
+            return entry[0]
+
+        list_dir = self._list_dir(name)
+        try:
+            target = os.readlink(os.path.join(list_dir, CURRENT))
+        except FileNotFoundError:
+            if name not in self._missing_logged:
+                self._missing_logged.add(name)
+                logger.warning(f"Value list {name} does not exist")
+            return None
+
+        path = os.path.join(list_dir, target)
+        with self._lock:
+            if entry is None or entry[0].path != path:
+                mapped = MappedList(path)
+            else:
+                mapped = entry[0]
+            self._mapped[name] = (mapped, now)
+        return mapped
+
+    def contains(self, name, value):
+        if value is None:
+            return False
+        try:
+            mapped = self._get(name)
+        except (InvalidListName, OSError, ValueError) as e:
+            logger.error(f"Value list {name} unavailable: {e}")
+            return False
+        return mapped is not None and value in mapped
+
+    def info(self, name):
+        mapped = self._get(name, max_age=0)
+        if mapped is None:
+            return None
+        return {
+            'name': name,
+            'version': int(VERSION_PATTERN.match(os.path.basename(mapped.path)).group(1)),
+            'count': mapped.count,
+            'bloom': bool(mapped.bloom_bits),
+            'bytes': os.path.getsize(mapped.path),
+        }
+
+    def names(self):
+        try:
+            return sorted(name for name in os.listdir(self.directory) if NAME_PATTERN.match(name))
+        except FileNotFoundError:
+            return []
+
+
+_registry = None
+
+
+def get_value_lists():
+    global _registry
+    if _registry is None:
+        _registry = ValueListRegistry(settings.VALUE_LISTS_DIR)
+    return _registry
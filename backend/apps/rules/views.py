@@ -1,43 +1,143 @@
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
 import json
 import time
 from .models import Rule, Alert, RuleMetrics
-from .rule_engine import RuleEngine
+from .resilience import Overloaded
+from .rules_engine import get_admission_controller, get_rule_engine, get_shadow_evaluator, get_shared_counters
+from .alert_stream import alert_broker
+from .archive import alert_record, get_alert_archive
+from . import metrics_history
+from .profiling import NULL_PROFILE, get_profiler
+from .rule_sync import (
+    changes_since, current_version, etag_for, if_none_match, rule_as_dict, rule_list_cache, with_version_headers,
+)
+from .value_lists import InvalidListName, get_value_lists
+from .serialization import PayloadDecodeError, UnsupportedMediaType, decode_request, encode_response
 from django.db import transaction
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+SEVERITY_RANK = {value: rank for rank, (value, _) in enumerate(Alert.SEVERITY_CHOICES)}
+
+
+def is_verdict_only(request):
+    """Клиент запросил только вердикт (?verdict_only=1)"""
+    return request.GET.get('verdict_only', '').lower() in ('1', 'true', 'yes')
+
+
+def build_verdict(transaction_id, result):
+    """Минимальный ответ: вердикт, максимальная severity и ID сработавших правил"""
+    alerts = result.alerts
+    severity = max((alert.severity for alert in alerts), key=SEVERITY_RANK.get, default=None)
+    verdict = {
+        'transaction_id': transaction_id,
+        'is_suspicious': len(alerts) > 0,
+        'severity': severity,
+        'rule_ids': [alert.rule_id for alert in alerts],
+        'skipped_rule_ids': [skipped['rule_id'] for skipped in result.skipped_rules],
+    }
+    # Флаг добавляется только в деградированном режиме, чтобы не раздувать обычный ответ
+    if result.degraded:
+        verdict['degraded'] = True
+    return verdict
+
+
+def upstream_queue_ms(request):
+    """
+    Время ожидания запроса у прокси по заголовку X-Request-Start (t=<unix-время в секундах>), мс
+    Заголовок учитывается только за доверенным прокси (EVALUATE_TRUST_REQUEST_START);
+    отрицательные и неправдоподобно большие значения отбрасываются
+    """
+    if not settings.EVALUATE_TRUST_REQUEST_START:
+        return 0.0
+    header = request.META.get('HTTP_X_REQUEST_START', '')
+    try:
+        started = float(header[2:] if header.startswith('t=') else header)
+    except ValueError:
+        return 0.0
+    queued_ms = (time.time() - started) * 1000
+    if not 0 <= queued_ms <= settings.EVALUATE_MAX_UPSTREAM_MS:
+        return 0.0
+    return queued_ms
 
-rule_engine = RuleEngine()
 
 @method_decorator(csrf_exempt, name='dispatch')
 class EvaluateTransactionView(View):
     """
     API endpoint для оценки транзакции по правилам
-    Принимает JSON с данными транзакции
-    Возвращает JSON с результатами оценки
+    Принимает JSON или MessagePack с данными транзакции
+    Возвращает результат оценки в согласованном формате (Accept)
+    Профилирование: заголовок X-Rule-Profile, доля запросов или переключатель администратора
+    Контроль допуска: ограничение параллельных оценок, 503 при перегрузке,
+    деградированный режим (только правила с тегами cheap/critical) при росте задержек
     """
     
     def post(self, request):
         try:
-            # Парсинг JSON из тела запроса
-            data = json.loads(request.body.decode('utf-8'))
+            with get_admission_controller().admit(upstream_queue_ms(request)) as admission:
+                return self._profiled(request, admission)
+        except Overloaded:
+            response = encode_response(request, {
+                'status': 'error',
+                'message': 'Rule engine is overloaded, retry later',
+                'code': 'OVERLOADED'
+            }, status=503)
+            response['Retry-After'] = '1'
+            return response
+    
+    def _profiled(self, request, admission):
+        profiler = get_profiler()
+        profile = profiler.begin(request)
+        if profile is None:
+            return self._evaluate(request, NULL_PROFILE, admission)
+        
+        try:
+            response = self._evaluate(request, profile, admission)
+        finally:
+            profiler.end(profile)
+        response['Server-Timing'] = profile.server_timing()
+        return response
+    
+    def _evaluate(self, request, profile, admission):
+        try:
+            # Парсинг тела запроса (JSON или MessagePack)
+            with profile.phase('parse'):
+                data = decode_request(request)
+            profile.set_label(data.get('transaction_id', '') if isinstance(data, dict) else '')
             
             # Валидация обязательных полей
-            required_fields = ['transaction_id', 'amount', 'user_id', 'timestamp']
-            missing_fields = [field for field in required_fields if field not in data]
+            with profile.phase('validate'):
+                required_fields = ['transaction_id', 'amount', 'user_id', 'timestamp']
+                missing_fields = [field for field in required_fields if field not in data]
             
             if missing_fields:
-                return JsonResponse({
+                return encode_response(request, {
                     'status': 'error',
                     'message': f'Missing required fields: {", ".join(missing_fields)}',
                     'code': 'MISSING_FIELDS'
                 }, status=400)
             
             # Оценка транзакции по правилам
-            start_time = time.time()
-            alerts = rule_engine.evaluate_transaction(data)
-            processing_time = time.time() - start_time
+            start_time = time.perf_counter()
+            result = get_rule_engine().evaluate(data, profile, degraded=admission.degraded)
+            processing_time = time.perf_counter() - start_time
+            alerts = result.alerts
+            
+            if is_verdict_only(request):
+                response_data = {
+                    'status': 'success',
+                    'data': build_verdict(data['transaction_id'], result)
+                }
+                if profile is not NULL_PROFILE and profile.trigger == 'header':
+                    response_data['data']['profile'] = profile.as_dict()
+                with profile.phase('serialize'):
+                    return encode_response(request, response_data)
             
             # Формирование ответа
             response_data = {
@@ -47,7 +147,10 @@ class EvaluateTransactionView(View):
                     'evaluation_result': {
                         'alerts_triggered': len(alerts),
                         'is_suspicious': len(alerts) > 0,
-                        'processing_time_seconds': round(processing_time, 4)
+                        'processing_time_seconds': round(processing_time, 4),
+                        'queue_time_ms': round(admission.queue_ms, 2),
+                        'degraded': result.degraded,
+                        'skipped_rules': result.skipped_rules
                     },
                     'alerts': [
                         {
@@ -57,22 +160,40 @@ class EvaluateTransactionView(View):
                             'rule_type': alert.rule.type,
                             'reason': alert.reason,
                             'severity': alert.severity,
+                            'hit_count': alert.hit_count,
                             'triggered_at': alert.created_at.isoformat()
                         } for alert in alerts
                     ]
                 }
             }
             
-            return JsonResponse(response_data, status=200)
+            # Профиль возвращается в ответе только по заголовку
+            if profile is not NULL_PROFILE and profile.trigger == 'header':
+                response_data['data']['profile'] = profile.as_dict()
+            
+            with profile.phase('serialize'):
+                return encode_response(request, response_data, status=200)
             
         except json.JSONDecodeError:
-            return JsonResponse({
+            return encode_response(request, {
                 'status': 'error',
                 'message': 'Invalid JSON format in request body',
                 'code': 'INVALID_JSON'
             }, status=400)
+        except PayloadDecodeError:
+            return encode_response(request, {
+                'status': 'error',
+                'message': 'Invalid MessagePack payload in request body',
+                'code': 'INVALID_PAYLOAD'
+            }, status=400)
+        except UnsupportedMediaType as e:
+            return encode_response(request, {
+                'status': 'error',
+                'message': str(e),
+                'code': 'UNSUPPORTED_MEDIA_TYPE'
+            }, status=415)
         except Exception as e:
-            return JsonResponse({
+            return encode_response(request, {
                 'status': 'error',
                 'message': f'Internal server error: {str(e)}',
                 'code': 'INTERNAL_ERROR'
@@ -85,30 +206,19 @@ class RuleManagementView(View):
     """
     
     def get(self, request):
-        """Получить все правила (JSON)"""
+        """
+        Получить все активные правила (JSON)
+        ETag — версия набора правил; при совпадении If-None-Match возвращается 304
+        """
         try:
-            rules = Rule.objects.filter(active=True)
-            rules_data = []
-            
-            for rule in rules:
-                rules_data.append({
-                    'id': rule.id,
-                    'name': rule.name,
-                    'type': rule.type,
-                    'condition': rule.condition,
-                    'threshold': rule.threshold,
-                    'active': rule.active,
-                    'created_at': rule.created_at.isoformat(),
-                    'updated_at': rule.updated_at.isoformat(),
-                })
+            version = current_version()
+            etag = etag_for(version)
+            if if_none_match(request, etag):
+                return with_version_headers(HttpResponseNotModified(), etag, version)
             
-            return JsonResponse({
-                'status': 'success',
-                'data': {
-                    'rules': rules_data,
-                    'total_count': len(rules_data)
-                }
-            })
+            # Тело ответа кэшируется в памяти для текущей версии
+            response = HttpResponse(rule_list_cache.body(version), content_type='application/json')
+            return with_version_headers(response, etag, version)
             
         except Exception as e:
             return JsonResponse({
@@ -139,14 +249,18 @@ class RuleManagementView(View):
                 type=data['type'],
                 condition=data['condition'],
                 threshold=data.get('threshold'),
-                active=data.get('active', True)
+                active=data.get('active', True),
+                shadow=data.get('shadow', False),
+                tags=data.get('tags', []),
+                suppression_window=data.get('suppression_window', 0),
+                suppression_keys=data.get('suppression_keys', [])
             )
             
             # Создание метрик для нового правила
             RuleMetrics.objects.create(rule=rule)
             
             # Перезагрузка правил в движке
-            rule_engine.load_rules()
+            get_rule_engine().load_rules()
             
             return JsonResponse({
                 'status': 'success',
@@ -174,25 +288,22 @@ class RuleDetailView(View):
     """API для работы с конкретным правилом"""
     
     def get(self, request, rule_id):
-        """Получить правило по ID"""
+        """Получить правило по ID (ETag по версии набора правил)"""
         try:
+            version = current_version()
+            etag = etag_for(version, f'rule-{rule_id}')
+            if if_none_match(request, etag):
+                return with_version_headers(HttpResponseNotModified(), etag, version)
+            
             rule = Rule.objects.get(id=rule_id)
             
-            return JsonResponse({
+            response = JsonResponse({
                 'status': 'success',
                 'data': {
-                    'rule': {
-                        'id': rule.id,
-                        'name': rule.name,
-                        'type': rule.type,
-                        'condition': rule.condition,
-                        'threshold': rule.threshold,
-                        'active': rule.active,
-                        'created_at': rule.created_at.isoformat(),
-                        'updated_at': rule.updated_at.isoformat(),
-                    }
+                    'rule': rule_as_dict(rule)
                 }
             })
+            return with_version_headers(response, etag, version)
             
         except Rule.DoesNotExist:
             return JsonResponse({
@@ -207,9 +318,53 @@ class RuleDetailView(View):
                 'code': 'RULE_FETCH_ERROR'
             }, status=500)
 
+def get_rule_changes(request):
+    """
+    Изменения правил после версии (?since=N): обновлённые активные правила
+    и ID удалённых или деактивированных
+    """
+    if request.method != 'GET':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Method not allowed',
+            'code': 'METHOD_NOT_ALLOWED'
+        }, status=405)
+    
+    version = current_version()
+    try:
+        since = int(request.GET.get('since', 0))
+        if not 0 <= since <= version:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'since must be an integer between 0 and {version}',
+            'code': 'INVALID_VERSION'
+        }, status=400)
+    
+    etag = etag_for(version, f'changes-{since}')
+    if if_none_match(request, etag):
+        return with_version_headers(HttpResponseNotModified(), etag, version)
+    
+    upserted, removed = changes_since(since)
+    response = JsonResponse({
+        'status': 'success',
+        'data': {
+            'since': since,
+            'version': version,
+            'upserted': upserted,
+            'removed': removed
+        }
+    })
+    return with_version_headers(response, etag, version)
+
 @csrf_exempt
 def get_metrics(request):
-    """Получить метрики Rule Engine (JSON)"""
+    """
+    Получить метрики Rule Engine (JSON)
+    История по времени: ?from=ISO[&to=ISO][&resolution=minute|hour|day][&rule_id=N...]
+    читается из предагрегированных бакетов RuleMetricsBucket
+    """
     if request.method != 'GET':
         return JsonResponse({
             'status': 'error',
@@ -217,6 +372,30 @@ def get_metrics(request):
             'code': 'METHOD_NOT_ALLOWED'
         }, status=405)
     
+    history = None
+    if 'from' in request.GET:
+        try:
+            start = _aware(parse_datetime(request.GET['from']))
+            end = _aware(parse_datetime(request.GET['to'])) if 'to' in request.GET else timezone.now()
+            if start is None or end is None:
+                raise ValueError('from and to must be ISO datetimes')
+            rule_ids = [int(rule_id) for rule_id in request.GET.getlist('rule_id')]
+            resolution, series = metrics_history.query(
+                start, end, resolution=request.GET.get('resolution'), rule_ids=rule_ids
+            )
+        except ValueError as e:
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e),
+                'code': 'INVALID_RANGE'
+            }, status=400)
+        history = {
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'resolution': resolution,
+            'series': series
+        }
+    
     try:
         metrics = RuleMetrics.objects.select_related('rule').all()
         
@@ -227,6 +406,7 @@ def get_metrics(request):
                 'rule_name': metric.rule.name,
                 'evaluations_count': metric.evaluations_count,
                 'triggers_count': metric.triggers_count,
+                'errors_count': metric.errors_count,
                 'avg_processing_time_ms': round(metric.avg_processing_time * 1000, 2),
                 'trigger_ratio': round(metric.triggers_count / metric.evaluations_count, 4) if metric.evaluations_count > 0 else 0,
                 'last_evaluated': metric.last_evaluated.isoformat(),
@@ -236,6 +416,9 @@ def get_metrics(request):
         active_rules = Rule.objects.filter(active=True).count()
         total_rules = Rule.objects.count()
         
+        # Счётчики всех воркеров узла (разделяемая память), без запросов к БД
+        counters = get_shared_counters()
+        
         return JsonResponse({
             'status': 'success',
             'data': {
@@ -244,7 +427,10 @@ def get_metrics(request):
                     'active_rules': active_rules,
                     'total_rules': total_rules
                 },
-                'rule_metrics': metrics_data
+                'rule_metrics': metrics_data,
+                'node': counters.aggregate() if counters is not None else None,
+                'admission': get_admission_controller().stats(),
+                'history': history
             }
         })
         
@@ -255,6 +441,12 @@ def get_metrics(request):
             'code': 'METRICS_FETCH_ERROR'
         }, status=500)
 
+def _aware(value):
+    """Наивное время из запроса считается UTC"""
+    if value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value, dt_timezone.utc)
+    return value
+
 @csrf_exempt
 def get_alerts(request):
     """Получить алерты (JSON)"""
@@ -269,7 +461,7 @@ def get_alerts(request):
         limit = int(request.GET.get('limit', 50))
         offset = int(request.GET.get('offset', 0))
         
-        alerts = Alert.objects.select_related('rule').order_by('-created_at')[offset:offset + limit]
+        alerts = Alert.objects.select_related('rule', 'payload').order_by('-created_at')[offset:offset + limit]
         total_alerts = Alert.objects.count()
         
         alerts_data = []
@@ -282,6 +474,9 @@ def get_alerts(request):
                 'rule_type': alert.rule.type,
                 'reason': alert.reason,
                 'severity': alert.severity,
+                'hit_count': alert.hit_count,
+                'first_seen': alert.first_seen.isoformat() if alert.first_seen else None,
+                'last_seen': alert.last_seen.isoformat() if alert.last_seen else None,
                 'created_at': alert.created_at.isoformat(),
                 'transaction_data': alert.transaction_data
             })
@@ -306,6 +501,340 @@ def get_alerts(request):
             'code': 'ALERTS_FETCH_ERROR'
         }, status=500)
 
+def lookup_alerts(request):
+    """
+    Поиск алертов по transaction_id или дню (?transaction_id=... | ?date=YYYY-MM-DD)
+    Читает горячую таблицу и архивные сегменты; архивные алерты помечены archived=true
+    """
+    if request.method != 'GET':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Method not allowed',
+            'code': 'METHOD_NOT_ALLOWED'
+        }, status=405)
+    
+    transaction_id = request.GET.get('transaction_id')
+    day = request.GET.get('date')
+    if not transaction_id and not day:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'transaction_id or date is required',
+            'code': 'MISSING_FIELDS'
+        }, status=400)
+    
+    try:
+        limit = int(request.GET.get('limit', 500))
+        archive = get_alert_archive()
+        queryset = Alert.objects.select_related('rule', 'payload').order_by('-created_at', '-id')
+        
+        if transaction_id:
+            hot = queryset.filter(transaction_id=transaction_id)
+            if day:
+                hot = hot.filter(created_at__date=day)
+            archived = archive.lookup(transaction_id, start_day=day, end_day=day)
+        else:
+            hot = queryset.filter(created_at__date=day)
+            archived = archive.read_day(day, limit=limit)
+        
+        alerts_data = [dict(alert_record(alert), archived=False) for alert in hot[:limit]]
+        seen = {alert['id'] for alert in alerts_data}
+        alerts_data += [dict(record, archived=True) for record in archived if record['id'] not in seen]
+        
+        return JsonResponse({
+            'status': 'success',
+            'data': {
+                'alerts': alerts_data[:limit],
+                'count': min(len(alerts_data), limit)
+            }
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e),
+            'code': 'ALERTS_FETCH_ERROR'
+        }, status=500)
+
+def _parse_stream_filters(request):
+    severities = {value for value in request.GET.get('severity', '').split(',') if value}
+    rule_ids = {int(value) for value in request.GET.get('rule_id', '').split(',') if value}
+    return severities, rule_ids
+
+
+async def _sse_events(cursor, severities, rule_ids):
+    """Асинхронный генератор Server-Sent Events из буфера алертов"""
+    heartbeat = settings.ALERT_STREAM_HEARTBEAT_SECONDS
+    deadline = time.monotonic() + settings.ALERT_STREAM_MAX_SECONDS
+    yield 'retry: 3000\n\n'
+    
+    while time.monotonic() < deadline:
+        events, cursor, gap = alert_broker.read(cursor, severities, rule_ids)
+        if gap:
+            yield f'event: gap\ndata: {json.dumps({"cursor": cursor})}\n\n'
+        for event in events:
+            yield f'id: {event["seq"]}\nevent: alert\ndata: {json.dumps(event["alert"])}\n\n'
+        if not events and not await alert_broker.wait(cursor, heartbeat):
+            yield ': keepalive\n\n'
+
+
+@csrf_exempt
+async def stream_alerts(request):
+    """
+    Поток новых алертов всех воркеров; курсор — id алерта, общий для всех процессов
+    SSE по умолчанию, long-poll при ?mode=poll
+    Курсор: ?cursor=N или заголовок Last-Event-ID (0 - весь буфер, по умолчанию - только новые)
+    Фильтры: ?severity=high,critical&rule_id=1,2
+    Асинхронное представление: под ASGI (backend.asgi) открытый поток не занимает поток воркера
+    """
+    if request.method != 'GET':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Method not allowed',
+            'code': 'METHOD_NOT_ALLOWED'
+        }, status=405)
+    
+    try:
+        severities, rule_ids = _parse_stream_filters(request)
+        cursor = request.GET.get('cursor', request.headers.get('Last-Event-ID'))
+        cursor = None if cursor is None else int(cursor)
+        timeout = min(float(request.GET.get('timeout', 25)), 60)
+    except ValueError:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'cursor, rule_id and timeout must be numbers',
+            'code': 'INVALID_PARAMETERS'
+        }, status=400)
+    
+    await sync_to_async(alert_broker.prime)()
+    alert_broker.ensure_started()
+    if cursor is None:
+        cursor = alert_broker.head
+    
+    if request.GET.get('mode') == 'poll':
+        events, next_cursor, gap = alert_broker.read(cursor, severities, rule_ids)
+        if not events and timeout > 0 and await alert_broker.wait(next_cursor, timeout):
+            events, next_cursor, gap = alert_broker.read(next_cursor, severities, rule_ids)
+        
+        return JsonResponse({
+            'status': 'success',
+            'data': {
+                'alerts': [event['alert'] for event in events],
+                'cursor': next_cursor,
+                'gap': gap
+            }
+        })
+    
+    response = StreamingHttpResponse(_sse_events(cursor, severities, rule_ids),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@csrf_exempt
+def get_shadow_report(request):
+    """Сравнение shadow-правил с боевыми на выборке живого трафика (JSON)"""
+    if request.method != 'GET':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Method not allowed',
+            'code': 'METHOD_NOT_ALLOWED'
+        }, status=405)
+    
+    shadow = get_shadow_evaluator()
+    if shadow is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Shadow evaluation is disabled (RULE_SHADOW_SAMPLE_RATE = 0)',
+            'code': 'SHADOW_DISABLED'
+        }, status=404)
+    
+    return JsonResponse({
+        'status': 'success',
+        'data': shadow.report()
+    })
+
+def profiling_toggle(request):
+    """
+    Переключатель профилирования для всех воркеров (только staff)
+    GET — состояние, POST {"enabled": true, "seconds": 300, "sample_rate": 0.1}
+    Авторизация по сессии, поэтому POST требует CSRF-токен
+    """
+    if not request.user.is_staff:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Staff access required',
+            'code': 'FORBIDDEN'
+        }, status=403)
+    
+    toggle = get_profiler().toggle
+    if request.method == 'GET':
+        return JsonResponse({
+            'status': 'success',
+            'data': {'enabled': toggle.state() is not None, 'state': toggle.state()}
+        })
+    if request.method != 'POST':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Method not allowed',
+            'code': 'METHOD_NOT_ALLOWED'
+        }, status=405)
+    
+    try:
+        data = json.loads(request.body or b'{}')
+        if not data.get('enabled', True):
+            toggle.disable()
+            return JsonResponse({'status': 'success', 'data': {'enabled': False, 'state': None}})
+        
+        seconds = float(data.get('seconds', 300))
+        sample_rate = float(data.get('sample_rate', 1.0))
+        if not 0 < seconds <= settings.RULE_PROFILE_MAX_TOGGLE_SECONDS or not 0 < sample_rate <= 1:
+            raise ValueError
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({
+            'status': 'error',
+            'message': f'seconds must be in (0, {settings.RULE_PROFILE_MAX_TOGGLE_SECONDS}] and sample_rate in (0, 1]',
+            'code': 'INVALID_PARAMETERS'
+        }, status=400)
+    
+    return JsonResponse({
+        'status': 'success',
+        'data': {'enabled': True, 'state': toggle.enable(seconds, sample_rate)}
+    })
+
+def get_value_lists_view(request):
+    """Список именованных списков значений для условий in_list"""
+    if request.method != 'GET':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Method not allowed',
+            'code': 'METHOD_NOT_ALLOWED'
+        }, status=405)
+    
+    registry = get_value_lists()
+    lists = [registry.info(name) for name in registry.names()]
+    return JsonResponse({
+        'status': 'success',
+        'data': {'lists': [info for info in lists if info is not None]}
+    })
+
+def value_list_detail(request, name):
+    """
+    GET — описание списка (?value=... — проверка вхождения)
+    POST — загрузка новой версии (только staff, с CSRF-токеном сессии): text/plain,
+    одно значение на строку; ?mode=append добавляет к текущей версии, ?bloom=0 отключает фильтр Блума
+    """
+    registry = get_value_lists()
+    try:
+        if request.method == 'GET':
+            info = registry.info(name)
+            if info is None:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'List not found',
+                    'code': 'LIST_NOT_FOUND'
+                }, status=404)
+            if 'value' in request.GET:
+                info['contains'] = registry.contains(name, request.GET['value'])
+            return JsonResponse({'status': 'success', 'data': info})
+        
+        if request.method != 'POST':
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Method not allowed',
+                'code': 'METHOD_NOT_ALLOWED'
+            }, status=405)
+        if not request.user.is_staff:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Staff access required',
+                'code': 'FORBIDDEN'
+            }, status=403)
+        
+        # Тело читается построчно, без загрузки целиком в память
+        values = (line.decode('utf-8') for line in request)
+        info = registry.upload(
+            name,
+            values,
+            append=request.GET.get('mode') == 'append',
+            bloom=request.GET.get('bloom', '1') != '0',
+        )
+        return JsonResponse({'status': 'success', 'data': info}, status=201)
+        
+    except InvalidListName as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e),
+            'code': 'INVALID_LIST_NAME'
+        }, status=400)
+    except UnicodeDecodeError:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'List values must be UTF-8 text',
+            'code': 'INVALID_PAYLOAD'
+        }, status=400)
+
+def backtest_rules(request):
+    """
+    Бэктест правил на исторических транзакциях (JSON, только staff)
+    Тело: {"rule_ids": [...], "rules": [черновики правил], "start": ISO, "end": ISO}
+    Авторизация по сессии, поэтому POST требует CSRF-токен
+    """
+    if not request.user.is_staff:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Staff access required',
+            'code': 'FORBIDDEN'
+        }, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Method not allowed',
+            'code': 'METHOD_NOT_ALLOWED'
+        }, status=405)
+    
+    try:
+        from .backtest import candidates_from, run_backtest
+        
+        data = json.loads(request.body.decode('utf-8'))
+        try:
+            start = _aware(parse_datetime(data['start'])) if data.get('start') else None
+            end = _aware(parse_datetime(data['end'])) if data.get('end') else None
+            if (data.get('start') and start is None) or (data.get('end') and end is None):
+                raise ValueError('start and end must be ISO datetimes')
+        except (TypeError, ValueError) as e:
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e),
+                'code': 'INVALID_RANGE'
+            }, status=400)
+        
+        candidates = candidates_from(data.get('rule_ids', []), data.get('rules', []))
+        if not candidates:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Provide rule_ids and/or rules to backtest',
+                'code': 'NO_CANDIDATES'
+            }, status=400)
+        
+        return JsonResponse({
+            'status': 'success',
+            'data': run_backtest(candidates, start=start, end=end)
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Invalid JSON format',
+            'code': 'INVALID_JSON'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e),
+            'code': 'BACKTEST_ERROR'
+        }, status=500)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class HealthCheckView(View):
     """Health check endpoint"""
@@ -317,6 +846,7 @@ class HealthCheckView(View):
                 'service': 'Rule Engine API',
                 'status': 'healthy',
                 'active_rules': Rule.objects.filter(active=True).count(),
+                'degraded': get_admission_controller().degraded,
                 'total_alerts': Alert.objects.count(),
                 'timestamp': time.time()
             }
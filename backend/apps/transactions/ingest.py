@@ -0,0 +1,211 @@
+"""
+Bulk transaction ingestion.
+
+Streams NDJSON or CSV records, parses them into rows and writes them in
+batches: bulk_create inside large database transactions, or COPY FROM STDIN
+on PostgreSQL. Used by the bulk ingestion endpoint and by
+`manage.py load_transactions`.
+"""
+import csv
+import io
+import json
+import logging
+import time
+from datetime import timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Transactions
+
+logger = logging.getLogger(__name__)
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+COLUMNS = ('user_id', 'value', 'created_at', 'fraud_flag')
+
+# Accepted source names for each column
+FIELD_ALIASES = {
+    'user_id': ('user_id', 'user'),
+    'value': ('value', 'amount'),
+    'created_at': ('created_at', 'timestamp'),
+    'fraud_flag': ('fraud_flag', 'is_fraud'),
+}
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+
+# Values are rounded to the column's scale and must fit its precision
+_value_field = Transactions._meta.get_field('value')
+VALUE_QUANTUM = Decimal(1).scaleb(-_value_field.decimal_places)
+VALUE_LIMIT = Decimal(10) ** (_value_field.max_digits - _value_field.decimal_places)
+
+
+class IngestError(ValueError):
+    """Bad input; line_number is None for errors found when the database rejects a batch"""
+
+    def __init__(self, line_number, message):
+        super().__init__(f"line {line_number}: {message}" if line_number is not None else message)
+        self.line_number = line_number
+
+
+def _field(record, column):
+    for name in FIELD_ALIASES[column]:
+        if name in record and record[name] not in (None, ''):
+            return record[name]
+    return None
+
+
+def parse_record(record, line_number):
+    """Convert a source record (dict) into a row tuple in COLUMNS order"""
+    user_id = _field(record, 'user_id')
+    value = _field(record, 'value')
+    if user_id is None or value is None:
+        raise IngestError(line_number, 'user_id and value are required')
+
+    try:
+        user_id = int(user_id)
+        value = Decimal(str(value))
+    except (ValueError, InvalidOperation):
+        raise IngestError(line_number, 'user_id must be an integer and value a number')
+    # NaN/Infinity parse as Decimals; they and oversized values would fail the whole batch in the database
+    if value.is_finite() and abs(value) < VALUE_LIMIT:
+        value = value.quantize(VALUE_QUANTUM)
+    if not value.is_finite() or abs(value) >= VALUE_LIMIT:
+        raise IngestError(line_number, f'value must be a finite number below {VALUE_LIMIT} in absolute value')
+
+    created_at = _field(record, 'created_at')
+    if created_at is None:
+        created_at = timezone.now()
+    else:
+        try:
+            created_at = parse_datetime(str(created_at))
+        except ValueError:
+            # Well-formed but out of range, e.g. month 13
+            created_at = None
+        if created_at is None:
+            raise IngestError(line_number, 'created_at is not an ISO 8601 datetime')
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at, dt_timezone.utc)
+
+    fraud_flag = _field(record, 'fraud_flag')
+    if not isinstance(fraud_flag, bool):
+        fraud_flag = str(fraud_flag).strip().lower() in TRUE_VALUES if fraud_flag is not None else False
+
+    return user_id, value, created_at, fraud_flag
+
+
+def iter_records(lines, fmt):
+    """
+    Parse an iterable of text lines into row tuples (COLUMNS order).
+    CSV input needs a header row. Errors carry the source line number.
+    """
+    if fmt == NDJSON:
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                raise IngestError(line_number, 'invalid JSON')
+            if not isinstance(record, dict):
+                raise IngestError(line_number, 'expected a JSON object')
+            yield parse_record(record, line_number)
+    elif fmt == CSV:
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield parse_record(record, reader.line_num)
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def decode_lines(byte_lines, encoding='utf-8'):
+    for line in byte_lines:
+        yield line.decode(encoding) if isinstance(line, bytes) else line
+
+
+class TransactionLoader:
+    """
+    Writes parsed rows in batches of `batch_size`, committing every
+    `batches_per_transaction` batches. `progress(stats)` is called after
+    each commit.
+    """
+
+    def __init__(self, batch_size=5000, batches_per_transaction=10, use_copy=None, progress=None):
+        self.batch_size = batch_size
+        self.batches_per_transaction = batches_per_transaction
+        if use_copy is None:
+            use_copy = connection.vendor == 'postgresql'
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.progress = progress
+        self.stats = {'rows': 0, 'batches': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+
+    def load(self, rows):
+        started = time.perf_counter()
+        rows = iter(rows)
+        chunk_rows = self.batch_size * self.batches_per_transaction
+
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+
+            try:
+                with transaction.atomic():
+                    for start in range(0, len(chunk), self.batch_size):
+                        batch = chunk[start:start + self.batch_size]
+                        if self.use_copy:
+                            self._copy_batch(batch)
+                        else:
+                            self._insert_batch(batch)
+                        self.stats['batches'] += 1
+            except IntegrityError as e:
+                # Foreign keys are checked at commit, so the failing row is not known
+                first = self.stats['rows'] + 1
+                raise IngestError(
+                    None, f"records {first}-{first + len(chunk) - 1} were rejected, check that every user_id exists: {e}"
+                )
+
+            self.stats['rows'] += len(chunk)
+            self._update_rate(started)
+            if self.progress is not None:
+                self.progress(dict(self.stats))
+
+        self._update_rate(started)
+        logger.info(f"Loaded {self.stats['rows']} transactions in {self.stats['seconds']:.1f}s")
+        return self.stats
+
+    def _update_rate(self, started):
+        elapsed = time.perf_counter() - started
+        self.stats['seconds'] = round(elapsed, 3)
+        self.stats['rows_per_second'] = round(self.stats['rows'] / elapsed, 1) if elapsed > 0 else 0.0
+
+    def _insert_batch(self, batch):
+        Transactions.objects.bulk_create(
+            [Transactions(user_id=user_id, value=value, created_at=created_at, fraud_flag=fraud_flag)
+             for user_id, value, created_at, fraud_flag in batch],
+            batch_size=self.batch_size,
+        )
+
+    def _copy_batch(self, batch):
+        table = connection.ops.quote_name(Transactions._meta.db_table)
+        sql = f"COPY {table} ({', '.join(COLUMNS)}) FROM STDIN"
+
+        with connection.cursor() as cursor:
+            if hasattr(cursor.cursor, 'copy'):
+                # psycopg 3: rows are adapted by the driver
+                with cursor.cursor.copy(sql) as copy:
+                    for row in batch:
+                        copy.write_row(row)
+            else:
+                # psycopg2: feed CSV text
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for user_id, value, created_at, fraud_flag in batch:
+                    writer.writerow([user_id, value, created_at.isoformat(), 't' if fraud_flag else 'f'])
+                buffer.seek(0)
+                cursor.cursor.copy_expert(f"{sql} WITH (FORMAT csv)", buffer)
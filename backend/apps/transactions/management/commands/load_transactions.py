@@ -0,0 +1,69 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.transactions.ingest import CSV, NDJSON, IngestError, TransactionLoader, iter_records
+
+
+class Command(BaseCommand):
+    help = 'Stream transactions from an NDJSON or CSV file (optionally .gz, "-" for stdin) into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=[NDJSON, CSV],
+                            help='Input format (default: guessed from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--batches-per-transaction', type=int, default=10)
+        parser.add_argument('--copy', dest='use_copy', action='store_true', default=None,
+                            help='Use COPY FROM STDIN (PostgreSQL only, default there)')
+        parser.add_argument('--no-copy', dest='use_copy', action='store_false',
+                            help='Always use bulk_create')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or self._guess_format(path)
+        if options['batch_size'] <= 0 or options['batches_per_transaction'] <= 0:
+            raise CommandError('Batch sizes must be positive')
+
+        loader = TransactionLoader(
+            batch_size=options['batch_size'],
+            batches_per_transaction=options['batches_per_transaction'],
+            use_copy=options['use_copy'],
+            progress=self._report,
+        )
+
+        stream = self._open(path)
+        try:
+            stats = loader.load(iter_records(stream, fmt))
+        except IngestError as e:
+            raise CommandError(f"{e} ({loader.stats['rows']} rows loaded before the error)")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {stats['rows']} transactions in {stats['seconds']}s "
+            f"({stats['rows_per_second']} rows/s, {'COPY' if loader.use_copy else 'bulk_create'})"
+        ))
+
+    def _report(self, stats):
+        self.stdout.write(f"  {stats['rows']} rows, {stats['rows_per_second']} rows/s")
+
+    def _guess_format(self, path):
+        name = path[:-3] if path.endswith('.gz') else path
+        if name.endswith('.csv'):
+            return CSV
+        if name.endswith(('.ndjson', '.jsonl', '.json')):
+            return NDJSON
+        raise CommandError('Cannot guess the input format, pass --format')
+
+    def _open(self, path):
+        if path == '-':
+            return sys.stdin
+        try:
+            if path.endswith('.gz'):
+                return gzip.open(path, 'rt', encoding='utf-8', newline='')
+            return open(path, encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(str(e))
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from django.contrib.auth.models import User  
 
@@ -6,5 +7,14 @@ from django.contrib.auth.models import User
 class Transactions(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     value = models.DecimalField(max_digits=10, decimal_places=2)
-    created_at = models.DateTimeField(auto_now_add=True)
-    fraud_flag = models.BooleanField(default=False)
\ No newline at end of file
+    # Not auto_now_add: historical loads carry their own timestamps
+    created_at = models.DateTimeField(default=timezone.now)
+    fraud_flag = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination (newest first) for the admin and the transaction browser
+            models.Index(fields=['-created_at', '-id']),
+            # Same order within the fraud / normal filter
+            models.Index(fields=['fraud_flag', '-created_at', '-id']),
+        ]
@@ -1,3 +1,94 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+
+from .ingest import CSV, NDJSON, IngestError, TransactionLoader, iter_records
+from .models import Transactions
+
+
+class TransactionIngestTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('loader', password='secret')
+        self.admin = User.objects.create_user('admin', password='secret', is_staff=True)
+
+    def test_loader_batches_ndjson(self):
+        """Тест пакетной загрузки NDJSON"""
+        lines = [
+            json.dumps({'user_id': self.user.id, 'amount': 10 + index,
+                        'timestamp': '2024-01-01T03:00:00Z', 'fraud_flag': index % 2 == 0})
+            for index in range(25)
+        ]
+        progress = []
+        loader = TransactionLoader(batch_size=10, batches_per_transaction=1, progress=progress.append)
+        stats = loader.load(iter_records(lines, NDJSON))
+
+        self.assertEqual(stats['rows'], 25)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual([item['rows'] for item in progress], [10, 20, 25])
+        self.assertEqual(Transactions.objects.filter(fraud_flag=True).count(), 13)
+        self.assertEqual(Transactions.objects.first().created_at.year, 2024)
+
+    def test_invalid_record_reports_line(self):
+        """Тест ошибки с номером строки"""
+        lines = ['user_id,value', f'{self.user.id},10', f'{self.user.id},abc']
+        with self.assertRaises(IngestError) as error:
+            list(iter_records(lines, CSV))
+        self.assertEqual(error.exception.line_number, 3)
+
+    def test_non_finite_or_oversized_value_reports_line(self):
+        """Тест: NaN, бесконечность и значения вне точности поля — ошибка записи, а не 500"""
+        for value in ('NaN', 'Infinity', '-inf', '100000000', '99999999.999', '1e30'):
+            lines = ['user_id,value', f'{self.user.id},10', f'{self.user.id},{value}']
+            with self.assertRaises(IngestError) as error:
+                list(iter_records(lines, CSV))
+            self.assertEqual(error.exception.line_number, 3)
+
+        rows = list(iter_records([json.dumps({'user_id': self.user.id, 'value': 12.345})], NDJSON))
+        self.assertEqual(str(rows[0][1]), '12.34')
+
+        self.client.force_login(self.admin)
+        response = self.client.post('/transactions/bulk/', data=f'{{"user_id": {self.user.id}, "value": NaN}}',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_datetime_reports_line(self):
+        """Тест: корректная по форме, но несуществующая дата — ошибка записи, а не 500"""
+        lines = [json.dumps({'user_id': self.user.id, 'value': 1, 'created_at': '2024-13-45T00:00:00'})]
+        with self.assertRaises(IngestError) as error:
+            list(iter_records(lines, NDJSON))
+        self.assertEqual(error.exception.line_number, 1)
+
+    def test_bulk_endpoint_csv(self):
+        """Тест endpoint потоковой загрузки CSV"""
+        self.client.force_login(self.admin)
+        body = 'user_id,value,created_at,fraud_flag\n' + ''.join(
+            f'{self.user.id},{index}.50,2024-02-0{index + 1}T12:00:00Z,0\n' for index in range(3)
+        )
+
+        response = self.client.post('/transactions/bulk/', data=body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['data']['rows'], 3)
+        self.assertEqual(Transactions.objects.count(), 3)
+
+    def test_bulk_endpoint_requires_staff(self):
+        """Тест: загрузка доступна только администраторам"""
+        self.client.force_login(self.user)
+        response = self.client.post('/transactions/bulk/', data='', content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+
+
+class TransactionIngestCommitTestCase(TransactionTestCase):
+    def test_unknown_user_is_bad_request(self):
+        """Тест: неизвестный user_id отклоняется с 400, а не 500"""
+        admin = User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.force_login(admin)
+        body = f'user_id,value\n{admin.id},10\n{admin.id + 1000},20\n'
+
+        response = self.client.post('/transactions/bulk/', data=body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['code'], 'INVALID_RECORD')
+        self.assertEqual(response.json()['data']['rows_loaded'], 0)
+        self.assertFalse(Transactions.objects.exists())
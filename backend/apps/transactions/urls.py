@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('bulk/', views.BulkTransactionIngestView.as_view(), name='transactions_bulk_ingest'),
+]
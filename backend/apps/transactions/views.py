@@ -1,3 +1,56 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from .ingest import CSV, NDJSON, IngestError, TransactionLoader, decode_lines, iter_records
+
+CONTENT_TYPE_FORMATS = {
+    'application/x-ndjson': NDJSON,
+    'application/jsonl': NDJSON,
+    'application/json': NDJSON,
+    'text/csv': CSV,
+}
+
+
+class BulkTransactionIngestView(APIView):
+    """
+    Потоковая загрузка транзакций (NDJSON или CSV с заголовком)
+    Тело читается построчно и пишется пачками, без загрузки целиком в память
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        content_type = (request.content_type or '').split(';', 1)[0].strip().lower()
+        fmt = CONTENT_TYPE_FORMATS.get(content_type)
+        if fmt is None:
+            return Response({
+                'status': 'error',
+                'message': f'Unsupported content type: {content_type or "none"}',
+                'code': 'UNSUPPORTED_MEDIA_TYPE'
+            }, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        try:
+            batch_size = int(request.query_params.get('batch_size', 5000))
+        except ValueError:
+            batch_size = 0
+        if batch_size <= 0:
+            return Response({
+                'status': 'error',
+                'message': 'batch_size must be a positive integer',
+                'code': 'INVALID_BATCH_SIZE'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        loader = TransactionLoader(batch_size=batch_size)
+        lines = decode_lines(request.stream or [])
+        try:
+            stats = loader.load(iter_records(lines, fmt))
+        except IngestError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e),
+                'code': 'INVALID_RECORD',
+                'data': {'rows_loaded': loader.stats['rows']}
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'status': 'success', 'data': stats}, status=status.HTTP_201_CREATED)
@@ -0,0 +1,22 @@
+"""
+ASGI config for the machine-to-machine API entry point.
+
+Same settings and URLs as backend.api_wsgi, for ASGI servers, e.g.:
+
+    uvicorn backend.api_asgi:application --host 0.0.0.0 --port 8001 --workers 4
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+# Assigned, not setdefault: deployments export DJANGO_SETTINGS_MODULE for the main app,
+# and this entry point must not fall back to the full settings
+os.environ['DJANGO_SETTINGS_MODULE'] = 'backend.api_settings'
+
+application = get_asgi_application()
+
+# Deserialize the rule snapshot once per worker process
+from apps.rules.rules_engine import preload_rule_engine  # noqa: E402
+
+preload_rule_engine()
@@ -0,0 +1,18 @@
+"""
+Settings for the machine-to-machine API entry point (backend.api_wsgi).
+
+Inherits everything from backend.settings but runs with a minimal middleware
+stack: the scoring endpoints are csrf_exempt and never touch sessions, auth
+or messages, so that work is pure overhead on every call.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+MIDDLEWARE = []
+
+ROOT_URLCONF = 'backend.api_urls'
+
+WSGI_APPLICATION = 'backend.api_wsgi.application'
+
+# The admin is not routed here, so its middleware requirements don't apply
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
@@ -0,0 +1,14 @@
+"""
+URL configuration for the machine-to-machine API entry point.
+
+Only the scoring endpoints are exposed here; the admin, dashboards and rule
+management stay on the main application (backend.urls).
+"""
+from django.urls import path
+
+from apps.rules import views as rules_views
+
+urlpatterns = [
+    path('rules/evaluate/', rules_views.EvaluateTransactionView.as_view(), name='api_evaluate_transaction'),
+    path('rules/health/', rules_views.HealthCheckView.as_view(), name='api_health_check'),
+]
@@ -0,0 +1,24 @@
+"""
+WSGI config for the machine-to-machine API entry point.
+
+Runs the scoring endpoints with a minimal middleware stack
+(see backend.api_settings). Serve it next to the main application, e.g.:
+
+    gunicorn backend.api_wsgi:application --preload --bind 0.0.0.0:8001
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+# Assigned, not setdefault: deployments export DJANGO_SETTINGS_MODULE for the main app,
+# and this entry point must not fall back to the full settings
+os.environ['DJANGO_SETTINGS_MODULE'] = 'backend.api_settings'
+
+application = get_wsgi_application()
+
+# Deserialize the rule snapshot once; with `gunicorn --preload` this runs in
+# the master and forked workers share it
+from apps.rules.rules_engine import preload_rule_engine  # noqa: E402
+
+preload_rule_engine()
@@ -0,0 +1,17 @@
+"""
+ASGI config for the main application.
+
+Serves the same URLs as backend.wsgi. Use it for /rules/alerts/stream/: the
+stream view is async, so open SSE and long-poll connections do not hold
+worker threads, e.g.:
+
+    uvicorn backend.asgi:application --host 0.0.0.0 --port 8002
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+application = get_asgi_application()
@@ -0,0 +1,86 @@
+"""
+Read-replica routing.
+
+Reads go to a replica only inside a replica scope; everything else, including
+the evaluate path, stays on the primary. A scope is opened by
+ReplicaRoutingMiddleware for GET/HEAD requests to the views listed in
+DATABASE_REPLICA_VIEWS, or explicitly with `use_replica()` (context manager
+or decorator). One replica is picked per scope, so a request sees a single
+consistent replica. Without configured replicas every query uses `default`.
+"""
+import random
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from fnmatch import fnmatchcase
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+_replica = ContextVar('db_replica', default=None)
+
+
+def replica_aliases():
+    return settings.DATABASE_REPLICAS
+
+
+class use_replica(ContextDecorator):
+    """Route reads in this block to one of the replicas (no-op without replicas)"""
+
+    def __enter__(self):
+        aliases = replica_aliases()
+        self._token = _replica.set(random.choice(aliases) if aliases else None)
+        return self
+
+    def __exit__(self, *exc_info):
+        _replica.reset(self._token)
+        return False
+
+
+def current_replica():
+    return _replica.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db == PRIMARY
+
+
+def is_replica_view(view_name):
+    return any(fnmatchcase(view_name, pattern) for pattern in settings.DATABASE_REPLICA_VIEWS)
+
+
+class ReplicaRoutingMiddleware:
+    """Opens a replica scope for safe requests to read-only views"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._replica_scope = None
+        try:
+            return self.get_response(request)
+        finally:
+            if request._replica_scope is not None:
+                request._replica_scope.__exit__(None, None, None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') or not replica_aliases():
+            return None
+        match = request.resolver_match
+        if match is not None and is_replica_view(match.view_name):
+            request._replica_scope = use_replica().__enter__()
+        return None
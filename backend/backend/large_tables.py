@@ -0,0 +1,82 @@
+"""
+Admin support for large tables.
+
+The stock changelist counts the whole table twice per page (paginator and
+"N total"), date_hierarchy scans it for distinct dates, and related list
+filters load every row of the related table as a choice. LargeTableAdminMixin
+replaces the counts with planner estimates (unfiltered lists) or counts
+bounded by ADMIN_EXACT_COUNT_LIMIT (filtered lists), and
+BoundedRelatedFieldListFilter caps filter choices at ADMIN_FILTER_MAX_CHOICES.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def estimated_row_count(model, using='default'):
+    """Row count from the planner statistics, or None when there are none"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # -1 until the table has been vacuumed or analyzed
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            estimate = row[0] if row else None
+        elif connection.vendor == 'sqlite':
+            # sqlite_stat1 exists after ANALYZE; an index stat starts with the table's row count
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            estimate = int(row[0].split()[0]) if row else None
+        else:
+            return None
+    return estimate if estimate is not None and estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts more than ADMIN_EXACT_COUNT_LIMIT rows.
+
+    Unfiltered querysets use the planner estimate once the table is larger than
+    the limit; filtered ones are counted up to limit + 1, so a broad filter
+    shows "limit + 1" results and a capped page range.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return queryset.order_by()[:limit + 1].count()
+
+
+class BoundedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """Related-object filter offering at most ADMIN_FILTER_MAX_CHOICES choices"""
+
+    def field_choices(self, field, request, model_admin):
+        queryset = field.remote_field.model._default_manager.complex_filter(field.get_limit_choices_to())
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        attname = field.remote_field.get_related_field().attname
+        return [(getattr(obj, attname), str(obj)) for obj in queryset[:settings.ADMIN_FILTER_MAX_CHOICES]]
+
+
+class LargeTableAdminMixin:
+    """ModelAdmin defaults for tables too large to count or scan per page view"""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
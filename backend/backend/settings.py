@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +55,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'backend.db_routing.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,12 +83,79 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (local runs) or postgres (docker-compose). Replicas are read-only
+# copies of the primary listed in DB_REPLICA_HOSTS ("host[:port],..."); reads are sent
+# to them only for the views in DATABASE_REPLICA_VIEWS (see backend/db_routing.py).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    _postgres = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'frauddb'),
+        'USER': os.environ.get('DB_USER', 'fraud'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'fraud'),
+        'HOST': os.environ.get('DB_HOST', 'db'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
     }
-}
+    if os.environ.get('DB_POOL', '0') == '1':
+        # psycopg 3 connection pool (pip install "psycopg[pool]"); replaces persistent connections
+        _postgres['CONN_MAX_AGE'] = 0
+        _postgres['OPTIONS'] = {'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': 10,
+        }}
+    else:
+        _postgres['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+    DATABASES = {'default': _postgres}
+    for _index, _host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+        _replica_host, _, _replica_port = _host.strip().partition(':')
+        DATABASES[f'replica_{_index}'] = dict(
+            _postgres,
+            HOST=_replica_host,
+            PORT=_replica_port or _postgres['PORT'],
+            TEST={'MIRROR': 'default'},
+        )
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'OPTIONS': {
+                # WAL lets readers run alongside the single writer; IMMEDIATE avoids
+                # lock-upgrade deadlocks between concurrent write transactions
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+DATABASE_ROUTERS = ['backend.db_routing.ReplicaRouter']
+
+# View names (fnmatch patterns) whose GET requests read from a replica
+DATABASE_REPLICA_VIEWS = [
+    'rule_alerts',
+    'rule_alerts_lookup',
+    'rule_metrics',
+    'statistics',
+    'api_statistics',
+    'export_transactions',
+    'transaction_list',
+    'rule_list',
+    'admin:*_changelist',
+]
 
 
 # Password validation
@@ -129,3 +198,143 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Rule engine
+# Compiled rule set written by `manage.py build_rule_snapshot` and loaded at worker boot
+
+RULE_SNAPSHOT_PATH = os.environ.get('RULE_SNAPSHOT_PATH', str(BASE_DIR / 'var' / 'rules.snapshot'))
+
+# Latency budget for one transaction evaluation; rules not started in time are skipped
+RULE_EVALUATION_BUDGET_MS = float(os.environ.get('RULE_EVALUATION_BUDGET_MS', 100))
+
+# Per-rule timeout, capped by the remaining budget. Rule types listed in RULE_ISOLATED_TYPES
+# (blocking calls) run on a thread pool and are abandoned when it expires; other rules check
+# it before each composite condition and time out there. Rules exceeding it count as slow
+RULE_TIMEOUT_MS = float(os.environ.get('RULE_TIMEOUT_MS', 20))
+RULE_ISOLATED_TYPES = ['ml_based']
+RULE_ISOLATED_WORKERS = 4
+
+# Circuit breaker: skip a rule after N consecutive failures/slow runs for the reset period
+RULE_BREAKER_FAILURE_THRESHOLD = 5
+RULE_BREAKER_RESET_SECONDS = 30
+
+# Admission control for /rules/evaluate/: at most EVALUATE_MAX_IN_FLIGHT evaluations per
+# process; a request waits up to EVALUATE_QUEUE_TIMEOUT_MS for a slot and gets 503 after that.
+# Degraded mode (only rules tagged with RULE_DEGRADED_TAGS, no ML rules, no RuleMetrics rows)
+# starts when the average queue + evaluation time exceeds EVALUATE_DEGRADE_MS and ends once
+# it has stayed below EVALUATE_RECOVER_MS for EVALUATE_RECOVER_SECONDS
+EVALUATE_MAX_IN_FLIGHT = int(os.environ.get('EVALUATE_MAX_IN_FLIGHT', 32))
+EVALUATE_QUEUE_TIMEOUT_MS = float(os.environ.get('EVALUATE_QUEUE_TIMEOUT_MS', 50))
+EVALUATE_DEGRADE_MS = float(os.environ.get('EVALUATE_DEGRADE_MS', 80))
+EVALUATE_RECOVER_MS = float(os.environ.get('EVALUATE_RECOVER_MS', 40))
+EVALUATE_RECOVER_SECONDS = 10
+# Time spent at the proxy (X-Request-Start) counts towards the average only when the proxy in
+# front sets the header itself and strips it from clients; larger values are ignored as bogus
+EVALUATE_TRUST_REQUEST_START = os.environ.get('EVALUATE_TRUST_REQUEST_START', '0') == '1'
+EVALUATE_MAX_UPSTREAM_MS = 10000
+RULE_DEGRADED_TAGS = ['cheap', 'critical']
+
+# Shadow rules (Rule.shadow): fraction of live transactions re-evaluated in the background
+# against shadow and live rule sets; 0 disables sampling
+RULE_SHADOW_SAMPLE_RATE = float(os.environ.get('RULE_SHADOW_SAMPLE_RATE', 0))
+RULE_SHADOW_QUEUE_SIZE = 1000
+RULE_SHADOW_REFRESH_SECONDS = 60
+
+# Per-user behavioural profiles for amount_zscore / unusual_hour / foreign_country conditions.
+# Each worker keeps its own store, restored from USER_PROFILE_PATH and merging its new
+# observations into it every USER_PROFILE_CHECKPOINT_SECONDS (empty path disables profiles); `manage.py build_user_profiles` seeds it from history
+USER_PROFILE_PATH = os.environ.get('USER_PROFILE_PATH', str(BASE_DIR / 'var' / 'user-profiles.bin'))
+USER_PROFILE_CAPACITY = 100_000
+USER_PROFILE_CHECKPOINT_SECONDS = 300
+
+# Named value lists for in_list conditions: versioned memory-mapped hash tables,
+# uploaded via /rules/lists/<name>/ or `manage.py load_value_list`
+VALUE_LISTS_DIR = os.environ.get('VALUE_LISTS_DIR', str(BASE_DIR / 'var' / 'lists'))
+
+# Node-wide engine counters shared by all workers through a memory-mapped file
+# (empty path disables them). Stripes must cover workers x threads per node.
+ENGINE_COUNTERS_PATH = os.environ.get('ENGINE_COUNTERS_PATH', str(BASE_DIR / 'var' / 'engine-counters.bin'))
+ENGINE_COUNTERS_STRIPES = 64
+ENGINE_COUNTERS_MAX_RULES = 1024
+
+# Write per-rule RuleMetrics rows on every evaluation; with shared counters enabled
+# this can be turned off to keep the hot path free of metrics queries
+RULE_METRICS_PERSIST = os.environ.get('RULE_METRICS_PERSIST', '1') == '1'
+
+# Per-minute rule metrics history (RuleMetricsBucket): the engine batches counts in memory
+# and writes them every RULE_METRICS_FLUSH_SECONDS; `manage.py downsample_rule_metrics`
+# (cron, e.g. every 10 minutes) rolls minutes into hours and hours into days and applies
+# the retention below. Queried via /rules/metrics/?from=...&to=...
+RULE_METRICS_HISTORY = os.environ.get('RULE_METRICS_HISTORY', '1') == '1'
+RULE_METRICS_FLUSH_SECONDS = 10
+RULE_METRICS_MINUTE_RETENTION_HOURS = 48
+RULE_METRICS_HOUR_RETENTION_DAYS = 90
+RULE_METRICS_DAY_RETENTION_DAYS = 730
+
+# Opt-in profiling of evaluate requests (apps/rules/profiling.py): phase timings plus
+# folded stack samples written to RULE_PROFILE_DIR. Triggered by the X-Rule-Profile
+# header (must equal RULE_PROFILE_TOKEN; empty token disables it), by a sample rate,
+# or by the staff toggle at /rules/profiling/
+RULE_PROFILE_DIR = os.environ.get('RULE_PROFILE_DIR', str(BASE_DIR / 'var' / 'profiles'))
+RULE_PROFILE_TOKEN = os.environ.get('RULE_PROFILE_TOKEN', '')
+RULE_PROFILE_SAMPLE_RATE = float(os.environ.get('RULE_PROFILE_SAMPLE_RATE', 0))
+RULE_PROFILE_INTERVAL_MS = 1
+RULE_PROFILE_MAX_FILES = 500
+RULE_PROFILE_MAX_TOGGLE_SECONDS = 3600
+
+# Alert retention: `manage.py compact_alerts` moves alerts older than ALERT_RETENTION_DAYS
+# into compressed per-day segments under ALERT_ARCHIVE_DIR (read by /rules/alerts/lookup/)
+ALERT_ARCHIVE_DIR = os.environ.get('ALERT_ARCHIVE_DIR', str(BASE_DIR / 'var' / 'alert-archive'))
+ALERT_RETENTION_DAYS = int(os.environ.get('ALERT_RETENTION_DAYS', 90))
+ALERT_ARCHIVE_SEGMENT_SIZE = 50000
+ALERT_ARCHIVE_BLOCK_SIZE = 500
+# Parsed segment indexes kept per process (about one per day once compacted)
+ALERT_ARCHIVE_CACHED_INDEXES = 64
+# Shards of the transaction_id -> days index written by compaction
+ALERT_ARCHIVE_INDEX_SHARDS = 256
+
+# Admin on large tables (backend/large_tables.py): unfiltered changelists of tables larger
+# than ADMIN_EXACT_COUNT_LIMIT show planner-estimated counts, filtered ones are counted up
+# to the limit; related-object list filters offer at most ADMIN_FILTER_MAX_CHOICES choices
+ADMIN_EXACT_COUNT_LIMIT = 10000
+ADMIN_FILTER_MAX_CHOICES = 100
+
+# Alert suppression (Rule.suppression_window): open aggregates kept per process and
+# how often their folded hit counts are written to the alerts table
+ALERT_SUPPRESSION_MAX_KEYS = 10000
+ALERT_SUPPRESSION_FLUSH_SECONDS = 5
+
+# Alert stream: each serving process polls the alerts table into a replay buffer
+# (alerts younger than ALERT_STREAM_SETTLE_SECONDS wait for slower commits). Serve the
+# stream from backend.asgi: under WSGI every open stream holds a worker thread
+ALERT_STREAM_BUFFER_SIZE = 1000
+ALERT_STREAM_POLL_SECONDS = 0.5
+ALERT_STREAM_SETTLE_SECONDS = 1.0
+ALERT_STREAM_HEARTBEAT_SECONDS = 15
+ALERT_STREAM_MAX_SECONDS = 300
+
+
+# Notifications
+# Alerts are coalesced per recipient/rule/window into digests and delivered by a worker pool.
+# Route keys: recipient, channel (webhook/email/log/memory), url or email,
+# optional min_severity and rule_ids
+
+NOTIFICATION_ROUTES = [
+    {'recipient': 'ops-log', 'channel': 'log', 'min_severity': 'medium'},
+]
+if os.environ.get('NOTIFICATION_WEBHOOK_URL'):
+    NOTIFICATION_ROUTES.append({
+        'recipient': 'webhook',
+        'channel': 'webhook',
+        'url': os.environ['NOTIFICATION_WEBHOOK_URL'],
+        'min_severity': 'medium',
+    })
+
+NOTIFICATION_WINDOW_SECONDS = 60
+NOTIFICATION_QUEUE_SIZE = 10000
+NOTIFICATION_WORKERS = 4
+NOTIFICATION_MAX_RETRIES = 3
+NOTIFICATION_RETRY_BACKOFF_SECONDS = 1.0
+# Sends per second per channel
+NOTIFICATION_RATE_LIMITS = {'webhook': 20, 'email': 1}
@@ -20,4 +20,6 @@ from django.urls import path, include
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('fraud/', include('apps.fraud_detection.urls')),
+    path('rules/', include('apps.rules.urls')),
+    path('transactions/', include('apps.transactions.urls')),
 ]
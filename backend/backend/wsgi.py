@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Deserialize the rule snapshot once; with `gunicorn --preload` this runs in
+# the master and forked workers share it
+from apps.rules.rules_engine import preload_rule_engine  # noqa: E402
+
+preload_rule_engine()